@@ -1,37 +1,72 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, g, abort
 from flask_cors import CORS
-import numpy as np
-import pandas as pd
 import os
-from src.stroke.predict_pipeline import PredictPipeline as StrokePredictPipeline, CustomData as StrokeCustomData
-from src.diabetes.predict_pipeline import PredictPipeline as DiabetesPredictPipeline, CustomData as DiabetesCustomData
-from src.diseases_and_symptoms.predict_pipeline import PredictPipeline as DiseasePredictPipeline
+import time
+from src.exception import ValidationError
+from src.logger import start_request, finish_request
+from src import metrics
+from src.profiling import stage, start_timing, finish_timing, server_timing_header, sampled_profiler, profiling_config, admin_authorized
+from src import prediction_service
+from src.prediction_cache import prediction_cache
 
 app = Flask(__name__)
 CORS(app)
 
+# Binds a request id (X-Request-ID or a new one) and the endpoint to the
+# request's log records, LOG_MODE=queue logs one JSON line per request.
+# Request counts, errors and latency go to /metrics, the stage timings of the
+# request to its Server-Timing header
+@app.before_request
+def bind_request_context():
+    metrics.request_started()
+    g.log_context = start_request(request.path, request.headers.get("X-Request-ID"))
+    start_timing()
+    g.profile = sampled_profiler.start()
+
+@app.after_request
+def log_request(response):
+    context = g.get("log_context")
+    if context is not None:
+        # routes are labelled by their rule, unknown paths share one label
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        if g.get("profile") is not None:
+            sampled_profiler.stop(g.pop("profile"), endpoint)
+        elapsed = time.perf_counter() - context["started"]
+        response.headers["X-Request-ID"] = context["request_id"]
+        timings = finish_timing()
+        if timings is not None:
+            response.headers["Server-Timing"] = server_timing_header(timings, elapsed)
+        metrics.request_finished(endpoint, request.method, response.status_code, elapsed)
+    finish_request(response.status_code)
+    return response
+
+@app.teardown_request
+def release_profile(error):
+    # a request that never reached log_request must not keep the profiler busy
+    profile = g.pop("profile", None)
+    if profile is not None:
+        sampled_profiler.stop(profile, request.url_rule.rule if request.url_rule else "unmatched")
+
+def read_json():
+    # malformed bodies are the client's error, 400 like the ASGI app, whatever the content type
+    data = request.get_json(force=True, silent=True)
+    if data is None:
+        raise ValidationError("Invalid JSON")
+    return data
+
+def jsonify_timed(payload):
+    with stage("serialize"):
+        return jsonify(payload)
+
 # Route for predicting stroke
 @app.route('/predict-stroke', methods=['POST'])
 def predict_stroke():
     try:
-        data = request.get_json()
-
-        # Validate input data
-        required_fields = [
-            "gender", "age", "hypertension", "heart_disease", 
-            "ever_married", "work_type", "Residence_type", 
-            "avg_glucose_level", "bmi", "smoking_status"
-        ]
-        for field in required_fields:
-            if field not in data:
-                return jsonify({"error": f"Missing field: {field}"}), 400
-        
-        custom_data = StrokeCustomData(**data)
-        input_df = custom_data.get_data_as_data_frame()
-        pipe = StrokePredictPipeline()
-        preds = pipe.predict(input_df)
-
-        return jsonify({"prediction": "Stroke" if preds[0] == 1 else "No Stroke"})
+        with stage("parse"):
+            data = read_json()
+        return jsonify_timed(prediction_service.predict_stroke(data))
+    except ValidationError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         app.logger.error(f"Error in /predict-stroke: {str(e)}")
         return jsonify({"error": "Internal Server Error"}), 500
@@ -43,23 +78,11 @@ def predict_stroke():
 @app.route('/predict-diabetes', methods=['POST'])
 def predict_diabetes():
     try:
-        data = request.get_json()
-
-        # Validate input data
-        required_fields = [
-            "Pregnancies", "Glucose", "BloodPressure", "SkinThickness",
-            "Insulin", "BMI", "DiabetesPedigreeFunction", "Age"
-        ]
-        for field in required_fields:
-            if field not in data:
-                return jsonify({"error": f"Missing field: {field}"}), 400
-            
-        custom_data = DiabetesCustomData(**data)
-        input_df = custom_data.get_data_as_data_frame()
-        pipe = DiabetesPredictPipeline()
-        preds = pipe.predict(input_df)
-
-        return jsonify({"prediction": preds.tolist()})
+        with stage("parse"):
+            data = read_json()
+        return jsonify_timed(prediction_service.predict_diabetes(data))
+    except ValidationError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -67,25 +90,103 @@ def predict_diabetes():
 @app.route('/predict-disease-using-symptoms', methods=['POST'])
 def predict_disease():
     try:
-        data = request.get_json()
-
-        # Validate input data
-        if 'symptoms' not in data:
-            return jsonify({"error": "Missing field: symptoms"}), 400
-        
-        symptoms_list = data['symptoms']
+        with stage("parse"):
+            data = read_json()
+        return jsonify_timed(prediction_service.predict_disease(data))
+    except ValidationError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        # Validate the number of symptoms
-        if not isinstance(symptoms_list, list) or len(symptoms_list) < 3 or len(symptoms_list) > 5:
-            return jsonify({"error": "Provide between 3 and 5 symptoms."}), 400
+# Batch routes take a JSON array of records (or {"records": [...]}) and answer
+# with one result or error per record, in request order
+@app.route('/predict-stroke/batch', methods=['POST'])
+def predict_stroke_batch():
+    try:
+        with stage("parse"):
+            data = read_json()
+        return jsonify_timed(prediction_service.predict_stroke_batch(data))
+    except ValidationError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        app.logger.error(f"Error in /predict-stroke/batch: {str(e)}")
+        return jsonify({"error": "Internal Server Error"}), 500
 
-        pipe = DiseasePredictPipeline()
-        predicted_disease = pipe.predict(symptoms_list)
+@app.route('/predict-diabetes/batch', methods=['POST'])
+def predict_diabetes_batch():
+    try:
+        with stage("parse"):
+            data = read_json()
+        return jsonify_timed(prediction_service.predict_diabetes_batch(data))
+    except ValidationError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        return jsonify({"prediction": predicted_disease})
+@app.route('/predict-disease-using-symptoms/batch', methods=['POST'])
+def predict_disease_batch():
+    try:
+        with stage("parse"):
+            data = read_json()
+        return jsonify_timed(prediction_service.predict_disease_batch(data))
+    except ValidationError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# Hit/miss counters of the prediction cache
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(prediction_cache.stats())
+
+# Batch sizes and inline fallbacks of the micro batchers, empty unless MICRO_BATCHING=1
+@app.route('/micro-batching/stats', methods=['GET'])
+def micro_batching_stats():
+    return jsonify(prediction_service.micro_batching_stats())
+
+# Request, error, latency, batch size and model load metrics in the Prometheus text format
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+# Admin switch for sampled request profiling, needs ADMIN_TOKEN in the
+# X-Admin-Token header. It reaches the worker serving the call only.
+# POST {"enabled": true, "sample_rate": 0.05, "dump_every": 100}
+@app.route('/admin/profiling', methods=['GET', 'POST'])
+def admin_profiling():
+    _require_admin()
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        try:
+            sampled_profiler.configure(data.get("enabled", True), data.get("sample_rate"), data.get("dump_every"))
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": str(e)}), 400
+    return jsonify(sampled_profiler.status())
+
+# Writes the aggregated profiles (one pstats file per endpoint) to disk now
+@app.route('/admin/profiling/dump', methods=['POST'])
+def admin_profiling_dump():
+    _require_admin()
+    return jsonify({"paths": sampled_profiler.dump()})
+
+def _require_admin():
+    # without a configured token the admin routes do not exist
+    if not profiling_config.admin_token:
+        abort(404)
+    if not admin_authorized(request.headers.get("X-Admin-Token")):
+        abort(403)
+
+# Liveness: the worker is up and answering
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    return jsonify({"status": "ok"})
+
+# Readiness: every model is loaded, with the load status of each model
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    ready, models = prediction_service.readiness()
+    return jsonify({"status": "ready" if ready else "loading", "models": models}), 200 if ready else 503
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))  # Render provides a port
     app.run(host="0.0.0.0", port=port)
\ No newline at end of file
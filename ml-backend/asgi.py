@@ -0,0 +1,326 @@
+'''
+ASGI entry point exposing the routes and JSON contracts of app.py.
+
+    uvicorn asgi:app --host 0.0.0.0 --port $PORT
+    gunicorn -k uvicorn.workers.UvicornWorker asgi:app
+
+Reading the body, JSON parsing and validation run on the event loop. The
+model calls (and encoding of the response) run on a bounded thread pool, so
+slow clients and slow predictions no longer hold a whole worker. Once
+ASGI_MAX_PENDING predictions are queued or running, further requests are
+answered with 503 instead of piling up. app.py stays the WSGI entry point.
+'''
+import os
+import sys
+import json
+import time
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from src.exception import CustomException, ValidationError
+from src.logger import logging, request_context, start_request, finish_request
+from src import prediction_service
+from src import metrics
+from src.profiling import stage, stage_timings, start_timing, finish_timing, server_timing_header, sampled_profiler, profiling_config, admin_authorized
+from src.prediction_cache import prediction_cache
+
+@dataclass
+class AsgiConfig:
+    # threads running sklearn predict calls
+    inference_threads: int = int(os.environ.get("ASGI_INFERENCE_THREADS", min(4, os.cpu_count() or 1)))
+    # predictions queued or running before requests are rejected with 503
+    max_pending: int = int(os.environ.get("ASGI_MAX_PENDING", 256))
+    max_body_bytes: int = int(os.environ.get("ASGI_MAX_BODY_BYTES", 32 * 1024 * 1024))
+
+
+class Route:
+    '''
+    validate(data) runs on the event loop, predict(validated) on the thread pool.
+    Like app.py, stroke routes hide the message of unexpected errors.
+    '''
+    def __init__(self, validate, predict, hide_errors=False):
+        self.validate = validate
+        self.predict = predict
+        self.hide_errors = hide_errors
+
+
+ROUTES = {
+    "/predict-stroke": Route(
+        prediction_service.validate_stroke_record, prediction_service.predict_stroke_record, hide_errors=True
+    ),
+    "/predict-diabetes": Route(
+        prediction_service.validate_diabetes_record, prediction_service.predict_diabetes_record
+    ),
+    "/predict-disease-using-symptoms": Route(
+        prediction_service.validate_disease_request, prediction_service.predict_disease_request
+    ),
+    "/predict-stroke/batch": Route(
+        prediction_service.validate_stroke_batch, prediction_service.predict_stroke_validated_batch, hide_errors=True
+    ),
+    "/predict-diabetes/batch": Route(
+        prediction_service.validate_diabetes_batch, prediction_service.predict_diabetes_validated_batch
+    ),
+    "/predict-disease-using-symptoms/batch": Route(
+        prediction_service.validate_disease_batch, prediction_service.predict_disease_validated_batch
+    ),
+}
+
+# admin routes and their methods, see ASGIApp._admin
+ADMIN_ROUTES = {
+    "/admin/profiling": ("GET", "POST"),
+    "/admin/profiling/dump": ("POST",),
+}
+
+def healthz():
+    return 200, {"status": "ok"}
+
+def readyz():
+    ready, models = prediction_service.readiness()
+    return (200 if ready else 503), {"status": "ready" if ready else "loading", "models": models}
+
+# GET routes, each returns (status, payload) or (status, body, content type)
+# for a body that is not JSON
+GET_ROUTES = {
+    "/cache/stats": lambda: (200, prediction_cache.stats()),
+    "/micro-batching/stats": lambda: (200, prediction_service.micro_batching_stats()),
+    "/metrics": lambda: (200, metrics.metrics.render().encode(), metrics.CONTENT_TYPE),
+    "/healthz": healthz,
+    "/readyz": readyz,
+}
+
+
+def _json_default(obj):
+    # numpy scalars and arrays
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def encode_json(obj):
+    # same bytes as flask.jsonify outside debug mode
+    return (json.dumps(obj, sort_keys=True, separators=(",", ":"), default=_json_default) + "\n").encode()
+
+
+class ASGIApp:
+    def __init__(self):
+        self.asgi_config = AsgiConfig()
+        self._executor = None
+        self._pending = 0
+
+    @property
+    def executor(self):
+        # created lazily, threads do not survive a fork of a preloaded master
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=max(1, self.asgi_config.inference_threads), thread_name_prefix="inference"
+            )
+        return self._executor
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    await asyncio.get_running_loop().run_in_executor(self.executor, prediction_service.warmup)
+                    await send({"type": "lifespan.startup.complete"})
+                except Exception as e:
+                    logging.error(f"ASGI startup failed: {e}")
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+            elif message["type"] == "lifespan.shutdown":
+                if self._executor is not None:
+                    self._executor.shutdown(wait=True)
+                    self._executor = None
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _http(self, scope, receive, send):
+        path = scope["path"].rstrip("/") or "/"
+        method = scope["method"]
+        request_id = dict(scope.get("headers") or []).get(b"x-request-id")
+        context = start_request(path, request_id.decode("latin-1") if request_id else None)
+        route = ROUTES.get(path)
+        get_route = GET_ROUTES.get(path)
+        metrics.request_started()
+        context["route"] = path if route is not None or get_route is not None or path in ADMIN_ROUTES else "unmatched"
+        context["method"] = method
+        start_timing()
+
+        if path in ADMIN_ROUTES:
+            await self._admin(scope, receive, send, path, method)
+            return
+
+        if route is None and get_route is None:
+            await self._respond(send, 404, encode_json({"error": "Not Found"}))
+            return
+        if method == "OPTIONS":
+            await self._preflight(scope, send, "POST, OPTIONS" if route else "GET, OPTIONS")
+            return
+        if get_route is not None:
+            if method != "GET":
+                await self._respond(send, 405, encode_json({"error": "Method Not Allowed"}))
+                return
+            response = get_route()
+            if len(response) == 3:
+                status, body, content_type = response
+                await self._respond(send, status, body, content_type.encode())
+            else:
+                status, payload = response
+                await self._respond(send, status, encode_json(payload))
+            return
+        if method != "POST":
+            await self._respond(send, 405, encode_json({"error": "Method Not Allowed"}))
+            return
+
+        body = await self._read_body(receive)
+        if body is None:
+            await self._respond(send, 413, encode_json({"error": "Request body too large"}))
+            return
+
+        try:
+            with stage("parse"):
+                data = json.loads(body)
+        except ValueError:
+            await self._respond(send, 400, encode_json({"error": "Invalid JSON"}))
+            return
+
+        try:
+            with stage("validate"):
+                validated = route.validate(data)
+        except ValidationError as e:
+            await self._respond(send, 400, encode_json({"error": str(e)}))
+            return
+
+        if self._pending >= self.asgi_config.max_pending:
+            await self._respond(send, 503, encode_json({"error": "Server busy, retry later"}))
+            return
+
+        self._pending += 1
+        try:
+            # the request context travels with the call, the worker thread
+            # logs with the request id and records the model version
+            status, payload = await asyncio.get_running_loop().run_in_executor(
+                self.executor, contextvars.copy_context().run, self._predict, route, path, validated
+            )
+        finally:
+            self._pending -= 1
+        await self._respond(send, status, payload)
+
+    @staticmethod
+    def _predict(route, path, validated):
+        # sampled in the inference thread, cProfile only sees its own thread
+        profile = sampled_profiler.start()
+        try:
+            result = route.predict(validated)
+            with stage("serialize"):
+                return 200, encode_json(result)
+        except Exception as e:
+            logging.error("Error in %s: %s", path, CustomException(e, sys))
+            message = "Internal Server Error" if route.hide_errors else str(e)
+            return 500, encode_json({"error": message})
+        finally:
+            if profile is not None:
+                sampled_profiler.stop(profile, path)
+
+    async def _admin(self, scope, receive, send, path, method):
+        # same contract as the admin routes of app.py
+        token = dict(scope.get("headers") or []).get(b"x-admin-token")
+        if not profiling_config.admin_token:
+            await self._respond(send, 404, encode_json({"error": "Not Found"}))
+            return
+        if not admin_authorized(token.decode("latin-1") if token else None):
+            await self._respond(send, 403, encode_json({"error": "Forbidden"}))
+            return
+        if method not in ADMIN_ROUTES[path]:
+            await self._respond(send, 405, encode_json({"error": "Method Not Allowed"}))
+            return
+
+        if path == "/admin/profiling/dump":
+            paths = await asyncio.get_running_loop().run_in_executor(self.executor, sampled_profiler.dump)
+            await self._respond(send, 200, encode_json({"paths": paths}))
+            return
+        if method == "POST":
+            try:
+                data = json.loads(await self._read_body(receive) or b"{}")
+                if not isinstance(data, dict):
+                    data = {}
+                sampled_profiler.configure(data.get("enabled", True), data.get("sample_rate"), data.get("dump_every"))
+            except (TypeError, ValueError) as e:
+                await self._respond(send, 400, encode_json({"error": str(e)}))
+                return
+        await self._respond(send, 200, encode_json(sampled_profiler.status()))
+
+    async def _read_body(self, receive):
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                break
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > self.asgi_config.max_body_bytes:
+                return None
+            chunks.append(chunk)
+            if not message.get("more_body", False):
+                break
+        return b"".join(chunks)
+
+    @staticmethod
+    def _finish(status):
+        context = request_context.get()
+        if context is not None:
+            metrics.request_finished(context["route"], context["method"], status, time.perf_counter() - context["started"])
+        finish_timing()
+        finish_request(status)
+
+    @staticmethod
+    def _response_headers():
+        context = request_context.get()
+        if context is None:
+            return []
+        headers = [(b"x-request-id", context["request_id"].encode("latin-1"))]
+        timings = stage_timings.get()
+        if timings is not None:
+            header = server_timing_header(timings, time.perf_counter() - context["started"])
+            headers.append((b"server-timing", header.encode("latin-1")))
+        return headers
+
+    @staticmethod
+    async def _respond(send, status, payload, content_type=b"application/json"):
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", content_type),
+                (b"content-length", str(len(payload)).encode()),
+                (b"access-control-allow-origin", b"*"),
+            ] + ASGIApp._response_headers(),
+        })
+        ASGIApp._finish(status)
+        await send({"type": "http.response.body", "body": payload})
+
+    @staticmethod
+    async def _preflight(scope, send, methods):
+        # CORS preflight, the same permissive policy as flask_cors in app.py
+        request_headers = dict(scope.get("headers") or [])
+        headers = [
+            (b"access-control-allow-origin", request_headers.get(b"origin", b"*")),
+            (b"access-control-allow-methods", b"DELETE, GET, HEAD, OPTIONS, PATCH, POST, PUT"),
+            (b"allow", methods.encode()),
+            (b"vary", b"Origin"),
+            (b"content-length", b"0"),
+        ] + ASGIApp._response_headers()
+        if b"access-control-request-headers" in request_headers:
+            headers.append((b"access-control-allow-headers", request_headers[b"access-control-request-headers"]))
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        ASGIApp._finish(200)
+        await send({"type": "http.response.body", "body": b""})
+
+
+app = ASGIApp()
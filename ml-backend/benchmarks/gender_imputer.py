@@ -0,0 +1,89 @@
+'''
+Rows/second of GenderBasedImputer.transform against the previous row-wise
+implementation. Run from ml-backend/:
+
+    python -m benchmarks.gender_imputer
+    python -m benchmarks.gender_imputer --sizes 10000 1000000 10000000 --legacy-max-rows 10000000
+
+The row-wise version needs minutes per million rows, so by default it is only
+timed up to --legacy-max-rows.
+'''
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from src.stroke.data_transformation import GenderBasedImputer
+
+
+class LegacyGenderBasedImputer(GenderBasedImputer):
+    '''
+    The apply(axis=1) implementation GenderBasedImputer.transform replaced.
+    '''
+    def transform(self, X):
+        X['bmi'] = X.apply(lambda row: self._fill_bmi(row), axis=1)
+        return X[['bmi']].values
+
+    def _fill_bmi(self, row):
+        gender = row.get('gender', None)
+        if pd.isnull(row['bmi']):
+            if gender == 'Male':
+                return self.avg_bmi_male
+            elif gender == 'Female':
+                return self.avg_bmi_female
+            else:
+                return self.avg_bmi_overall
+        return row['bmi']
+
+
+def make_frame(n_rows, seed=42, missing_rate=0.04):
+    rng = np.random.default_rng(seed)
+    bmi = rng.normal(28.9, 7.8, n_rows).round(1)
+    bmi[rng.random(n_rows) < missing_rate] = np.nan
+    return pd.DataFrame({
+        'bmi': bmi,
+        'gender': rng.choice(['Male', 'Female', 'Other'], n_rows, p=[0.41, 0.589, 0.001]),
+    })
+
+
+def time_transform(imputer, X, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        frame = X.copy()
+        start = time.perf_counter()
+        out = imputer.transform(frame)
+        best = min(best, time.perf_counter() - start)
+    return best, out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 1_000_000, 10_000_000])
+    parser.add_argument('--legacy-max-rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    fit_frame = make_frame(50_000, seed=0)
+    imputer = GenderBasedImputer().fit(fit_frame)
+    legacy = LegacyGenderBasedImputer().fit(fit_frame)
+
+    print(f"{'rows':>12} {'vectorized rows/s':>18} {'row-wise rows/s':>16} {'speedup':>9}  identical")
+    for n_rows in args.sizes:
+        X = make_frame(n_rows)
+
+        before = X.copy()
+        seconds, out = time_transform(imputer, X, args.repeat)
+        imputer.transform(X)
+        assert X.equals(before), "GenderBasedImputer.transform mutated its input"
+
+        row = f"{n_rows:>12,} {n_rows / seconds:>18,.0f}"
+        if n_rows <= args.legacy_max_rows:
+            legacy_seconds, legacy_out = time_transform(legacy, X, 1)
+            identical = np.array_equal(out, legacy_out.astype(np.float64), equal_nan=True)
+            row += f" {n_rows / legacy_seconds:>16,.0f} {legacy_seconds / seconds:>8,.0f}x  {identical}"
+        else:
+            row += f" {'skipped':>16} {'-':>9}  -"
+        print(row)
+
+
+if __name__ == '__main__':
+    main()
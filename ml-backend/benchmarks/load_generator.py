@@ -0,0 +1,417 @@
+'''
+Closed-loop load test of the prediction API. Run from ml-backend/:
+
+    python -m benchmarks.load_generator                               # gunicorn, gunicorn.conf.py defaults
+    python -m benchmarks.load_generator --workers 4 --worker-class gthread --threads 4
+    python -m benchmarks.load_generator --target uvicorn --workers 2  # asgi.py
+    python -m benchmarks.load_generator --target testclient           # in process, no HTTP
+    python -m benchmarks.load_generator --target url --url http://host:5000
+    python -m benchmarks.load_generator --concurrency 1 4 16 64 --step-seconds 20 --slo-ms 250 --report report.json
+
+At every --concurrency level, that many virtual users each send a request,
+wait for the answer and send the next one, for --step-seconds after a short
+warmup. Requests follow --mix over the three endpoints plus invalid payloads
+(answered with 400, which counts as success for them). Payloads come from
+benchmarks/payloads.py, a pool large enough that the prediction cache rarely
+hits unless --pool-size is small.
+
+Per step: throughput, p50/p95/p99 latency and the error rate (transport
+errors, 5xx, and valid requests answered with anything but 200). The knee is
+the lowest concurrency reaching --knee-fraction of the best throughput, more
+users past it only queue. With --slo-ms the report also holds the highest
+step whose p99 meets the SLO.
+
+The HTTP client is a minimal HTTP/1.1 client on asyncio streams with
+keep-alive, so the load generator itself stays cheap.
+'''
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import signal
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENDPOINTS = {
+    "stroke": "/predict-stroke",
+    "diabetes": "/predict-diabetes",
+    "disease": "/predict-disease-using-symptoms",
+}
+
+
+# Request mix
+
+def parse_mix(text):
+    '''
+    "stroke=4,diabetes=3,disease=2,invalid=1" -> {"stroke": 4.0, ...}
+    '''
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS and name != "invalid":
+            raise ValueError(f"Unknown mix entry '{name}'")
+        mix[name] = float(weight or 1)
+    return mix
+
+def invalid_requests():
+    # (path, body bytes): every one of them has to be answered with a 400
+    return [
+        (ENDPOINTS["stroke"], json.dumps({"gender": "Male", "age": "old"}).encode()),
+        (ENDPOINTS["diabetes"], json.dumps({"Glucose": 148}).encode()),
+        (ENDPOINTS["disease"], json.dumps({"symptoms": ["cough"]}).encode()),
+        (ENDPOINTS["disease"], json.dumps({"symptoms": "cough, fever, headache"}).encode()),
+        (ENDPOINTS["diabetes"], b"{not json"),
+    ]
+
+class RequestMix:
+    def __init__(self, mix, pool_size, seed):
+        from benchmarks.payloads import PayloadFactory
+        factory = PayloadFactory(seed=seed)
+        model_names = {"stroke": "stroke", "diabetes": "diabetes", "disease": "diseases_and_symptoms"}
+        self.pools = {
+            name: [(ENDPOINTS[name], json.dumps(payload).encode()) for payload in factory.payloads(model_names[name], pool_size)]
+            for name in mix if name != "invalid"
+        }
+        if "invalid" in mix:
+            self.pools["invalid"] = invalid_requests()
+        self.names = list(mix)
+        self.weights = [mix[name] for name in self.names]
+        self.rng = random.Random(seed)
+
+    def next(self):
+        '''
+        Returns (kind, path, body).
+        '''
+        kind = self.rng.choices(self.names, self.weights)[0]
+        path, body = self.rng.choice(self.pools[kind])
+        return kind, path, body
+
+
+# Minimal HTTP/1.1 client
+
+class HttpConnection:
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method, path, body=b""):
+        '''
+        Returns (status, body), reconnecting when the server closed the
+        connection (e.g. gunicorn sync workers answer with Connection: close).
+        '''
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        head = (
+            f"{method} {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n"
+        ).encode()
+        self.writer.write(head + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("Connection closed before the response")
+        status = int(status_line.split()[1])
+        length = 0
+        close = False
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            name = name.strip().lower()
+            if name == "content-length":
+                length = int(value)
+            elif name == "connection" and value.strip().lower() == "close":
+                close = True
+        payload = await self.reader.readexactly(length) if length else b""
+        if close:
+            await self.close()
+        return status, payload
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+        self.reader = self.writer = None
+
+
+class HttpTarget:
+    def __init__(self, url):
+        address = url.split("://", 1)[-1].rstrip("/")
+        host, _, port = address.partition(":")
+        self.host = host
+        self.port = int(port or 80)
+
+    def connection(self):
+        return HttpConnection(self.host, self.port)
+
+
+class TestClientConnection:
+    '''
+    Same interface as HttpConnection, answered in process by the Flask test
+    client on a thread pool (one client per thread).
+    '''
+    def __init__(self, target):
+        self.target = target
+
+    async def request(self, method, path, body=b""):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.target.executor, self.target.call, method, path, body)
+
+    async def close(self):
+        pass
+
+class TestClientTarget:
+    def __init__(self, max_threads):
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+        import app
+        self.app = app.app
+        self.local = threading.local()
+        self.executor = ThreadPoolExecutor(max_workers=max_threads)
+
+    def call(self, method, path, body):
+        client = getattr(self.local, "client", None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+        response = client.open(path, method=method, data=body, content_type="application/json")
+        return response.status_code, response.get_data()
+
+    def connection(self):
+        return TestClientConnection(self)
+
+
+# Server processes
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_server(args, port):
+    if args.target == "gunicorn":
+        command = [
+            sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app",
+            "--bind", f"127.0.0.1:{port}", "--worker-class", args.worker_class,
+        ]
+        if args.workers:
+            command += ["--workers", str(args.workers)]
+        if args.threads:
+            command += ["--threads", str(args.threads)]
+    else:
+        command = [sys.executable, "-m", "uvicorn", "asgi:app", "--host", "127.0.0.1", "--port", str(port),
+                   "--log-level", "warning"]
+        if args.workers:
+            command += ["--workers", str(args.workers)]
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [BACKEND_DIR, env.get("PYTHONPATH")]))
+    return subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL)
+
+async def wait_ready(target, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        connection = target.connection()
+        try:
+            status, _ = await connection.request("GET", "/readyz")
+            if status == 200:
+                return
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            await connection.close()
+        await asyncio.sleep(0.25)
+    raise TimeoutError(f"Server not ready after {timeout}s")
+
+def stop_server(process):
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+# Load steps
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+async def run_step(target, mix, concurrency, step_seconds, warmup_seconds):
+    '''
+    Closed loop: every user sends its next request once the last one was
+    answered. Only requests started after the warmup are recorded.
+    '''
+    started = time.perf_counter()
+    record_from = started + warmup_seconds
+    stop_at = record_from + step_seconds
+    latencies = []
+    counts = {"requests": 0, "errors": 0, "invalid_rejected": 0}
+    statuses = {}
+
+    async def user():
+        connection = target.connection()
+        try:
+            while True:
+                begin = time.perf_counter()
+                if begin >= stop_at:
+                    return
+                kind, path, body = mix.next()
+                try:
+                    status, _ = await connection.request("POST", path, body)
+                except (ConnectionError, OSError, asyncio.IncompleteReadError, ValueError):
+                    status = None
+                    await connection.close()
+                elapsed = time.perf_counter() - begin
+                if begin < record_from:
+                    continue
+
+                counts["requests"] += 1
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+                ok = status == 400 if kind == "invalid" else status == 200
+                if kind == "invalid" and ok:
+                    counts["invalid_rejected"] += 1
+                if not ok:
+                    counts["errors"] += 1
+                latencies.append(elapsed)
+        finally:
+            await connection.close()
+
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    latencies.sort()
+    to_ms = lambda seconds: None if seconds is None else round(seconds * 1000, 3)
+    return {
+        "concurrency": concurrency,
+        "requests": counts["requests"],
+        "throughput": round(counts["requests"] / step_seconds, 2),
+        "error_rate": round(counts["errors"] / counts["requests"], 5) if counts["requests"] else None,
+        "errors": counts["errors"],
+        "invalid_rejected": counts["invalid_rejected"],
+        "statuses": statuses,
+        "p50_ms": to_ms(percentile(latencies, 0.50)),
+        "p95_ms": to_ms(percentile(latencies, 0.95)),
+        "p99_ms": to_ms(percentile(latencies, 0.99)),
+        "max_ms": to_ms(latencies[-1] if latencies else None),
+    }
+
+
+def summarize(steps, knee_fraction, slo_ms):
+    best = max(steps, key=lambda step: step["throughput"])
+    knee = next(step for step in steps if step["throughput"] >= knee_fraction * best["throughput"])
+    summary = {
+        "saturation_throughput": best["throughput"],
+        "saturation_concurrency": best["concurrency"],
+        "knee_concurrency": knee["concurrency"],
+        "knee_throughput": knee["throughput"],
+        "knee_p99_ms": knee["p99_ms"],
+    }
+    if slo_ms is not None:
+        within = [step for step in steps if step["p99_ms"] is not None and step["p99_ms"] <= slo_ms]
+        top = max(within, key=lambda step: step["throughput"]) if within else None
+        summary["slo_p99_ms"] = slo_ms
+        summary["slo_concurrency"] = top["concurrency"] if top else None
+        summary["slo_throughput"] = top["throughput"] if top else 0.0
+    return summary
+
+
+async def main_async(args):
+    mix = RequestMix(parse_mix(args.mix), args.pool_size, args.seed)
+
+    process = None
+    if args.target == "testclient":
+        target = TestClientTarget(max(args.concurrency))
+    elif args.target == "url":
+        target = HttpTarget(args.url)
+    else:
+        port = args.port or free_port()
+        process = start_server(args, port)
+        target = HttpTarget(f"http://127.0.0.1:{port}")
+
+    try:
+        if args.target != "testclient":
+            await wait_ready(target, args.ready_timeout)
+        steps = []
+        print(f"{'users':>6} {'req/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>8}")
+        for concurrency in args.concurrency:
+            step = await run_step(target, mix, concurrency, args.step_seconds, args.warmup_seconds)
+            steps.append(step)
+            print(f"{concurrency:>6} {step['throughput']:>10,.1f} {step['p50_ms'] or 0:>9.2f} "
+                  f"{step['p95_ms'] or 0:>9.2f} {step['p99_ms'] or 0:>9.2f} {step['error_rate'] or 0:>8.2%}")
+    finally:
+        if process is not None:
+            stop_server(process)
+
+    summary = summarize(steps, args.knee_fraction, args.slo_ms)
+    print(f"knee at {summary['knee_concurrency']} users, {summary['knee_throughput']:,.1f} req/s "
+          f"(saturation {summary['saturation_throughput']:,.1f} req/s at {summary['saturation_concurrency']} users)")
+    if args.slo_ms is not None:
+        print(f"p99 <= {args.slo_ms} ms up to {summary['slo_concurrency']} users, {summary['slo_throughput']:,.1f} req/s")
+
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+        },
+        "config": {
+            "target": args.target,
+            "url": args.url,
+            "workers": args.workers,
+            "worker_class": args.worker_class if args.target == "gunicorn" else None,
+            "threads": args.threads,
+            "mix": parse_mix(args.mix),
+            "pool_size": args.pool_size,
+            "step_seconds": args.step_seconds,
+            "warmup_seconds": args.warmup_seconds,
+            "seed": args.seed,
+        },
+        "steps": steps,
+        "summary": summary,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=["gunicorn", "uvicorn", "testclient", "url"], default="gunicorn")
+    parser.add_argument("--url", help="server to load with --target url")
+    parser.add_argument("--port", type=int, help="port of the started server, a free one by default")
+    parser.add_argument("--workers", type=int, help="server workers, gunicorn.conf.py / uvicorn default otherwise")
+    parser.add_argument("--worker-class", default="sync", help="gunicorn worker class")
+    parser.add_argument("--threads", type=int, help="threads per gunicorn worker (gthread)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--step-seconds", type=float, default=10.0)
+    parser.add_argument("--warmup-seconds", type=float, default=2.0)
+    parser.add_argument("--mix", default="stroke=4,diabetes=3,disease=2,invalid=1")
+    parser.add_argument("--pool-size", type=int, default=5000, help="distinct payloads per endpoint")
+    parser.add_argument("--knee-fraction", type=float, default=0.9)
+    parser.add_argument("--slo-ms", type=float, help="p99 latency objective")
+    parser.add_argument("--ready-timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--report", help="write the JSON report to this file")
+    args = parser.parse_args()
+    if args.target == "url" and not args.url:
+        parser.error("--target url needs --url")
+
+    report = asyncio.run(main_async(args))
+    if args.report:
+        with open(args.report, "w") as file_obj:
+            json.dump(report, file_obj, indent=2)
+        print(f"Wrote {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+'''
+Synthetic prediction payloads and training frames for the benchmarks, drawn
+from the schemas of the fitted artifacts:
+
+- stroke: numeric columns around the fitted scaler means and scales,
+  categories from the fitted one-hot encoder, missing BMIs
+- diabetes: every column around the fitted scaler mean and scale
+- symptoms: 3 to 5 symptoms of the model's vocabulary, training rows use
+  diseases the label encoder knows
+
+Everything is seeded, the same seed gives the same payloads.
+'''
+import numpy as np
+import pandas as pd
+from src import prediction_service
+from src.stroke.data_transformation import CompiledPreprocessor
+
+# plausible ranges, the normal draws are clipped to these
+STROKE_RANGES = {"age": (0.08, 82.0), "avg_glucose_level": (55.0, 272.0), "bmi": (10.0, 98.0)}
+DIABETES_DECIMALS = {"BMI": 1, "DiabetesPedigreeFunction": 3}
+
+
+class PayloadFactory:
+    def __init__(self, seed=0):
+        self.rng = np.random.default_rng(seed)
+
+        preprocessor = prediction_service.stroke_pipeline.bundle()["preprocessor"]
+        compiled = CompiledPreprocessor.from_preprocessor(preprocessor)
+        self.stroke_numeric = {
+            col: (float(mean), float(scale))
+            for col, mean, scale in zip(compiled.num_cols, compiled.num_mean, compiled.num_scale)
+        }
+        self.stroke_numeric["bmi"] = (compiled.bmi_mean, compiled.bmi_scale)
+        self.stroke_binary = compiled.binary_cols
+        self.stroke_categories = {
+            col: list(categories) for col, categories in zip(compiled.cat_cols, compiled.cat_categories)
+        }
+
+        scaler = prediction_service.diabetes_pipeline.bundle()["preprocessor"].named_steps["scaler"]
+        self.diabetes_numeric = {
+            col: (float(mean), float(scale))
+            for col, mean, scale in zip(prediction_service.DIABETES_FIELDS, scaler.mean_, scaler.scale_)
+        }
+
+        disease_bundle = prediction_service.disease_pipeline.bundle()
+        self.symptoms = disease_bundle["symptoms"].symptoms
+        self.diseases = disease_bundle["preprocessor"].classes_.tolist()
+
+    def _normal(self, mean, scale, low, high, size=None):
+        return np.clip(self.rng.normal(mean, scale, size), low, high)
+
+    def stroke_record(self, missing_bmi_rate=0.04):
+        record = {}
+        for col, (mean, scale) in self.stroke_numeric.items():
+            record[col] = round(float(self._normal(mean, scale, *STROKE_RANGES.get(col, (0.0, np.inf)))), 2)
+        if self.rng.random() < missing_bmi_rate:
+            record["bmi"] = None
+        for col in self.stroke_binary:
+            record[col] = int(self.rng.random() < 0.1)
+        for col, categories in self.stroke_categories.items():
+            record[col] = categories[self.rng.integers(len(categories))]
+        return record
+
+    def diabetes_record(self):
+        record = {}
+        for col, (mean, scale) in self.diabetes_numeric.items():
+            value = float(self._normal(mean, scale, 0.0, mean + 6 * scale))
+            decimals = DIABETES_DECIMALS.get(col)
+            record[col] = round(value, decimals) if decimals else int(round(value))
+        return record
+
+    def symptoms_list(self):
+        size = int(self.rng.integers(prediction_service.MIN_SYMPTOMS, prediction_service.MAX_SYMPTOMS + 1))
+        return [self.symptoms[i] for i in self.rng.choice(len(self.symptoms), size=size, replace=False)]
+
+    def disease_request(self, top_k=0):
+        payload = {"symptoms": self.symptoms_list()}
+        if top_k:
+            payload["top_k"] = top_k
+        return payload
+
+    def payloads(self, model_name, n):
+        if model_name == "stroke":
+            return [self.stroke_record() for _ in range(n)]
+        if model_name == "diabetes":
+            return [self.diabetes_record() for _ in range(n)]
+        return [self.disease_request() for _ in range(n)]
+
+    # Training frames, in the layout of the CSVs the ingestion steps write
+
+    def stroke_frame(self, n_rows, stroke_rate=0.05):
+        frame = pd.DataFrame([self.stroke_record() for _ in range(n_rows)])
+        frame.insert(0, "id", np.arange(n_rows))
+        frame["stroke"] = (self.rng.random(n_rows) < stroke_rate).astype(int)
+        return frame
+
+    def diabetes_frame(self, n_rows):
+        frame = pd.DataFrame([self.diabetes_record() for _ in range(n_rows)])
+        frame["Outcome"] = self.rng.integers(0, 2, n_rows)
+        return frame
+
+    def disease_frame(self, n_rows, n_diseases=50):
+        '''
+        Binary symptom columns and a diseases column, each disease draws its
+        symptoms from its own pool so the classes are learnable.
+        '''
+        n_symptoms = len(self.symptoms)
+        diseases = self.diseases[:n_diseases]
+        pools = [self.rng.choice(n_symptoms, size=min(12, n_symptoms), replace=False) for _ in diseases]
+        labels = self.rng.integers(len(diseases), size=n_rows)
+        X = np.zeros((n_rows, n_symptoms), dtype=np.int64)
+        for row, label in enumerate(labels):
+            X[row, self.rng.choice(pools[label], size=int(self.rng.integers(3, 6)), replace=False)] = 1
+        frame = pd.DataFrame(X, columns=self.symptoms)
+        frame.insert(0, "diseases", [diseases[label] for label in labels])
+        return frame
@@ -0,0 +1,231 @@
+'''
+Microbenchmarks of the inference and training hot paths. Run from ml-backend/:
+
+    python -m benchmarks.run_benchmarks                          # run and print
+    python -m benchmarks.run_benchmarks --output results.json    # also write JSON
+    python -m benchmarks.run_benchmarks --compare                # flag regressions
+    python -m benchmarks.run_benchmarks --write-baseline         # record a new baseline
+
+Per pipeline (stroke, diabetes, diseases_and_symptoms), with synthetic
+payloads drawn from the fitted artifacts (benchmarks/payloads.py):
+- single: latency of one validated record through the prediction service,
+  prediction cache off, as p50/p95 over --single-requests distinct records
+- batch_<n>: records/second of the batch path for each --batch-sizes n
+- transform_<rows>: rows/second of initiate_data_transformation on synthetic
+  train/test CSVs of each --transform-rows size (written to a temp dir, the
+  artifacts/ folder is not touched)
+
+Throughputs are taken from the fastest round, like timeit: slower rounds
+measure other load on the machine rather than the code.
+
+--compare reads the baseline (benchmarks/baseline.json) and exits with 1 when
+a metric is worse than the baseline by more than --threshold (relative).
+Baselines are machine specific, record one on the machine that compares. On
+a shared machine rounds vary by up to 20%, hence the default threshold of 25%.
+'''
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+MODELS = ["stroke", "diabetes", "diseases_and_symptoms"]
+
+
+def _service():
+    # the prediction cache would turn every repeated record into a dict lookup
+    from src import prediction_service
+    from src.prediction_cache import prediction_cache
+    prediction_cache.prediction_cache_config.enabled = False
+    return prediction_service
+
+def _entry_points(prediction_service, model_name):
+    # (validate one record, predict one validated record, validate a batch, predict a validated batch)
+    if model_name == "stroke":
+        return (prediction_service.validate_stroke_record, prediction_service.predict_stroke_record,
+                prediction_service.validate_stroke_batch, prediction_service.predict_stroke_validated_batch)
+    if model_name == "diabetes":
+        return (prediction_service.validate_diabetes_record, prediction_service.predict_diabetes_record,
+                prediction_service.validate_diabetes_batch, prediction_service.predict_diabetes_validated_batch)
+    return (prediction_service.validate_disease_request, prediction_service.predict_disease_request,
+            prediction_service.validate_disease_batch, prediction_service.predict_disease_validated_batch)
+
+
+def bench_single(prediction_service, factory, model_name, n_requests, warmup=20):
+    validate, predict, _, _ = _entry_points(prediction_service, model_name)
+    records = [validate(payload) for payload in factory.payloads(model_name, n_requests + warmup)]
+    for record in records[:warmup]:
+        predict(record)
+
+    latencies = []
+    for record in records[warmup:]:
+        start = time.perf_counter()
+        predict(record)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))] * 1000,
+    }
+
+def bench_batch(prediction_service, factory, model_name, batch_size, min_seconds=0.5, min_rounds=3):
+    _, _, validate_batch, predict_batch = _entry_points(prediction_service, model_name)
+    validated = validate_batch(factory.payloads(model_name, batch_size))
+    predict_batch(validated)
+
+    rounds = []
+    started = time.perf_counter()
+    while len(rounds) < min_rounds or time.perf_counter() - started < min_seconds:
+        start = time.perf_counter()
+        result = predict_batch(validated)
+        rounds.append(time.perf_counter() - start)
+    if result["errors"]:
+        raise RuntimeError(f"{result['errors']} of {batch_size} {model_name} records failed")
+    return batch_size / min(rounds)
+
+
+def _transformation(model_name, directory):
+    '''
+    A DataTransformation of `model_name` that saves its artifacts under directory.
+    The matrix cache is off, every repeat transforms the CSVs.
+    '''
+    from src.matrix_cache import matrix_cache
+    matrix_cache.matrix_cache_config.enabled = False
+    if model_name == "stroke":
+        from src.stroke.data_transformation import DataTransformation
+        transformation = DataTransformation()
+        transformation.data_transformation_config.compiled_preprocessor_file_path = os.path.join(
+            directory, "stroke_preprocessor_compiled.npz"
+        )
+    elif model_name == "diabetes":
+        from src.diabetes.data_transformation import DataTransformation
+        transformation = DataTransformation()
+    else:
+        from src.diseases_and_symptoms.data_transformation import DataTransformation
+        transformation = DataTransformation()
+    transformation.data_transformation_config.preprocessor_obj_file_path = os.path.join(
+        directory, f"{model_name}_preprocessor.pkl"
+    )
+    return transformation
+
+def bench_transformation(factory, model_name, n_rows, repeat):
+    frame = {
+        "stroke": factory.stroke_frame,
+        "diabetes": factory.diabetes_frame,
+        "diseases_and_symptoms": factory.disease_frame,
+    }[model_name](n_rows)
+    n_test = max(1, n_rows // 5)
+
+    with tempfile.TemporaryDirectory() as directory:
+        train_path = os.path.join(directory, "train.csv")
+        test_path = os.path.join(directory, "test.csv")
+        frame.iloc[n_test:].to_csv(train_path, index=False)
+        frame.iloc[:n_test].to_csv(test_path, index=False)
+
+        seconds = float("inf")
+        for _ in range(repeat):
+            transformation = _transformation(model_name, directory)
+            start = time.perf_counter()
+            transformation.initiate_data_transformation(train_path, test_path)
+            seconds = min(seconds, time.perf_counter() - start)
+    return n_rows / seconds
+
+
+def run(args):
+    from benchmarks.payloads import PayloadFactory
+    prediction_service = _service()
+    factory = PayloadFactory(seed=args.seed)
+
+    metrics = {}
+    def record(name, value, unit, higher_is_better):
+        metrics[name] = {"value": value, "unit": unit, "higher_is_better": higher_is_better}
+        print(f"{name:<50} {value:>14,.3f} {unit}")
+
+    for model_name in args.models:
+        single = bench_single(prediction_service, factory, model_name, args.single_requests)
+        record(f"{model_name}.single.p50", single["p50_ms"], "ms", False)
+        record(f"{model_name}.single.p95", single["p95_ms"], "ms", False)
+        for batch_size in args.batch_sizes:
+            throughput = bench_batch(prediction_service, factory, model_name, batch_size)
+            record(f"{model_name}.batch_{batch_size}", throughput, "records/s", True)
+        for n_rows in args.transform_rows:
+            rows_per_second = bench_transformation(factory, model_name, n_rows, args.repeat)
+            record(f"{model_name}.transform_{n_rows}", rows_per_second, "rows/s", True)
+
+    import numpy, pandas, sklearn
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": numpy.__version__,
+            "pandas": pandas.__version__,
+            "scikit-learn": sklearn.__version__,
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "seed": args.seed,
+        },
+        "metrics": metrics,
+    }
+
+
+def compare(results, baseline, threshold):
+    '''
+    Returns the regressions: metrics worse than the baseline by more than
+    threshold, relative to the baseline value.
+    '''
+    regressions = []
+    print(f"\n{'metric':<50} {'baseline':>14} {'current':>14} {'change':>8}")
+    for name, current in results["metrics"].items():
+        base = baseline["metrics"].get(name)
+        if base is None or not base["value"]:
+            continue
+        change = (current["value"] - base["value"]) / base["value"]
+        worse = -change if current["higher_is_better"] else change
+        flag = "  REGRESSION" if worse > threshold else ""
+        print(f"{name:<50} {base['value']:>14,.3f} {current['value']:>14,.3f} {change:>+8.1%}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models", nargs="+", choices=MODELS, default=MODELS)
+    parser.add_argument("--single-requests", type=int, default=300)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 16, 128, 1024])
+    parser.add_argument("--transform-rows", type=int, nargs="+", default=[5000, 50000])
+    parser.add_argument("--repeat", type=int, default=3, help="runs per transformation size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--compare", action="store_true", help="compare with --baseline, exit 1 on regressions")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed relative slowdown for --compare")
+    parser.add_argument("--write-baseline", action="store_true", help="store the results as --baseline")
+    args = parser.parse_args()
+
+    results = run(args)
+
+    if args.output:
+        with open(args.output, "w") as file_obj:
+            json.dump(results, file_obj, indent=2)
+    if args.write_baseline:
+        with open(args.baseline, "w") as file_obj:
+            json.dump(results, file_obj, indent=2)
+            file_obj.write("\n")
+        print(f"Wrote {args.baseline}")
+    if args.compare:
+        with open(args.baseline) as file_obj:
+            baseline = json.load(file_obj)
+        regressions = compare(results, baseline, args.threshold)
+        for name in regressions:
+            print(f"REGRESSION {name}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+'''
+Cold-start benchmark with a budget. Run from ml-backend/:
+
+    python -m benchmarks.startup                  # check against the budget
+    python -m benchmarks.startup --write-budget   # record a new budget
+
+Every measurement runs in a fresh interpreter:
+- `python -X importtime -c "import app"`: import time of app.py and the
+  modules that dominate it
+- one process per route that imports app and sends a single request through
+  the Flask test client: time to first prediction, from process start to the
+  response, including imports and model loading
+
+Medians over --repeat runs are compared with benchmarks/startup_budget.json.
+The exit status is 1 when any of them exceeds its budget.
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BUDGET_PATH = os.path.join(os.path.dirname(__file__), "startup_budget.json")
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ROUTES = {
+    "stroke": ("/predict-stroke", {
+        "gender": "Male", "age": 67, "hypertension": 0, "heart_disease": 1,
+        "ever_married": "Yes", "work_type": "Private", "Residence_type": "Urban",
+        "avg_glucose_level": 228.69, "bmi": 36.6, "smoking_status": "formerly smoked"
+    }),
+    "diabetes": ("/predict-diabetes", {
+        "Pregnancies": 6, "Glucose": 148, "BloodPressure": 72, "SkinThickness": 35,
+        "Insulin": 0, "BMI": 33.6, "DiabetesPedigreeFunction": 0.627, "Age": 50
+    }),
+    "diseases_and_symptoms": ("/predict-disease-using-symptoms", {
+        "symptoms": ["anxiety and nervousness", "depression", "shortness of breath"]
+    }),
+}
+
+# runs in the child, STARTUP_T0 is the wall clock time the parent spawned it at
+FIRST_PREDICTION = """
+import json, os, sys, time
+t0 = float(os.environ["STARTUP_T0"])
+import app
+imported = time.time() - t0
+response = app.app.test_client().post(sys.argv[1], json=json.loads(sys.argv[2]))
+assert response.status_code == 200, response.get_data(as_text=True)
+print(json.dumps({"import_app": imported, "first_prediction": time.time() - t0}))
+"""
+
+
+def _child_env():
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [BACKEND_DIR, env.get("PYTHONPATH")]))
+    return env
+
+
+def measure_importtime():
+    '''
+    Returns (seconds to import app, [(module, cumulative seconds)] of the
+    slowest modules imported directly or indirectly).
+    '''
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=BACKEND_DIR, env=_child_env(), capture_output=True, text=True, check=True
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        modules.append((name.strip(), int(cumulative) / 1e6))
+    total = next(seconds for name, seconds in modules if name == "app")
+    top = sorted((entry for entry in modules if entry[0] != "app"), key=lambda entry: -entry[1])
+    return total, top[:10]
+
+
+def measure_first_prediction(model_name):
+    path, payload = ROUTES[model_name]
+    env = _child_env()
+    env["STARTUP_T0"] = repr(time.time())
+    result = subprocess.run(
+        [sys.executable, "-c", FIRST_PREDICTION, path, json.dumps(payload)],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"First {model_name} prediction failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])["first_prediction"]
+
+
+def run(repeat):
+    import_runs = []
+    top = []
+    for _ in range(repeat):
+        total, top = measure_importtime()
+        import_runs.append(total)
+
+    first_prediction = {}
+    for model_name in ROUTES:
+        first_prediction[model_name] = statistics.median(
+            measure_first_prediction(model_name) for _ in range(repeat)
+        )
+    return {
+        "import_app_seconds": statistics.median(import_runs),
+        "first_prediction_seconds": first_prediction,
+        "slowest_imports": top,
+    }
+
+
+def check(results, budget):
+    failures = []
+    if results["import_app_seconds"] > budget["import_app_seconds"]:
+        failures.append(f"import app: {results['import_app_seconds']:.3f}s > {budget['import_app_seconds']:.3f}s")
+    for model_name, seconds in results["first_prediction_seconds"].items():
+        limit = budget["first_prediction_seconds"].get(model_name)
+        if limit is not None and seconds > limit:
+            failures.append(f"first {model_name} prediction: {seconds:.3f}s > {limit:.3f}s")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--budget", default=BUDGET_PATH)
+    parser.add_argument("--write-budget", action="store_true", help="store the measurements times --headroom as the budget")
+    parser.add_argument("--headroom", type=float, default=1.5)
+    parser.add_argument("--json", help="also write the measurements to this file")
+    args = parser.parse_args()
+
+    results = run(args.repeat)
+    print(f"import app: {results['import_app_seconds']:.3f}s")
+    for name, seconds in results["slowest_imports"]:
+        print(f"    {name:<40} {seconds:.3f}s")
+    for model_name, seconds in results["first_prediction_seconds"].items():
+        print(f"first {model_name} prediction: {seconds:.3f}s")
+
+    if args.json:
+        with open(args.json, "w") as file_obj:
+            json.dump(results, file_obj, indent=2)
+
+    if args.write_budget:
+        budget = {
+            "import_app_seconds": round(results["import_app_seconds"] * args.headroom, 3),
+            "first_prediction_seconds": {
+                name: round(seconds * args.headroom, 3) for name, seconds in results["first_prediction_seconds"].items()
+            },
+        }
+        with open(args.budget, "w") as file_obj:
+            json.dump(budget, file_obj, indent=2)
+            file_obj.write("\n")
+        print(f"Wrote {args.budget}")
+        return
+
+    with open(args.budget) as file_obj:
+        budget = json.load(file_obj)
+    failures = check(results, budget)
+    for failure in failures:
+        print(f"OVER BUDGET {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
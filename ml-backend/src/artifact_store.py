@@ -0,0 +1,392 @@
+'''
+Pickle-free artifact format for the fitted estimators.
+
+An artifact saved to artifacts/stroke_model.pkl is also written as
+
+    artifacts/stroke_model/manifest.json
+    artifacts/stroke_model/arrays-<sha256 prefix>.bin
+
+- every numeric array of the estimator (LR coefficients, tree node arrays,
+  scaler parameters, ...) is stored raw and 64-byte aligned in the .bin
+  file, which is memory mapped read-only on load: the arrays are zero-copy
+  views shared by every process that maps the file
+- the manifest holds the estimator structure as JSON (classes, parameters,
+  strings such as encoder categories), the schema (feature order, classes),
+  the sklearn version and a SHA-256 per file, checked on load
+- only estimator classes from sklearn and src can be rebuilt, nothing else is
+  imported or executed while loading
+- the .bin file is content addressed and manifest.json is replaced last and
+  atomically, so a reader never sees a half written artifact
+
+load_artifact falls back to the legacy dill pickle when there is no manifest.
+Convert existing pickles with:
+
+    python -m src.artifact_store artifacts/*.pkl
+'''
+import os
+import sys
+import json
+import hashlib
+import importlib
+from dataclasses import dataclass
+import numpy as np
+from src.exception import CustomException
+from src.logger import logging
+from src.utils import save_object, load_object
+
+FORMAT_NAME = "careconnect-artifact"
+FORMAT_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+ALIGNMENT = 64
+
+# classes that are rebuilt from their __reduce__ arguments and state
+REDUCE_CLASSES = {"sklearn.tree._tree:Tree"}
+# non-estimator helper classes that may appear inside a fitted estimator
+HELPER_CLASSES = {"sklearn.compose._column_transformer:_RemainderColsList"}
+
+def _rebuild_loss(estimator):
+    # the loss object of gradient boosting wraps Cython objects, predict_proba needs it
+    estimator._loss = estimator._get_loss(sample_weight=None)
+
+def _rebuild_sgd_loss(estimator):
+    # Cython loss of SGD models, partial_fit sets it again but the attribute is expected
+    estimator._loss_function_ = estimator._get_loss_function(estimator.loss)
+
+# attributes that are dropped on save and rebuilt after load
+REBUILT_ATTRIBUTES = {
+    "sklearn.ensemble._gb:GradientBoostingClassifier": (["_loss"], _rebuild_loss),
+    "sklearn.ensemble._gb:GradientBoostingRegressor": (["_loss"], _rebuild_loss),
+    "sklearn.linear_model._stochastic_gradient:SGDClassifier": (["_loss_function_"], _rebuild_sgd_loss),
+}
+
+@dataclass
+class ArtifactStoreConfig:
+    # keep writing the dill pickle next to the manifest for older deployments
+    write_pickle: bool = os.environ.get("ARTIFACT_WRITE_PICKLE", "1") != "0"
+    verify_checksums: bool = os.environ.get("ARTIFACT_VERIFY_CHECKSUMS", "1") != "0"
+
+artifact_store_config = ArtifactStoreConfig()
+
+
+def artifact_dir(file_path):
+    return os.path.splitext(file_path)[0]
+
+def manifest_path(file_path):
+    return os.path.join(artifact_dir(file_path), MANIFEST_NAME)
+
+def artifact_source(file_path):
+    '''
+    The file that identifies the current content of an artifact: its manifest
+    when there is one, otherwise the file itself.
+    '''
+    manifest = manifest_path(file_path)
+    return manifest if os.path.exists(manifest) else file_path
+
+
+def _class_path(cls):
+    return f"{cls.__module__}:{cls.__qualname__}"
+
+def _import_class(class_path, allowed):
+    from sklearn.base import BaseEstimator
+    module_name, _, qualname = class_path.partition(":")
+    if not module_name.startswith(("sklearn.", "src.")) or "." in qualname:
+        raise TypeError(f"Refusing to load class {class_path}")
+    cls = getattr(importlib.import_module(module_name), qualname)
+    if not (isinstance(cls, type) and (issubclass(cls, BaseEstimator) or class_path in allowed)):
+        raise TypeError(f"Refusing to load class {class_path}")
+    return cls
+
+def _sha256(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file_obj:
+        for block in iter(lambda: file_obj.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _dtype_descr(descr):
+    # JSON turns the (name, format) tuples of structured dtypes into lists
+    if isinstance(descr, list):
+        return [tuple(_dtype_descr(part) for part in field) for field in descr]
+    return descr
+
+
+class _Encoder:
+    def __init__(self):
+        self.blob = bytearray()
+        # id -> (ref, obj), obj is kept alive so its id is not reused
+        self._memo = {}
+
+    def encode(self, obj):
+        if obj is None or isinstance(obj, (bool, str)):
+            return obj
+        if type(obj) in (int, float):
+            return obj
+        if isinstance(obj, np.generic):
+            return {"type": "scalar", "dtype": obj.dtype.str, "value": obj.item()}
+        if isinstance(obj, np.ndarray):
+            return self._shared(obj, self._array)
+        if isinstance(obj, list):
+            return [self.encode(item) for item in obj]
+        if isinstance(obj, tuple):
+            return {"type": "tuple", "items": [self.encode(item) for item in obj]}
+        if isinstance(obj, dict):
+            if all(isinstance(key, str) for key in obj):
+                return {"type": "dict", "items": {key: self.encode(value) for key, value in obj.items()}}
+            return {"type": "pairs", "items": [[self.encode(k), self.encode(v)] for k, v in obj.items()]}
+        if isinstance(obj, slice):
+            return {"type": "slice", "items": [obj.start, obj.stop, obj.step]}
+        if isinstance(obj, np.dtype):
+            return {"type": "dtype", "descr": np.lib.format.dtype_to_descr(obj)}
+        if isinstance(obj, type) and issubclass(obj, np.generic):
+            return {"type": "numpy_type", "name": obj.__name__}
+        if isinstance(obj, np.random.RandomState):
+            return self._shared(obj, lambda random_state: {"type": "random_state", "state": self.encode(random_state.get_state())})
+        return self._shared(obj, self._object)
+
+    def _shared(self, obj, build):
+        # objects referenced more than once (e.g. the random state every tree of
+        # a gradient boosting model holds) are stored once, like pickle does
+        memo = self._memo.get(id(obj))
+        if memo is not None:
+            return {"type": "ref", "ref": memo[0]}
+        ref = len(self._memo)
+        self._memo[id(obj)] = (ref, obj)
+        node = build(obj)
+        node["ref"] = ref
+        return node
+
+    def _array(self, array):
+        if array.dtype.hasobject:
+            return {
+                "type": "object_array",
+                "shape": list(array.shape),
+                "items": [self.encode(item) for item in array.ravel()],
+            }
+        array = np.ascontiguousarray(array)
+        self.blob.extend(b"\0" * (-len(self.blob) % ALIGNMENT))
+        offset = len(self.blob)
+        self.blob.extend(array.tobytes())
+        return {
+            "type": "array",
+            "dtype": np.lib.format.dtype_to_descr(array.dtype),
+            "shape": list(array.shape),
+            "offset": offset,
+        }
+
+    def _object(self, obj):
+        from sklearn.base import BaseEstimator
+        cls = type(obj)
+        class_path = _class_path(cls)
+        if class_path in REDUCE_CLASSES:
+            _, args, state = obj.__reduce__()
+            return {"type": "reduce", "class": class_path, "args": self.encode(args), "state": self.encode(state)}
+        if not class_path.startswith(("sklearn.", "src.")) or not (isinstance(obj, BaseEstimator) or class_path in HELPER_CLASSES):
+            raise TypeError(f"Cannot store objects of type {class_path}")
+
+        state = obj.__getstate__() if hasattr(obj, "__getstate__") else dict(obj.__dict__)
+        dropped, _ = REBUILT_ATTRIBUTES.get(class_path, ([], None))
+        state = {key: value for key, value in state.items() if key not in dropped}
+        return {"type": "object", "class": class_path, "state": self.encode(state)}
+
+
+class _Decoder:
+    def __init__(self, blob):
+        self.blob = blob
+        self._memo = {}
+
+    def decode(self, node):
+        if isinstance(node, list):
+            return [self.decode(item) for item in node]
+        if not isinstance(node, dict):
+            return node
+        if node["type"] == "ref":
+            return self._memo[node["ref"]]
+
+        obj = self._decode_node(node["type"], node)
+        if "ref" in node:
+            self._memo[node["ref"]] = obj
+        return obj
+
+    def _decode_node(self, kind, node):
+        if kind == "array":
+            dtype = np.lib.format.descr_to_dtype(_dtype_descr(node["dtype"]))
+            count = int(np.prod(node["shape"], dtype=np.int64))
+            start = node["offset"]
+            data = self.blob[start:start + count * dtype.itemsize]
+            return data.view(dtype).reshape(node["shape"])
+        if kind == "object_array":
+            array = np.empty(len(node["items"]), dtype=object)
+            array[:] = [self.decode(item) for item in node["items"]]
+            return array.reshape(node["shape"])
+        if kind == "scalar":
+            return np.dtype(node["dtype"]).type(node["value"])
+        if kind == "tuple":
+            return tuple(self.decode(item) for item in node["items"])
+        if kind == "dict":
+            return {key: self.decode(value) for key, value in node["items"].items()}
+        if kind == "pairs":
+            return {self.decode(key): self.decode(value) for key, value in node["items"]}
+        if kind == "slice":
+            return slice(*node["items"])
+        if kind == "dtype":
+            return np.lib.format.descr_to_dtype(_dtype_descr(node["descr"]))
+        if kind == "numpy_type":
+            numpy_type = getattr(np, node["name"])
+            if not (isinstance(numpy_type, type) and issubclass(numpy_type, np.generic)):
+                raise TypeError(f"Unknown numpy type {node['name']}")
+            return numpy_type
+        if kind == "random_state":
+            random_state = np.random.RandomState()
+            random_state.set_state(self.decode(node["state"]))
+            return random_state
+        if kind == "reduce":
+            if node["class"] not in REDUCE_CLASSES:
+                raise TypeError(f"Refusing to load class {node['class']}")
+            cls = _import_class(node["class"], REDUCE_CLASSES)
+            obj = cls(*self.decode(node["args"]))
+            obj.__setstate__(self.decode(node["state"]))
+            return obj
+        if kind == "object":
+            cls = _import_class(node["class"], HELPER_CLASSES)
+            obj = cls.__new__(cls)
+            state = self.decode(node["state"])
+            if hasattr(obj, "__setstate__"):
+                obj.__setstate__(state)
+            else:
+                obj.__dict__.update(state)
+            if node["class"] in REBUILT_ATTRIBUTES:
+                _, rebuild = REBUILT_ATTRIBUTES[node["class"]]
+                rebuild(obj)
+            return obj
+        raise TypeError(f"Unknown artifact node type {kind}")
+
+
+def _schema(obj):
+    schema = {"estimator": _class_path(type(obj))}
+    feature_names = getattr(obj, "feature_names_in_", None)
+    if feature_names is not None:
+        schema["feature_names_in"] = [str(name) for name in feature_names]
+    n_features = getattr(obj, "n_features_in_", None)
+    if n_features is not None:
+        schema["n_features_in"] = int(n_features)
+    classes = getattr(obj, "classes_", None)
+    if classes is not None:
+        schema["classes"] = np.asarray(classes).tolist()
+    return schema
+
+
+def save_artifact(file_path, obj, write_pickle=None):
+    '''
+    Writes obj in the manifest format next to file_path (and the legacy pickle
+    at file_path unless ARTIFACT_WRITE_PICKLE=0).
+    '''
+    import sklearn
+    try:
+        write_pickle = artifact_store_config.write_pickle if write_pickle is None else write_pickle
+        if write_pickle:
+            save_object(file_path, obj)
+
+        encoder = _Encoder()
+        root = encoder.encode(obj)
+        blob = bytes(encoder.blob)
+        blob_sha256 = hashlib.sha256(blob).hexdigest()
+        blob_name = f"arrays-{blob_sha256[:16]}.bin"
+
+        directory = artifact_dir(file_path)
+        os.makedirs(directory, exist_ok=True)
+        blob_path = os.path.join(directory, blob_name)
+        if not os.path.exists(blob_path):
+            with open(f"{blob_path}.tmp", "wb") as file_obj:
+                file_obj.write(blob)
+            os.replace(f"{blob_path}.tmp", blob_path)
+
+        manifest = {
+            "format": FORMAT_NAME,
+            "format_version": FORMAT_VERSION,
+            "sklearn_version": sklearn.__version__,
+            "numpy_version": np.__version__,
+            "schema": _schema(obj),
+            "files": {blob_name: {"sha256": blob_sha256, "size": len(blob)}},
+            "arrays": blob_name,
+            "root": root,
+        }
+        manifest_file = os.path.join(directory, MANIFEST_NAME)
+        previous_blob = None
+        if os.path.exists(manifest_file):
+            try:
+                previous_blob = read_manifest(file_path)["arrays"]
+            except Exception:
+                pass
+        with open(f"{manifest_file}.tmp", "w") as file_obj:
+            json.dump(manifest, file_obj)
+        os.replace(f"{manifest_file}.tmp", manifest_file)
+
+        # blobs older than the replaced version. The replaced one stays for
+        # readers that parsed its manifest but did not open the blob yet,
+        # processes that still map older ones keep their pages.
+        for name in os.listdir(directory):
+            if name.startswith("arrays-") and name not in (blob_name, previous_blob):
+                os.remove(os.path.join(directory, name))
+
+        logging.info(f"Saved artifact {directory} ({len(blob)} bytes of arrays)")
+
+    except Exception as e:
+        raise CustomException(e, sys)
+
+
+def read_manifest(file_path):
+    with open(manifest_path(file_path)) as file_obj:
+        manifest = json.load(file_obj)
+    if manifest.get("format") != FORMAT_NAME or manifest.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported artifact format in {manifest_path(file_path)}")
+    return manifest
+
+
+def load_artifact(file_path, verify=None):
+    '''
+    Loads the manifest format of file_path, or the legacy pickle at file_path
+    when there is no manifest.
+    '''
+    try:
+        if not os.path.exists(manifest_path(file_path)):
+            return load_object(file_path)
+        try:
+            return _load_manifest_artifact(file_path, verify)
+        except FileNotFoundError:
+            # its blob was removed by two saves in a row since the manifest was
+            # read, the current manifest names blobs that exist
+            return _load_manifest_artifact(file_path, verify)
+
+    except Exception as e:
+        raise CustomException(e, sys)
+
+
+def _load_manifest_artifact(file_path, verify):
+    # sklearn is imported once an artifact is loaded, not with this module
+    import sklearn
+    manifest = read_manifest(file_path)
+    directory = artifact_dir(file_path)
+    verify = artifact_store_config.verify_checksums if verify is None else verify
+    if verify:
+        for name, entry in manifest["files"].items():
+            if _sha256(os.path.join(directory, name)) != entry["sha256"]:
+                raise ValueError(f"Checksum mismatch for {os.path.join(directory, name)}")
+
+    if manifest["sklearn_version"] != sklearn.__version__:
+        logging.warning(
+            f"{directory} was saved with scikit-learn {manifest['sklearn_version']}, "
+            f"running {sklearn.__version__}"
+        )
+
+    blob_path = os.path.join(directory, manifest["arrays"])
+    if manifest["files"][manifest["arrays"]]["size"]:
+        blob = np.memmap(blob_path, dtype=np.uint8, mode="r").view(np.ndarray)
+    else:
+        blob = np.empty(0, dtype=np.uint8)
+    return _Decoder(blob).decode(manifest["root"])
+
+
+if __name__ == "__main__":
+    for legacy_path in sys.argv[1:]:
+        save_artifact(legacy_path, load_object(legacy_path), write_pickle=False)
+        print(f"{legacy_path} -> {manifest_path(legacy_path)}")
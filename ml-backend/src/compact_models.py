@@ -0,0 +1,408 @@
+'''
+Compact versions of the trained models for inference.
+
+    python -m src.compact_models                       # all three
+    python -m src.compact_models diseases_and_symptoms
+
+An export of artifacts/stroke_model.pkl is saved as the artifact
+artifacts/stroke_model_compact.pkl, holding only what predict needs:
+- linear models: float32 coefficients and intercepts
+- tree ensembles: the nodes of all trees in flat arrays, float32 thresholds,
+  int32 children and int16 features. The trees compare float32 inputs like
+  sklearn does, thresholds rounded down to float32 give the same splits for
+  every float32 value. Leaf values of gradient boosting stay float64, AdaBoost
+  keeps the class index of each leaf.
+
+Before it is saved, the compact model has to predict the pipeline's test split
+like the float64 model, on at least COMPACT_MIN_AGREEMENT of the rows (all of
+them by default). The export remembers which model artifact it was made from.
+
+COMPACT_MODELS=1 exports after each training run and makes the prediction
+pipelines serve the compact model, as long as it was exported from the model
+artifact they loaded. Otherwise they keep using the float64 model.
+'''
+import os
+import sys
+import json
+import argparse
+from dataclasses import dataclass
+import numpy as np
+from sklearn.base import BaseEstimator
+from src.exception import CustomException
+from src.logger import logging
+from src.artifact_store import save_artifact, artifact_source
+from src.matrix_cache import file_sha256
+
+@dataclass
+class CompactModelConfig:
+    # export compact models after training and serve them
+    enabled: bool = os.environ.get("COMPACT_MODELS", "0") == "1"
+    # share of the test split the compact model has to predict like the float64 model
+    min_agreement: float = float(os.environ.get("COMPACT_MIN_AGREEMENT", 1.0))
+    dataset_dir: str = "artifacts_dataset"
+
+compact_model_config = CompactModelConfig()
+
+
+def compact_path(model_path):
+    root, ext = os.path.splitext(model_path)
+    return f"{root}_compact{ext}"
+
+def _unwrap(model):
+    # a Pipeline of nothing but the model, like the shipped symptoms model
+    if hasattr(model, "steps"):
+        if any(step not in (None, "passthrough") for _, step in model.steps[:-1]):
+            raise ValueError("Only pipelines with a single model step are supported")
+        return model.steps[-1][1]
+    return model
+
+def _round_down_float32(values):
+    '''
+    The largest float32 <= each float64 value: x <= t and x <= t32 agree for
+    every float32 x.
+    '''
+    rounded = values.astype(np.float32)
+    above = rounded.astype(np.float64) > values
+    rounded[above] = np.nextafter(rounded[above], np.float32(-np.inf))
+    return rounded
+
+def _softmax(scores):
+    exp = np.exp(scores - scores.max(axis=1, keepdims=True))
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+class CompactLinearClassifier(BaseEstimator):
+    '''
+    A logistic model (LogisticRegression, SGDClassifier) with float32
+    coefficients. It has the attributes SparseLinearScorer reads.
+    '''
+    @classmethod
+    def from_model(cls, model):
+        compact = cls()
+        compact.coef_ = np.ascontiguousarray(model.coef_, dtype=np.float32)
+        compact.intercept_ = np.asarray(model.intercept_, dtype=np.float32)
+        compact.classes_ = model.classes_
+        compact.n_features_in_ = model.coef_.shape[1]
+        # same rule LogisticRegression.predict_proba uses to pick one-vs-rest
+        # (normalized sigmoids) or multinomial (softmax) probabilities
+        multi_class = getattr(model, "multi_class", "ovr")
+        ovr = multi_class in ("ovr", "warn") or (
+            multi_class in ("auto", "deprecated")
+            and (model.classes_.size <= 2 or getattr(model, "solver", None) == "liblinear")
+        )
+        compact.multi_class = "ovr" if ovr else "multinomial"
+        return compact
+
+    def decision_function(self, X):
+        from scipy import sparse
+        X = X.astype(np.float32) if sparse.issparse(X) else np.asarray(X, dtype=np.float32)
+        scores = np.asarray(X @ self.coef_.T) + self.intercept_
+        return scores[:, 0] if scores.shape[1] == 1 else scores
+
+    def predict(self, X):
+        scores = self.decision_function(X)
+        if scores.ndim == 1:
+            return self.classes_[(scores > 0).astype(np.intp)]
+        return self.classes_[np.argmax(scores, axis=1)]
+
+    def predict_proba(self, X):
+        scores = self.decision_function(X)
+        if self.multi_class == "ovr":
+            prob = 1.0 / (1.0 + np.exp(-scores.reshape(len(scores), -1)))
+            if scores.ndim == 1:
+                return np.c_[1 - prob[:, 0], prob[:, 0]]
+            return prob / prob.sum(axis=1, keepdims=True)
+        if scores.ndim == 1:
+            scores = np.c_[-scores, scores]
+        return _softmax(scores)
+
+
+class CompactTrees(BaseEstimator):
+    '''
+    The nodes of a list of fitted decision trees in flat arrays. A leaf is its
+    own left and right child, so every row walks max_depth steps.
+    '''
+    def _set_trees(self, trees):
+        offsets = np.cumsum([0] + [tree.node_count for tree in trees])
+        n_nodes = int(offsets[-1])
+        feature_dtype = np.int16 if self.n_features_in_ <= np.iinfo(np.int16).max else np.int32
+
+        self.roots_ = offsets[:-1].astype(np.int32)
+        self.children_ = np.empty((n_nodes, 2), dtype=np.int32)
+        self.feature_ = np.zeros(n_nodes, dtype=feature_dtype)
+        self.threshold_ = np.zeros(n_nodes, dtype=np.float32)
+        self.missing_left_ = np.zeros(n_nodes, dtype=bool)
+        self.max_depth_ = max(tree.max_depth for tree in trees)
+
+        for offset, tree in zip(offsets[:-1], trees):
+            nodes = slice(offset, offset + tree.node_count)
+            leaf = tree.children_left == -1
+            own = offset + np.arange(tree.node_count)
+            self.children_[nodes, 0] = np.where(leaf, own, offset + tree.children_left)
+            self.children_[nodes, 1] = np.where(leaf, own, offset + tree.children_right)
+            self.feature_[nodes] = np.where(leaf, 0, tree.feature)
+            self.threshold_[nodes] = np.where(leaf, 0, _round_down_float32(tree.threshold))
+            missing_left = getattr(tree, "missing_go_to_left", None)
+            if missing_left is not None:
+                self.missing_left_[nodes] = missing_left.astype(bool)
+        return offsets
+
+    def apply(self, X):
+        '''
+        The leaf of every row in every tree, (n_rows, n_trees) node indices.
+        '''
+        from scipy import sparse
+        X = X.toarray() if sparse.issparse(X) else X
+        # sklearn trees also compare float32 inputs
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n_rows, n_features = X.shape
+        values_flat = X.ravel()
+        index_dtype = np.int32 if values_flat.size < np.iinfo(np.int32).max else np.intp
+        row_offsets = (np.arange(n_rows, dtype=index_dtype) * n_features)[:, None]
+        children = self.children_.ravel()
+        has_missing = bool(np.isnan(values_flat).any())
+
+        nodes = np.repeat(self.roots_[None, :], n_rows, axis=0)
+        for _ in range(self.max_depth_):
+            values = values_flat.take(row_offsets + self.feature_.take(nodes))
+            go_right = ~(values <= self.threshold_.take(nodes))
+            if has_missing:
+                go_right &= ~(np.isnan(values) & self.missing_left_.take(nodes))
+            nodes = children.take(2 * nodes + go_right)
+        return nodes
+
+
+class CompactGradientBoosting(CompactTrees):
+    '''
+    GradientBoostingClassifier with log loss and a constant (prior or zero)
+    initial prediction.
+    '''
+    @classmethod
+    def from_model(cls, model):
+        from sklearn.dummy import DummyClassifier
+        if model.loss != "log_loss":
+            raise ValueError(f"Unsupported gradient boosting loss {model.loss}")
+        if not (model.init_ == "zero" or (isinstance(model.init_, DummyClassifier) and model.init_.strategy == "prior")):
+            raise ValueError(f"Unsupported gradient boosting init {model.init_}")
+
+        compact = cls()
+        compact.classes_ = model.classes_
+        compact.n_features_in_ = model.n_features_in_
+        n_stages, n_outputs = model.estimators_.shape
+        # trees ordered stage by stage, output by output, like predict_stages adds them
+        trees = [model.estimators_[i, k].tree_ for i in range(n_stages) for k in range(n_outputs)]
+        compact._set_trees(trees)
+        compact.tree_output_ = np.tile(np.arange(n_outputs, dtype=np.int32), n_stages)
+        compact.value_ = np.concatenate([tree.value[:, 0, 0] for tree in trees])
+        compact.learning_rate = float(model.learning_rate)
+        compact.init_raw_ = model._raw_predict_init(np.zeros((1, model.n_features_in_)))[0].astype(np.float64)
+        return compact
+
+    def decision_function(self, X):
+        contributions = self.learning_rate * self.value_.take(self.apply(X))
+        raw = np.tile(self.init_raw_, (len(contributions), 1))
+        # added tree by tree in the order of sklearn's predict_stages, same sums
+        for tree, output in enumerate(self.tree_output_):
+            raw[:, output] += contributions[:, tree]
+        return raw[:, 0] if raw.shape[1] == 1 else raw
+
+    def predict(self, X):
+        raw = self.decision_function(X)
+        if raw.ndim == 1:
+            return self.classes_[(raw >= 0).astype(np.intp)]
+        return self.classes_[np.argmax(raw, axis=1)]
+
+    def predict_proba(self, X):
+        raw = self.decision_function(X)
+        if raw.ndim == 1:
+            prob = 1.0 / (1.0 + np.exp(-raw))
+            return np.c_[1 - prob, prob]
+        return _softmax(raw)
+
+
+class CompactAdaBoost(CompactTrees):
+    '''
+    AdaBoostClassifier with the SAMME algorithm, each leaf holding the index of
+    the class its tree predicts there.
+    '''
+    @classmethod
+    def from_model(cls, model):
+        if getattr(model, "algorithm", "SAMME") == "SAMME.R":
+            raise ValueError("Only SAMME AdaBoost models are supported")
+        compact = cls()
+        compact.classes_ = model.classes_
+        compact.n_features_in_ = model.n_features_in_
+        estimators = list(zip(model.estimators_, model.estimator_weights_))
+        compact._set_trees([estimator.tree_ for estimator, _ in estimators])
+
+        leaf_class = []
+        for estimator, _ in estimators:
+            # DecisionTreeClassifier.predict takes the argmax of the node values
+            labels = estimator.classes_[np.argmax(estimator.tree_.value[:, 0, :], axis=1)]
+            leaf_class.append(np.searchsorted(model.classes_, labels))
+        compact.leaf_class_ = np.concatenate(leaf_class).astype(np.int16)
+        compact.estimator_weights_ = np.array([weight for _, weight in estimators], dtype=np.float64)
+        compact.weight_sum_ = float(model.estimator_weights_.sum())
+        return compact
+
+    def decision_function(self, X):
+        leaves = self.apply(X)
+        n_classes = len(self.classes_)
+        classes = np.arange(n_classes)
+        pred = np.zeros((len(leaves), n_classes))
+        for tree, weight in enumerate(self.estimator_weights_):
+            hits = self.leaf_class_[leaves[:, tree]][:, None] == classes
+            pred += np.where(hits, weight, -1 / (n_classes - 1) * weight)
+        pred /= self.weight_sum_
+        if n_classes == 2:
+            pred[:, 0] *= -1
+            return pred.sum(axis=1)
+        return pred
+
+    def predict(self, X):
+        pred = self.decision_function(X)
+        if len(self.classes_) == 2:
+            return self.classes_.take(pred > 0, axis=0)
+        return self.classes_.take(np.argmax(pred, axis=1), axis=0)
+
+
+def compact_model(model):
+    '''
+    The compact version of a trained model, ValueError for unsupported ones.
+    '''
+    from sklearn.ensemble import AdaBoostClassifier, GradientBoostingClassifier
+    estimator = _unwrap(model)
+    if isinstance(estimator, GradientBoostingClassifier):
+        return CompactGradientBoosting.from_model(estimator)
+    if isinstance(estimator, AdaBoostClassifier):
+        return CompactAdaBoost.from_model(estimator)
+    if hasattr(estimator, "coef_") and hasattr(estimator, "classes_"):
+        return CompactLinearClassifier.from_model(estimator)
+    raise ValueError(f"No compact version of {type(estimator).__name__}")
+
+def _nbytes(obj):
+    return sum(value.nbytes for value in vars(obj).values() if isinstance(value, np.ndarray))
+
+def export_compact_model(model, model_path, X_test, y_test=None):
+    '''
+    Builds the compact version of the model saved at model_path and saves it
+    next to it when it predicts X_test like the model. Returns a report.
+    '''
+    try:
+        config = compact_model_config
+        compact = compact_model(model)
+        compact.source_sha256_ = file_sha256(artifact_source(model_path))
+
+        expected = model.predict(X_test)
+        actual = compact.predict(X_test)
+        rows = len(expected)
+        agreement = float(np.mean(actual == expected)) if rows else 0.0
+        report = {
+            "model": model_path,
+            "compact": compact_path(model_path),
+            "estimator": type(compact).__name__,
+            "rows": rows,
+            "agreement": agreement,
+            "disagreements": int(np.sum(actual != expected)),
+            "compact_array_bytes": _nbytes(compact),
+            "accepted": rows > 0 and agreement >= config.min_agreement,
+        }
+        if y_test is not None and rows:
+            y_test = np.asarray(y_test)
+            report["accuracy"] = float(np.mean(expected == y_test))
+            report["compact_accuracy"] = float(np.mean(actual == y_test))
+
+        if report["accepted"]:
+            compact.agreement_ = agreement
+            save_artifact(file_path=compact_path(model_path), obj=compact)
+            logging.info(f"Compact model exported: {report}")
+        else:
+            logging.warning(f"Compact model rejected, keeping the float64 model only: {report}")
+        return report
+
+    except Exception as e:
+        raise CustomException(e, sys)
+
+def serving_model(artifacts, model_path):
+    '''
+    The model a prediction pipeline predicts with: the compact export when
+    COMPACT_MODELS=1 and it was made from the loaded model, otherwise the
+    loaded model.
+    '''
+    if not compact_model_config.enabled:
+        return artifacts["model"]
+    return artifacts.derived("serving_model", lambda bundle: _checked_compact(bundle, model_path)) or artifacts["model"]
+
+def _checked_compact(artifacts, model_path):
+    compact = artifacts.objects.get("compact_model")
+    if compact is None:
+        logging.warning(f"No compact model for {model_path}, run python -m src.compact_models")
+        return None
+    try:
+        if compact.source_sha256_ != file_sha256(artifact_source(model_path)):
+            raise ValueError("it was exported from another version of the model")
+        return compact
+    except Exception as e:
+        logging.warning(f"Compact model of {model_path} not used for version {artifacts.version}: {e}")
+        return None
+
+
+def _stroke_split(file_path, bundle):
+    import pandas as pd
+    df = pd.read_csv(file_path)
+    return bundle["preprocessor"].transform(df.drop(columns=["stroke"])), df["stroke"].to_numpy(dtype=np.float64)
+
+def _diabetes_split(file_path, bundle):
+    import pandas as pd
+    from src.diabetes.predict_pipeline import FEATURE_COLUMNS
+    df = pd.read_csv(file_path)
+    return bundle["preprocessor"].transform(df[FEATURE_COLUMNS]), df["Outcome"].to_numpy(dtype=np.float64)
+
+def _symptoms_split(file_path, bundle):
+    from src.diseases_and_symptoms.data_transformation import read_symptoms_sparse, DataTransformationConfig
+    X, diseases = read_symptoms_sparse(file_path, DataTransformationConfig().chunk_rows)
+    if X.shape[1] != len(bundle["symptoms"]):
+        raise ValueError(f"{file_path} has {X.shape[1]} symptom columns, the model {len(bundle['symptoms'])}")
+    return X, bundle["preprocessor"].transform(diseases)
+
+# test split readers, producing what each pipeline's model predicts on
+SPLIT_READERS = {
+    "stroke": _stroke_split,
+    "diabetes": _diabetes_split,
+    "diseases_and_symptoms": _symptoms_split,
+}
+
+def export_pipeline(name):
+    '''
+    Exports the compact model of a pipeline's current artifacts, checked on
+    its test split in artifacts_dataset/.
+    '''
+    from src import prediction_service
+    pipeline = {
+        "stroke": prediction_service.stroke_pipeline,
+        "diabetes": prediction_service.diabetes_pipeline,
+        "diseases_and_symptoms": prediction_service.disease_pipeline,
+    }[name]
+    bundle = pipeline.bundle()
+    test_path = os.path.join(compact_model_config.dataset_dir, f"{name}_test.csv")
+    X_test, y_test = SPLIT_READERS[name](test_path, bundle)
+    return export_compact_model(bundle["model"], pipeline.predict_pipeline_config.model_path, X_test, y_test)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pipelines", nargs="*", metavar="pipeline", help=f"any of {', '.join(SPLIT_READERS)}, default all")
+    args = parser.parse_args()
+    unknown = sorted(set(args.pipelines) - set(SPLIT_READERS))
+    if unknown:
+        parser.error(f"unknown pipelines {unknown}, choose from {list(SPLIT_READERS)}")
+
+    reports = [export_pipeline(name) for name in args.pipelines or SPLIT_READERS]
+    print(json.dumps(reports, indent=2))
+    sys.exit(0 if all(report["accepted"] for report in reports) else 1)
+
+
+if __name__ == "__main__":
+    # the compact classes are stored by module path, run them as src.compact_models not __main__
+    from src.compact_models import main
+    main()
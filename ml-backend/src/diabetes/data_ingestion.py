@@ -2,9 +2,11 @@ import os
 import sys
 from src.exception import CustomException
 from src.logger import logging
+import numpy as np
 import pandas as pd
 from sklearn.model_selection import train_test_split
 from dataclasses import dataclass
+from src.streaming_ingestion import streaming_ingestion_config, stream_split_csv
 
 from src.diabetes.data_transformation import DataTransformationConfig
 from src.diabetes.data_transformation import DataTransformation
@@ -18,6 +20,14 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../.
 class DataIngestionConfig:
     train_data_path: str = os.path.join('artifacts_dataset',"diabetes_train.csv")
     test_data_path: str = os.path.join('artifacts_dataset',"diabetes_test.csv")
+    dataset_path: str = os.path.join(streaming_ingestion_config.datasets_dir, "Diabetes.csv")
+
+# downcast column types for streaming
+DIABETES_DTYPES = {
+    "Pregnancies": np.int16, "Glucose": np.int16, "BloodPressure": np.int16, "SkinThickness": np.int16,
+    "Insulin": np.int16, "BMI": np.float32, "DiabetesPedigreeFunction": np.float32, "Age": np.int16,
+    "Outcome": np.uint8,
+}
 
 class DataIngestion:
     def __init__(self):
@@ -26,19 +36,30 @@ class DataIngestion:
     def initiate_data_ingestion(self):
         logging.info("Entered the diabetes data ingestion method or component")
         try:
-            # df=pd.read_csv('notebooks\datasets\Diabetes.csv')
-            df = pd.read_csv('notebooks\\datasets\\Diabetes.csv')
-            logging.info("Read the dataset as dataframe")
+            if streaming_ingestion_config.mode == "stream":
+                # chunk by chunk, the whole dataset is never in memory
+                stream_split_csv(
+                    self.ingestion_config.dataset_path,
+                    self.ingestion_config.train_data_path,
+                    self.ingestion_config.test_data_path,
+                    target="Outcome",
+                    test_size=0.2,
+                    dtypes=DIABETES_DTYPES,
+                    seed=42
+                )
+            else:
+                df = pd.read_csv(self.ingestion_config.dataset_path)
+                logging.info("Read the dataset as dataframe")
 
-            os.makedirs(os.path.dirname(self.ingestion_config.train_data_path),exist_ok=True)
+                os.makedirs(os.path.dirname(self.ingestion_config.train_data_path),exist_ok=True)
 
-            logging.info("Train test split initiated")
+                logging.info("Train test split initiated")
 
-            train_set,test_set=train_test_split(df,test_size=0.2,stratify=df['Outcome'],random_state=42)
+                train_set,test_set=train_test_split(df,test_size=0.2,stratify=df['Outcome'],random_state=42)
 
-            train_set.to_csv(self.ingestion_config.train_data_path,index=False,header=True)
+                train_set.to_csv(self.ingestion_config.train_data_path,index=False,header=True)
 
-            test_set.to_csv(self.ingestion_config.test_data_path,index=False,header=True)
+                test_set.to_csv(self.ingestion_config.test_data_path,index=False,header=True)
 
             logging.info("Inagestion of the data is completed")
 
@@ -3,7 +3,8 @@ import sys
 from dataclasses import dataclass
 from src.exception import CustomException
 from src.logger import logging
-from src.utils import save_object
+from src.artifact_store import save_artifact
+from src.matrix_cache import matrix_cache, transformer_signature
 
 import pandas as pd
 import numpy as np
@@ -11,6 +12,8 @@ from sklearn.preprocessing import StandardScaler
 from sklearn.pipeline import Pipeline
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..')))
+# source hashed into the matrix cache key
+TRANSFORMATION_CODE = [os.path.abspath(__file__)]
 
 @dataclass
 class DataTransformationConfig:
@@ -40,14 +43,24 @@ class DataTransformation:
         except Exception as e:
             raise CustomException(e,sys)
     
-    def initiate_data_transformation(self,train_path,test_path):
+    def initiate_data_transformation(self,train_path,test_path, use_cache=True):
+        '''
+        Returns (X_train, y_train), (X_test, y_test), memory mapped from the
+        matrix cache when the CSVs and the preprocessor did not change.
+        '''
         try:
+            preprocessing_obj = self.get_data_transformer_object()
+
+            artifact_paths = [self.data_transformation_config.preprocessor_obj_file_path]
+            cache_key = matrix_cache.key([train_path, test_path], transformer_signature(preprocessing_obj), TRANSFORMATION_CODE)
+            cached = matrix_cache.load("diabetes", cache_key, artifact_paths) if use_cache else None
+            if cached is not None:
+                return cached
+
             train_df = pd.read_csv(train_path)
             test_df = pd.read_csv(test_path)
             logging.info("Data loaded successfully")
 
-            preprocessing_obj = self.get_data_transformer_object()
-
             target_column_name = "Outcome"
 
             input_feature_train_df = train_df.drop(columns=[target_column_name])
@@ -61,19 +74,22 @@ class DataTransformation:
             input_feature_train_arr = preprocessing_obj.fit_transform(input_feature_train_df)
             input_feature_test_arr = preprocessing_obj.transform(input_feature_test_df)
 
-            train_arr = np.c_[input_feature_train_arr, np.array(target_feature_train_df)]
-            test_arr = np.c_[input_feature_test_arr, np.array(target_feature_test_df)]
+            # float64 labels like the combined arrays had, the models' classes stay the same
+            train = (input_feature_train_arr, target_feature_train_df.to_numpy(dtype=np.float64))
+            test = (input_feature_test_arr, target_feature_test_df.to_numpy(dtype=np.float64))
 
             logging.info("saving preprocessing object")
 
-            save_object(
+            save_artifact(
                 file_path = self.data_transformation_config.preprocessor_obj_file_path,
                 obj = preprocessing_obj
             )
 
+            matrix_cache.save("diabetes", cache_key, train, test, artifact_paths)
+
             return(
-                train_arr,
-                test_arr,
+                train,
+                test,
             )
         except Exception as e:
             raise CustomException(e,sys)
\ No newline at end of file
@@ -3,7 +3,9 @@ import sys
 from dataclasses import dataclass
 from src.exception import CustomException
 from src.logger import logging
-from src.utils import save_object,evaluate_models
+from src.utils import evaluate_models, split_features_target
+from src.artifact_store import save_artifact
+from src.compact_models import compact_model_config, export_compact_model
 
 from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score, roc_auc_score
 from sklearn.ensemble import AdaBoostClassifier
@@ -20,12 +22,8 @@ class ModelTrainer:
     
     def initiate_model_trainer(self, train_array, test_array):
         try:
-            X_train, y_train, X_test, y_test = (
-                train_array[:, :-1],
-                train_array[:, -1],
-                test_array[:, :-1],
-                test_array[:, -1]
-            )
+            X_train, y_train = split_features_target(train_array)
+            X_test, y_test = split_features_target(test_array)
             logging.info("Model training initiated")
 
             models = {
@@ -49,12 +47,16 @@ class ModelTrainer:
             )
             logging.info(f"Model Report: {model_report}")
 
-            save_object(
+            save_artifact(
                 file_path=self.model_trainer_config.trained_model_file_path,
                 obj=best_model
             )
             logging.info("Model saved successfully")
 
+            # float32 version for inference, only saved when it predicts the test split alike
+            if compact_model_config.enabled:
+                export_compact_model(best_model, self.model_trainer_config.trained_model_file_path, X_test, y_test)
+
             predictions = best_model.predict(X_test)
             accuracy = accuracy_score(y_test, predictions)
             logging.info(f"Model training completed. Accuracy: {accuracy}")
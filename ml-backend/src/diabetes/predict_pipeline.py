@@ -4,29 +4,125 @@ import numpy as np
 import pandas as pd
 from src.exception import CustomException
 from src.logger import logging
-from src.utils import load_object
+from src.model_registry import model_registry
+from src.profiling import stage
+from src.compact_models import compact_path, serving_model
+from dataclasses import dataclass
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..')))
 
+@dataclass
+class PredictPipelineConfig:
+    model_name: str = "diabetes"
+    model_path: str = os.path.join("artifacts", "diabetes_model.pkl")
+    preprocessor_path: str = os.path.join("artifacts", "diabetes_preprocessor.pkl")
+    # single records skip pandas and go straight to a float64 row
+    fast_inference: bool = os.environ.get("FAST_INFERENCE", "1") != "0"
+
+# Columns in the order the preprocessor was fitted on
+FEATURE_COLUMNS = [
+    "Pregnancies", "Glucose", "BloodPressure", "SkinThickness",
+    "Insulin", "BMI", "DiabetesPedigreeFunction", "Age"
+]
+
 class PredictPipeline:
     def __init__(self):
-        pass
+        self.predict_pipeline_config = PredictPipelineConfig()
+        model_registry.register(
+            self.predict_pipeline_config.model_name,
+            {
+                "model": self.predict_pipeline_config.model_path,
+                "preprocessor": self.predict_pipeline_config.preprocessor_path,
+                "compact_model": compact_path(self.predict_pipeline_config.model_path),
+            },
+            optional=["compact_model"]
+        )
 
     def predict(self,features):
         try:
-            model_path = os.path.join("artifacts", "diabetes_model.pkl")
-            preprocessor_path = os.path.join("artifacts", "diabetes_preprocessor.pkl")
-
-            model = load_object(model_path)
-            preprocessor = load_object(preprocessor_path)
+            artifacts = model_registry.get(self.predict_pipeline_config.model_name)
+            model = serving_model(artifacts, self.predict_pipeline_config.model_path)
+            preprocessor = artifacts["preprocessor"]
 
-            data_scaled = preprocessor.transform(features)
-            preds = model.predict(data_scaled)
+            with stage("transform"):
+                data_scaled = preprocessor.transform(features)
+            with stage("predict"):
+                preds = model.predict(data_scaled)
             return preds
         
         except Exception as e:
             raise CustomException(e,sys)
-        
+
+    def predict_data(self, custom_data):
+        '''
+        Predicts a single CustomData record, without pandas when the RowScaler
+        is enabled and verified for the loaded preprocessor.
+        '''
+        try:
+            artifacts = model_registry.get(self.predict_pipeline_config.model_name)
+            scaler = None
+            if self.predict_pipeline_config.fast_inference:
+                scaler = artifacts.derived("row_scaler", build_row_scaler)
+
+            if scaler is None:
+                with stage("frame"):
+                    features = custom_data.get_data_as_data_frame()
+                return self.predict(features)
+
+            with stage("frame"):
+                row = custom_data.get_data_as_array()
+            with stage("transform"):
+                data_scaled = scaler.transform(row)
+            with stage("predict"):
+                model = serving_model(artifacts, self.predict_pipeline_config.model_path)
+                return model.predict(data_scaled)
+
+        except Exception as e:
+            raise CustomException(e,sys)
+
+class RowScaler:
+    '''
+    The fitted StandardScaler as two arrays, applied with the same float64
+    operations as preprocessor.transform.
+    '''
+    def __init__(self, preprocessor):
+        if len(preprocessor.steps) != 1 or preprocessor.steps[0][0] != 'scaler':
+            raise ValueError("Expected a pipeline with a single scaler step")
+        if list(preprocessor.feature_names_in_) != FEATURE_COLUMNS:
+            raise ValueError("Preprocessor was fitted on a different column order")
+
+        scaler = preprocessor.named_steps['scaler']
+        if not (scaler.with_mean and scaler.with_std):
+            raise ValueError("Only standard scalers with mean and std are supported")
+        self.mean = scaler.mean_
+        self.scale = scaler.scale_
+
+    def transform(self, row):
+        return ((row - self.mean) / self.scale).reshape(1, -1)
+
+def build_row_scaler(artifacts):
+    '''
+    Builds the RowScaler for a loaded bundle and checks it against the
+    DataFrame route bit for bit, None falls back to the DataFrame route.
+    '''
+    preprocessor = artifacts["preprocessor"]
+    try:
+        scaler = RowScaler(preprocessor)
+        probes = [
+            CustomData(6, 148, 72, 35, 0, 33.6, 0.627, 50),
+            CustomData(0, 0, 0, 0, 0, 0.0, 0.0, 0),
+            CustomData(17, 199, 122, 99, 846, 67.1, 2.42, 81),
+        ]
+        for custom_data in probes:
+            expected = preprocessor.transform(custom_data.get_data_as_data_frame())
+            actual = scaler.transform(custom_data.get_data_as_array())
+            if expected.dtype != actual.dtype or expected.tobytes() != actual.tobytes():
+                raise ValueError("RowScaler output differs from preprocessor.transform")
+        return scaler
+    except Exception as e:
+        logging.warning(f"Fast diabetes inference disabled for version {artifacts.version}: {e}")
+        return None
+
 class CustomData:
     def __init__(self,
                 Pregnancies: int,
@@ -64,3 +160,13 @@ class CustomData:
         
         except Exception as e:
             raise CustomException(e,sys)
+
+    def get_data_as_array(self):
+        try:
+            row = np.empty(len(FEATURE_COLUMNS), dtype=np.float64)
+            for i, column in enumerate(FEATURE_COLUMNS):
+                row[i] = getattr(self, column)
+            return row
+
+        except Exception as e:
+            raise CustomException(e,sys)
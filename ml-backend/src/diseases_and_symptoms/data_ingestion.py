@@ -6,9 +6,11 @@ from src.exception import CustomException
 from src.logger import logging
 from sklearn.model_selection import train_test_split
 from dataclasses import dataclass
+from src.streaming_ingestion import streaming_ingestion_config, stream_split_csv
 
 from src.diseases_and_symptoms.data_transformation import DataTransformation
 from src.diseases_and_symptoms.data_transformation import DataTransformationConfig
+from src.diseases_and_symptoms.data_transformation import symptom_dtypes
 
 from src.diseases_and_symptoms.model_trainer import ModelTrainer
 from src.diseases_and_symptoms.model_trainer import ModelTrainerConfig
@@ -19,6 +21,7 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),'../../..
 class DataIngestionConfig:
     train_data_path: str = os.path.join('artifacts_dataset',"diseases_and_symptoms_train.csv")
     test_data_path: str = os.path.join('artifacts_dataset',"diseases_and_symptoms_test.csv")
+    dataset_path: str = os.path.join(streaming_ingestion_config.datasets_dir, "Diseases_and_Symptoms.csv")
 
 class DataIngestion:
     def __init__(self):
@@ -27,20 +30,33 @@ class DataIngestion:
     def initiate_data_ingestion(self):
         logging.info("Entered the diseases and symptoms data ingestion method or component")
         try:
-            # df = pd.read_csv('notebooks\datasets\Diseases_and_Symptoms.csv')
-            df = pd.read_csv('notebooks\\datasets\\Diseases_and_Symptoms.csv')
+            if streaming_ingestion_config.mode == "stream":
+                # chunk by chunk, the whole dataset is never in memory
+                stream_split_csv(
+                    self.ingestion_config.dataset_path,
+                    self.ingestion_config.train_data_path,
+                    self.ingestion_config.test_data_path,
+                    target="diseases",
+                    test_size=0.3,
+                    dtypes=symptom_dtypes(self.ingestion_config.dataset_path),
+                    seed=42
+                )
+            else:
+                # uint8 symptoms instead of int64, an eighth of the memory
+                dataset_path = self.ingestion_config.dataset_path
+                df = pd.read_csv(dataset_path, dtype=symptom_dtypes(dataset_path))
 
-            logging.info("Read the dataset as dataframe")
+                logging.info("Read the dataset as dataframe")
 
-            os.makedirs(os.path.dirname(self.ingestion_config.train_data_path),exist_ok=True)
+                os.makedirs(os.path.dirname(self.ingestion_config.train_data_path),exist_ok=True)
 
-            logging.info("Train test split initiated")
+                logging.info("Train test split initiated")
 
-            train_set,test_set = train_test_split(df,test_size=0.3,stratify=df['diseases'],random_state=42)
+                train_set,test_set = train_test_split(df,test_size=0.3,stratify=df['diseases'],random_state=42)
 
-            train_set.to_csv(self.ingestion_config.train_data_path,index=False,header=True)
+                train_set.to_csv(self.ingestion_config.train_data_path,index=False,header=True)
 
-            test_set.to_csv(self.ingestion_config.test_data_path,index=False,header=True)
+                test_set.to_csv(self.ingestion_config.test_data_path,index=False,header=True)
 
             logging.info("Inagestion of the data is completed")
 
@@ -58,9 +74,6 @@ if __name__ == "__main__":
     data_transformation = DataTransformation()
     train_arr, test_arr = data_transformation.initiate_data_transformation(train_data, test_data)
 
-    '''
-    donot try to run this code as it will take a lot of time to train the model,
-    it break the laptop
-    '''
-    # model_trainer = ModelTrainer()
-    # print(model_trainer.initiate_model_trainer(train_arr, test_arr))
+    # sparse matrices and the saga solver, a few minutes and well under a GB
+    model_trainer = ModelTrainer()
+    print(model_trainer.initiate_model_trainer(train_arr, test_arr))
@@ -3,59 +3,93 @@ import sys
 from dataclasses import dataclass
 from src.exception import CustomException
 from src.logger import logging
-from src.utils import save_object
+from src.artifact_store import save_artifact
+from src.matrix_cache import matrix_cache
 
 import pandas as pd
 import numpy as np
+from scipy import sparse
 from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import LabelEncoder
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..')))
 
+TARGET_COLUMN = "diseases"
+# the encoding is code, not transformer parameters, so its source keys the matrix cache
+TRANSFORMATION_CODE = [os.path.abspath(__file__)]
+
 @dataclass
 class DataTransformationConfig:
     preprocessor_obj_file_path = os.path.join("artifacts", "diseases_and_symptoms_preprocessor.pkl")
+    # rows parsed at a time, only one chunk is ever held densely
+    chunk_rows: int = int(os.environ.get("SYMPTOMS_CHUNK_ROWS", 50000))
+
+def symptom_dtypes(file_path):
+    '''
+    Column dtypes of a symptoms CSV: the 0/1 symptom columns as uint8 and the
+    diseases column as str, instead of pandas' int64 and object guesses.
+    '''
+    columns = pd.read_csv(file_path, nrows=0).columns
+    return {col: (str if col == TARGET_COLUMN else np.uint8) for col in columns}
+
+def read_symptoms_sparse(file_path, chunk_rows):
+    '''
+    Reads a symptoms CSV into a uint8 CSR matrix of the symptom columns and
+    an array of the diseases, chunk by chunk.
+    '''
+    dtypes = symptom_dtypes(file_path)
+    n_features = len(dtypes) - 1
+    blocks, targets = [], []
+    for chunk in pd.read_csv(file_path, dtype=dtypes, chunksize=chunk_rows):
+        targets.append(chunk.pop(TARGET_COLUMN).to_numpy())
+        blocks.append(sparse.csr_matrix(chunk.to_numpy(dtype=np.uint8)))
+    if not blocks:
+        return sparse.csr_matrix((0, n_features), dtype=np.uint8), np.array([], dtype=object)
+    return sparse.vstack(blocks, format="csr"), np.concatenate(targets)
 
 class DataTransformation:
     def __init__(self):
         self.data_transformation_config = DataTransformationConfig()
 
-    def initiate_data_transformation(self, train_path, test_path):
+    def initiate_data_transformation(self, train_path, test_path, use_cache=True):
+        '''
+        Returns (X_train, y_train), (X_test, y_test): uint8 CSR symptom matrices
+        and int32 encoded diseases, memory mapped from the matrix cache when
+        the CSVs did not change.
+        '''
         try:
-            # Load the datasets
-            train_df = pd.read_csv(train_path)
-            test_df = pd.read_csv(test_path)
-            logging.info("Data loaded successfully")
-
-            # Target column
-            target_column_name = "diseases"
+            artifact_paths = [self.data_transformation_config.preprocessor_obj_file_path]
+            cache_key = matrix_cache.key([train_path, test_path], "uint8 csr|LabelEncoder int32", TRANSFORMATION_CODE)
+            cached = matrix_cache.load("diseases_and_symptoms", cache_key, artifact_paths) if use_cache else None
+            if cached is not None:
+                return cached
 
-            # Split into input and target features
-            input_feature_train_df = train_df.drop(columns=[target_column_name])
-            target_feature_train_df = train_df[target_column_name]
-
-            input_feature_test_df = test_df.drop(columns=[target_column_name])
-            target_feature_test_df = test_df[target_column_name]
+            # Load the datasets
+            chunk_rows = self.data_transformation_config.chunk_rows
+            X_train, target_feature_train = read_symptoms_sparse(train_path, chunk_rows)
+            X_test, target_feature_test = read_symptoms_sparse(test_path, chunk_rows)
+            logging.info(
+                f"Data loaded successfully: {X_train.shape} train and {X_test.shape} test, "
+                f"{X_train.nnz + X_test.nnz} symptoms present"
+            )
 
             # Encode target column using LabelEncoder
             label_encoder = LabelEncoder()
-            target_feature_train_arr = label_encoder.fit_transform(target_feature_train_df)
-            target_feature_test_arr = label_encoder.transform(target_feature_test_df)
+            y_train = label_encoder.fit_transform(target_feature_train).astype(np.int32)
+            y_test = label_encoder.transform(target_feature_test).astype(np.int32)
 
             logging.info("Target column encoded successfully")
 
-            # Combine input features and target labels
-            train_arr = np.c_[input_feature_train_df.to_numpy(), target_feature_train_arr]
-            test_arr = np.c_[input_feature_test_df.to_numpy(), target_feature_test_arr]
-
             # Save LabelEncoder object
-            save_object(
+            save_artifact(
                 file_path=self.data_transformation_config.preprocessor_obj_file_path,
                 obj=label_encoder
             )
 
             logging.info("Preprocessor object saved successfully")
 
-            return train_arr, test_arr
+            matrix_cache.save("diseases_and_symptoms", cache_key, (X_train, y_train), (X_test, y_test), artifact_paths)
+
+            return (X_train, y_train), (X_test, y_test)
         except Exception as e:
             raise CustomException(e, sys)
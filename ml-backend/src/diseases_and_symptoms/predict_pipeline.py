@@ -2,12 +2,13 @@ import os
 import sys
 import numpy as np
 import pandas as pd
-import json
-from sklearn.linear_model import LogisticRegression
-from sklearn.preprocessing import LabelEncoder
+from scipy import sparse
 from src.exception import CustomException
 from src.logger import logging
-from src.utils import load_object
+from src.model_registry import model_registry
+from src.profiling import stage
+from src.compact_models import compact_path, serving_model
+from dataclasses import dataclass
 import warnings
 
 # Suppress all warnings
@@ -15,10 +16,157 @@ warnings.filterwarnings("ignore")
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..')))
 
+class SymptomVocabulary:
+    '''
+    symptoms.csv (the model's feature columns in training order) loaded once,
+    with a dict from symptom to feature column.
+    '''
+    def __init__(self, symptoms):
+        self.symptoms = list(symptoms)
+        self.index = {symptom: column for column, symptom in enumerate(self.symptoms)}
+
+    @classmethod
+    def load(cls, file_path):
+        return cls(pd.read_csv(file_path)["symptom"].tolist())
+
+    def __len__(self):
+        return len(self.symptoms)
+
+    def __contains__(self, symptom):
+        return symptom in self.index
+
+    def featurize(self, symptoms_list):
+        '''
+        Sorted feature columns of the known symptoms, unknown ones are ignored
+        like they always were.
+        '''
+        return np.array(sorted({self.index[s] for s in symptoms_list if s in self.index}), dtype=np.intp)
+
+    def featurize_batch(self, symptoms_lists):
+        '''
+        Binary CSR matrix with one row per symptoms list.
+        '''
+        indices = [self.featurize(symptoms_list) for symptoms_list in symptoms_lists]
+        indptr = np.zeros(len(indices) + 1, dtype=np.intp)
+        np.cumsum([len(row) for row in indices], out=indptr[1:])
+        columns = np.concatenate(indices) if indices else np.zeros(0, dtype=np.intp)
+        data = np.ones(len(columns), dtype=np.float64)
+        return sparse.csr_matrix((data, columns, indptr), shape=(len(indices), len(self.symptoms)))
+
+class SparseLinearScorer:
+    '''
+    Scores the logistic regression from the feature columns of the present
+    symptoms only: intercept + the sum of 3-5 coefficient rows instead of a
+    dense dot product over every symptom.
+    '''
+    def __init__(self, model):
+        estimator = model
+        if hasattr(model, "steps"):
+            if any(step not in (None, "passthrough") for _, step in model.steps[:-1]):
+                raise ValueError("Only pipelines with a single linear model step are supported")
+            estimator = model.steps[-1][1]
+        if not hasattr(estimator, "coef_") or not hasattr(estimator, "intercept_"):
+            raise ValueError("Model is not linear")
+
+        # one contiguous row of class scores per symptom
+        self.coef_t = np.ascontiguousarray(estimator.coef_.T)
+        self.intercept = np.asarray(estimator.intercept_)
+        self.classes = estimator.classes_
+        self.binary = self.coef_t.shape[1] == 1
+
+        # same rule LogisticRegression.predict_proba uses to pick one-vs-rest
+        # (normalized sigmoids) or multinomial (softmax) probabilities
+        multi_class = getattr(estimator, "multi_class", "ovr")
+        self.ovr = multi_class in ("ovr", "warn") or (
+            multi_class in ("auto", "deprecated")
+            and (self.classes.size <= 2 or getattr(estimator, "solver", None) == "liblinear")
+        )
+
+    def decision_function(self, indices):
+        return self.intercept + self.coef_t[indices].sum(axis=0)
+
+    def decision_function_batch(self, X):
+        return np.asarray(X @ self.coef_t) + self.intercept
+
+    def _labels(self, scores):
+        if self.binary:
+            return self.classes[(scores[..., 0] > 0).astype(np.intp)]
+        return self.classes[np.argmax(scores, axis=-1)]
+
+    def predict(self, indices):
+        return self._labels(self.decision_function(indices))
+
+    def scores_2d(self, scores):
+        '''
+        Decision scores with one column per class, also for binary models.
+        '''
+        scores = np.atleast_2d(scores)
+        if self.binary:
+            return np.c_[-scores[:, 0], scores[:, 0]]
+        return scores
+
+    def proba_from_scores(self, scores):
+        if self.ovr:
+            prob = 1.0 / (1.0 + np.exp(-np.atleast_2d(scores)))
+            if self.binary:
+                return np.c_[1 - prob[:, 0], prob[:, 0]]
+            return prob / prob.sum(axis=1, keepdims=True)
+        scores = self.scores_2d(scores)
+        exp = np.exp(scores - scores.max(axis=1, keepdims=True))
+        return exp / exp.sum(axis=1, keepdims=True)
+
+    def predict_batch(self, X):
+        return self._labels(self.decision_function_batch(X))
+
+def build_sparse_scorer(artifacts, model=None):
+    '''
+    Builds the SparseLinearScorer for a loaded bundle (or its compact model)
+    and checks it agrees with model.predict on probe symptom sets, None falls
+    back to dense scoring.
+    '''
+    model = artifacts["model"] if model is None else model
+    vocabulary = artifacts["symptoms"]
+    try:
+        scorer = SparseLinearScorer(model)
+        rng = np.random.default_rng(0)
+        probes = [rng.choice(len(vocabulary), size=rng.integers(3, 6), replace=False) for _ in range(64)]
+        X = vocabulary.featurize_batch([[vocabulary.symptoms[i] for i in probe] for probe in probes])
+        expected = model.predict(X.toarray())
+        if not np.array_equal(scorer.predict_batch(X), expected):
+            raise ValueError("Sparse scores disagree with model.predict")
+        if not all(scorer.predict(np.sort(probe)) == label for probe, label in zip(probes, expected)):
+            raise ValueError("Sparse scores disagree with model.predict")
+        return scorer
+    except Exception as e:
+        logging.warning(f"Sparse disease scoring disabled for version {artifacts.version}: {e}")
+        return None
+
+@dataclass
+class PredictPipelineConfig:
+    model_name: str = "diseases_and_symptoms"
+    model_path: str = os.path.join("artifacts", "Diseases_and_Symptoms_model.pkl")
+    preprocessor_path: str = os.path.join("artifacts", "diseases_and_symptoms_preprocessor.pkl")
+    symptoms_path: str = os.path.join("artifacts", "symptoms.csv")
+
 # PredictPipeline Class
 class PredictPipeline:
     def __init__(self):
-        pass
+        self.predict_pipeline_config = PredictPipelineConfig()
+        model_registry.register(
+            self.predict_pipeline_config.model_name,
+            {
+                "model": self.predict_pipeline_config.model_path,
+                "preprocessor": self.predict_pipeline_config.preprocessor_path,
+                "symptoms": self.predict_pipeline_config.symptoms_path,
+                "compact_model": compact_path(self.predict_pipeline_config.model_path),
+            },
+            loaders={"symptoms": SymptomVocabulary.load},
+            optional=["compact_model"]
+        )
+
+    def _model_and_scorer(self, artifacts):
+        model = serving_model(artifacts, self.predict_pipeline_config.model_path)
+        return model, artifacts.derived("sparse_scorer", lambda bundle: build_sparse_scorer(bundle, model))
 
     def predict(self, symptoms_list):
         try:
@@ -26,29 +174,26 @@ class PredictPipeline:
             if len(symptoms_list) < 3 or len(symptoms_list) > 5:
                 raise ValueError("Please provide between 3 and 5 symptoms.")
 
-            # Paths to artifacts
-            model_path = os.path.join("artifacts", "Diseases_and_Symptoms_model.pkl")
-            preprocessor_path = os.path.join("artifacts", "diseases_and_symptoms_preprocessor.pkl")
-            symptoms_path = os.path.join("artifacts", "symptoms.csv")
-
-            # Load model and label encoder
-            model = load_object(model_path)
-            preprocessor = load_object(preprocessor_path)
+            # Model, label encoder and symptoms mapping are loaded once per worker
+            artifacts = model_registry.get(self.predict_pipeline_config.model_name)
+            model, scorer = self._model_and_scorer(artifacts)
+            preprocessor = artifacts["preprocessor"]
             # it have label encoder for diseases
+            vocabulary = artifacts["symptoms"]
 
-            # Load symptoms mapping
-            symptoms_df = pd.read_csv(symptoms_path)
-            symptoms = symptoms_df["symptom"].tolist()
-
-            # Create a binary feature vector for symptoms
-            feature_vector = np.zeros(len(symptoms))
-            for symptom in symptoms_list:
-                if symptom in symptoms:
-                    feature_vector[symptoms.index(symptom)] = 1
+            # Feature columns of the given symptoms
+            custom_data = CustomData(symptoms_list)
+            with stage("frame"):
+                indices = custom_data.get_data_as_indices(vocabulary)
 
             # Predict disease
-            predicted_label = model.predict([feature_vector])[0]
-            predicted_disease = preprocessor.inverse_transform([predicted_label])[0]
+            with stage("predict"):
+                if scorer is not None:
+                    predicted_label = scorer.predict(indices)
+                else:
+                    predicted_label = model.predict([custom_data.get_data_as_array(vocabulary)])[0]
+            with stage("inverse_transform"):
+                predicted_disease = preprocessor.inverse_transform([predicted_label])[0]
 
             return predicted_disease
 
@@ -59,17 +204,115 @@ class PredictPipeline:
             logging.error(f"Error in PredictPipeline: {e}")
             raise CustomException(e, sys)
 
+    def predict_batch(self, symptoms_lists):
+        '''
+        Predicts one disease per (already validated) symptoms list with a single
+        model.predict and inverse_transform call for the whole batch.
+        '''
+        try:
+            artifacts = model_registry.get(self.predict_pipeline_config.model_name)
+            model, scorer = self._model_and_scorer(artifacts)
+            preprocessor = artifacts["preprocessor"]
+            vocabulary = artifacts["symptoms"]
+
+            # One sparse binary feature row per symptoms list
+            with stage("frame"):
+                features = vocabulary.featurize_batch(symptoms_lists)
+
+            with stage("predict"):
+                if scorer is not None:
+                    predicted_labels = scorer.predict_batch(features)
+                else:
+                    predicted_labels = model.predict(features.toarray())
+            with stage("inverse_transform"):
+                return preprocessor.inverse_transform(predicted_labels)
+
+        except Exception as e:
+            logging.error(f"Error in PredictPipeline: {e}")
+            raise CustomException(e, sys)
+
+    def predict_top_k(self, symptoms_list, k):
+        '''
+        Differential diagnosis for one (already validated) symptoms list, see
+        predict_top_k_batch.
+        '''
+        return self.predict_top_k_batch([symptoms_list], k)[0]
+
+    def predict_top_k_batch(self, symptoms_lists, k):
+        '''
+        Returns per symptoms list the k most likely diseases as
+        [(disease, probability), ...], most likely first. The first entry is
+        the disease predict() returns. Classes are ranked with argpartition on
+        the decision scores, only the k winners get sorted, and all labels are
+        decoded with one LabelEncoder.inverse_transform call.
+        '''
+        try:
+            artifacts = model_registry.get(self.predict_pipeline_config.model_name)
+            model, scorer = self._model_and_scorer(artifacts)
+            preprocessor = artifacts["preprocessor"]
+            vocabulary = artifacts["symptoms"]
+
+            if scorer is not None:
+                with stage("frame"):
+                    if len(symptoms_lists) == 1:
+                        features = vocabulary.featurize(symptoms_lists[0])
+                    else:
+                        features = vocabulary.featurize_batch(symptoms_lists)
+                with stage("predict"):
+                    if len(symptoms_lists) == 1:
+                        scores = scorer.decision_function(features)
+                    else:
+                        scores = scorer.decision_function_batch(features)
+                    probabilities = scorer.proba_from_scores(scores)
+                    scores = scorer.scores_2d(scores)
+                classes = scorer.classes
+            else:
+                with stage("frame"):
+                    features = vocabulary.featurize_batch(symptoms_lists).toarray()
+                with stage("predict"):
+                    probabilities = model.predict_proba(features)
+                scores = probabilities
+                classes = model.classes_
+
+            with stage("rank"):
+                n_rows, n_classes = scores.shape
+                k = max(1, min(k, n_classes))
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                # ascending class index first, so ties rank like argmax in predict()
+                top.sort(axis=1)
+                order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1, kind="stable")
+                top = np.take_along_axis(top, order, axis=1)
+                top_probabilities = np.take_along_axis(probabilities, top, axis=1)
+
+            with stage("inverse_transform"):
+                diseases = preprocessor.inverse_transform(classes[top].ravel()).reshape(n_rows, k)
+            return [
+                list(zip(row_diseases.tolist(), row_probabilities.tolist()))
+                for row_diseases, row_probabilities in zip(diseases, top_probabilities)
+            ]
+
+        except Exception as e:
+            logging.error(f"Error in PredictPipeline: {e}")
+            raise CustomException(e, sys)
+
 # CustomData Class for Dynamic Input
 class CustomData:
     def __init__(self, symptoms):
         self.symptoms = symptoms
 
+    def get_data_as_indices(self, vocabulary):
+        try:
+            return vocabulary.featurize(self.symptoms)
+        except Exception as e:
+            logging.error(f"Error in CustomData: {e}")
+            raise CustomException(e, sys)
+
     def get_data_as_array(self, all_symptoms):
         try:
+            if not isinstance(all_symptoms, SymptomVocabulary):
+                all_symptoms = SymptomVocabulary(all_symptoms)
             feature_vector = np.zeros(len(all_symptoms))
-            for symptom in self.symptoms:
-                if symptom in all_symptoms:
-                    feature_vector[all_symptoms.index(symptom)] = 1
+            feature_vector[all_symptoms.featurize(self.symptoms)] = 1
             return feature_vector
         except Exception as e:
             logging.error(f"Error in CustomData: {e}")
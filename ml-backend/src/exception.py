@@ -1,22 +1,45 @@
 import sys
 from src.logger import logging
 
-def error_message_detail(error,error_detail:sys):
-    _,_,exc_tb=error_detail.exc_info()
+def _format_error(error,exc_tb):
+    if exc_tb is None:
+        return str(error)
     file_name=exc_tb.tb_frame.f_code.co_filename
     error_message="Error occured in python script name [{0}] line number [{1}] error message[{2}]".format(
      file_name,exc_tb.tb_lineno,str(error))
 
     return error_message
 
+def error_message_detail(error,error_detail:sys):
+    _,_,exc_tb=error_detail.exc_info()
+    return _format_error(error,exc_tb)
+
 class CustomException(Exception):
+    '''
+    Keeps the traceback of the exception being handled and builds the detailed
+    message only when it is printed or logged, raising stays cheap.
+    '''
     def __init__(self,error_message,error_detail:sys):
         super().__init__(error_message)
-        self.error_message=error_message_detail(error_message,error_detail=error_detail)
+        self.error=error_message
+        self.error_traceback=error_detail.exc_info()[2]
+        self._error_message=None
+
+    @property
+    def error_message(self):
+        if self._error_message is None:
+            self._error_message=_format_error(self.error,self.error_traceback)
+        return self._error_message
     
     def __str__(self):
         return self.error_message
 
+class ValidationError(ValueError):
+    '''
+    Raised for malformed prediction input, the routes answer it with a 400.
+    '''
+    pass
+
 # if __name__=="__main__":
 #     try:
 #         a=1/0
@@ -0,0 +1,264 @@
+'''
+Folds newly labelled predictions into the current diabetes or symptoms model
+without a full retrain.
+
+    python -m src.incremental_training diseases_and_symptoms labels.jsonl
+    python -m src.incremental_training diabetes labels.jsonl --dry-run
+
+The labels file has one JSON record per line:
+- diseases_and_symptoms: the symptoms of a stored prediction and the disease
+  the clinician confirmed, {"symptoms": [...], "confirmedDisease": "..."}
+- diabetes: the fields of the prediction request and the confirmed
+  outcome, {"Pregnancies": 2, ..., "Age": 31, "Outcome": 1}
+--label-field picks another label field. Records that fail the prediction
+endpoints' validation or name a disease the model does not know are skipped.
+
+Updates use partial_fit of an SGD logistic model, SGDClassifier(loss="log_loss"):
+- a model that is one already continues from its state
+- a LogisticRegression becomes one that starts from its coefficients (the
+  same predictions until the first update)
+- any other model (the AdaBoost diabetes model) is replaced by one trained
+  on the pipeline's train split in artifacts_dataset/ first
+
+A hash split of the new records (INCREMENTAL_HOLDOUT) and the pipeline's
+test split are held out. The update is published as a new artifact version
+only when its accuracy on each of them is at most
+INCREMENTAL_MAX_ACCURACY_DROP below the current model's. Running servers
+pick the new version up with their artifact reload.
+'''
+import os
+import sys
+import copy
+import json
+import time
+import argparse
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+from src.exception import CustomException, ValidationError
+from src.logger import logging
+from src.artifact_store import save_artifact
+from src.streaming_ingestion import StratifiedHashSplitter
+from src import prediction_service
+
+@dataclass
+class IncrementalTrainingConfig:
+    epochs: int = int(os.environ.get("INCREMENTAL_EPOCHS", 5))
+    learning_rate: float = float(os.environ.get("INCREMENTAL_LEARNING_RATE", 0.01))
+    alpha: float = float(os.environ.get("INCREMENTAL_ALPHA", 1e-5))
+    # share of the new records held out for the accuracy check
+    holdout: float = float(os.environ.get("INCREMENTAL_HOLDOUT", 0.2))
+    max_accuracy_drop: float = float(os.environ.get("INCREMENTAL_MAX_ACCURACY_DROP", 0.0))
+    # epochs over the train split when a model without partial_fit is replaced
+    bootstrap_epochs: int = int(os.environ.get("INCREMENTAL_BOOTSTRAP_EPOCHS", 20))
+    dataset_dir: str = "artifacts_dataset"
+    seed: int = 42
+
+
+class DiabetesUpdates:
+    name = "diabetes"
+    label_field = "Outcome"
+    pipeline = prediction_service.diabetes_pipeline
+
+    def __init__(self, bundle):
+        self.preprocessor = bundle["preprocessor"]
+        self.columns = self.pipeline.module.FEATURE_COLUMNS
+
+    def featurize(self, records, label_field):
+        rows, labels, skipped = [], [], 0
+        for record in records:
+            try:
+                row = prediction_service.validate_diabetes_record(record)
+                label = float(record[label_field])
+            except (ValidationError, KeyError, TypeError, ValueError):
+                skipped += 1
+                continue
+            if label not in (0.0, 1.0):
+                skipped += 1
+                continue
+            rows.append(row)
+            labels.append(label)
+        X = self.preprocessor.transform(pd.DataFrame.from_records(rows, columns=self.columns))
+        return X, np.array(labels, dtype=np.float64), skipped
+
+    def read_split(self, file_path):
+        df = pd.read_csv(file_path)
+        return self.preprocessor.transform(df[self.columns]), df["Outcome"].to_numpy(dtype=np.float64)
+
+
+class SymptomUpdates:
+    name = "diseases_and_symptoms"
+    label_field = "confirmedDisease"
+    pipeline = prediction_service.disease_pipeline
+
+    def __init__(self, bundle):
+        self.label_encoder = bundle["preprocessor"]
+        self.vocabulary = bundle["symptoms"]
+        self.known = set(self.label_encoder.classes_.tolist())
+
+    def featurize(self, records, label_field):
+        symptoms_lists, labels, skipped = [], [], 0
+        for record in records:
+            try:
+                symptoms_list = prediction_service.validate_symptoms(record)
+                label = record[label_field]
+            except (ValidationError, KeyError, TypeError):
+                skipped += 1
+                continue
+            # a new disease needs a new label encoder, that is a full retrain
+            if label not in self.known:
+                skipped += 1
+                continue
+            symptoms_lists.append(symptoms_list)
+            labels.append(label)
+        X = self.vocabulary.featurize_batch(symptoms_lists)
+        return X, self.label_encoder.transform(labels) if labels else np.array([], dtype=np.int64), skipped
+
+    def read_split(self, file_path):
+        from src.diseases_and_symptoms.data_transformation import read_symptoms_sparse
+        X, diseases = read_symptoms_sparse(file_path, chunk_rows=50000)
+        if X.shape[1] != len(self.vocabulary):
+            raise ValueError(f"{file_path} has {X.shape[1]} symptom columns, the model {len(self.vocabulary)}")
+        return X, self.label_encoder.transform(diseases)
+
+
+UPDATERS = {updates.name: updates for updates in (DiabetesUpdates, SymptomUpdates)}
+
+
+class IncrementalTrainer:
+    def __init__(self, model_name):
+        self.incremental_training_config = IncrementalTrainingConfig()
+        self.updates_class = UPDATERS[model_name]
+
+    def _accuracy(self, model, X, y):
+        return float(np.mean(model.predict(X) == y))
+
+    def _split_path(self, split):
+        return os.path.join(self.incremental_training_config.dataset_dir, f"{self.updates_class.name}_{split}.csv")
+
+    def incremental_model(self, model, updates, X):
+        '''
+        An SGD logistic model to continue training from, never the loaded
+        model itself: it is shared with the serving code and memory mapped.
+        '''
+        from scipy.special import logsumexp
+        from sklearn.linear_model import LogisticRegression, SGDClassifier
+        config = self.incremental_training_config
+        # a Pipeline of nothing but the model, like the shipped symptoms model
+        if hasattr(model, "steps") and all(step in (None, "passthrough") for _, step in model.steps[:-1]):
+            model = model.steps[-1][1]
+        if isinstance(model, SGDClassifier):
+            return copy.deepcopy(model), "continued"
+
+        sgd = SGDClassifier(
+            loss="log_loss", alpha=config.alpha, learning_rate="constant", eta0=config.learning_rate,
+            random_state=config.seed
+        )
+        if isinstance(model, LogisticRegression):
+            # partial_fit keeps coefficients that are set before its first call
+            sgd.coef_ = np.array(model.coef_, dtype=np.float64)
+            sgd.intercept_ = np.array(model.intercept_, dtype=np.float64)
+            if len(model.classes_) > 2:
+                # multinomial scores read as one-vs-rest sigmoids are near 1 for
+                # many classes, minus the typical log partition the sigmoids come
+                # close to the softmax probabilities. The argmax does not change.
+                scores = np.asarray(X @ sgd.coef_.T) + sgd.intercept_
+                sgd.intercept_ -= np.median(logsumexp(scores, axis=1))
+            return sgd, "converted"
+
+        train_path = self._split_path("train")
+        if not os.path.exists(train_path):
+            raise ValueError(f"{type(model).__name__} has no partial_fit, {train_path} is needed to replace it")
+        X, y = updates.read_split(train_path)
+        for _ in range(config.bootstrap_epochs):
+            sgd.partial_fit(X, y.astype(model.classes_.dtype), classes=model.classes_)
+        return sgd, "bootstrapped"
+
+    def update(self, records, label_field=None, dry_run=False):
+        '''
+        Folds the labelled records into the current model, returns a report;
+        the new version is saved unless rejected or dry_run.
+        '''
+        try:
+            config = self.incremental_training_config
+            pipeline = self.updates_class.pipeline
+            bundle = pipeline.bundle()
+            updates = self.updates_class(bundle)
+            current = bundle["model"]
+
+            X, y, skipped = updates.featurize(records, label_field or updates.label_field)
+            y = y.astype(current.classes_.dtype)
+            if len(y) == 0:
+                raise ValueError(f"No usable labelled records, {skipped} skipped")
+            is_holdout = StratifiedHashSplitter(config.holdout, config.seed).assign(y)
+            train_rows, holdout_rows = np.flatnonzero(~is_holdout), np.flatnonzero(is_holdout)
+
+            start = time.perf_counter()
+            model, origin = self.incremental_model(current, updates, X[train_rows])
+            for _ in range(config.epochs):
+                model.partial_fit(X[train_rows], y[train_rows], classes=current.classes_)
+            fit_seconds = time.perf_counter() - start
+
+            holdouts = {}
+            if len(holdout_rows):
+                holdouts["new_records"] = (X[holdout_rows], y[holdout_rows])
+            test_path = self._split_path("test")
+            if os.path.exists(test_path):
+                X_test, y_test = updates.read_split(test_path)
+                holdouts["test_split"] = (X_test, y_test.astype(current.classes_.dtype))
+
+            checks = {}
+            for holdout_name, (X_holdout, y_holdout) in holdouts.items():
+                checks[holdout_name] = {
+                    "rows": int(len(y_holdout)),
+                    "current_accuracy": self._accuracy(current, X_holdout, y_holdout),
+                    "updated_accuracy": self._accuracy(model, X_holdout, y_holdout),
+                }
+            accepted = bool(checks) and all(
+                check["updated_accuracy"] >= check["current_accuracy"] - config.max_accuracy_drop
+                for check in checks.values()
+            )
+
+            report = {
+                "model": updates.name,
+                "current_version": bundle.version,
+                "model_origin": origin,
+                "records": len(records),
+                "skipped": skipped,
+                "trained_rows": int(len(train_rows)),
+                "fit_seconds": fit_seconds,
+                "checks": checks,
+                "accepted": accepted,
+                "published": False,
+            }
+            if not checks:
+                logging.warning(f"No held out data for {updates.name}, update rejected")
+            if accepted and not dry_run:
+                save_artifact(file_path=pipeline.predict_pipeline_config.model_path, obj=model)
+                report["published"] = True
+            logging.info(f"Incremental update of {updates.name}: {report}")
+            return report
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+
+def read_labels(file_path):
+    with open(file_path) as file_obj:
+        return [json.loads(line) for line in file_obj if line.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("model", choices=sorted(UPDATERS))
+    parser.add_argument("labels", help="JSON lines file of labelled records")
+    parser.add_argument("--label-field", help="field of the confirmed label")
+    parser.add_argument("--dry-run", action="store_true", help="check the update without publishing it")
+    args = parser.parse_args()
+
+    report = IncrementalTrainer(args.model).update(read_labels(args.labels), args.label_field, args.dry_run)
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if report["accepted"] else 1)
+
+
+if __name__ == "__main__":
+    main()
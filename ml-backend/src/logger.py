@@ -1,20 +1,197 @@
 import logging
+import logging.handlers
 import os
+import json
+import time
+import uuid
+import queue
+import atexit
+import threading
+import contextvars
+from dataclasses import dataclass
 from datetime import datetime
 
 LOG_FILE=f"{datetime.now().strftime('%m_%d_%Y_%H_%M_%S')}.log"
 logs_path=os.path.join(os.getcwd(),"logs",LOG_FILE)
-os.makedirs(logs_path,exist_ok=True)
 
 LOG_FILE_PATH=os.path.join(logs_path,LOG_FILE)
 
-logging.basicConfig(
-    filename=LOG_FILE_PATH,
-    format="[ %(asctime)s ] %(lineno)d %(name)s - %(levelname)s - %(message)s",
-    level=logging.INFO,
+@dataclass
+class LoggingConfig:
+    # "file": text lines written synchronously by the logging thread
+    # "queue": JSON lines handed to a background writer, never blocks the caller
+    mode: str = os.environ.get("LOG_MODE", "file")
+    queue_size: int = int(os.environ.get("LOG_QUEUE_SIZE", 10000))
+    # size based rotation of the JSON log
+    max_bytes: int = int(os.environ.get("LOG_MAX_BYTES", 10 * 1024 * 1024))
+    backup_count: int = int(os.environ.get("LOG_BACKUP_COUNT", 5))
 
+logging_config = LoggingConfig()
 
-)
+# request id, endpoint, model version, ... of the request being served
+request_context = contextvars.ContextVar("request_context", default=None)
+REQUEST_FIELDS = ("request_id", "endpoint", "model_version", "status", "latency_ms")
+
+
+class LazyFileHandler(logging.FileHandler):
+    '''
+    Creates the log directory and opens the file on the first record instead
+    of at import time, a process that never logs touches no files.
+    '''
+    def __init__(self, filename):
+        super().__init__(filename, delay=True)
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
+
+
+class LazyRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    def __init__(self, filename, max_bytes, backup_count):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, delay=True)
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "line": record.lineno,
+            "message": record.getMessage(),
+        }
+        for field in REQUEST_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+    # runs in the thread that logs, where the request context is visible
+    def filter(self, record):
+        context = request_context.get()
+        if context is not None:
+            for field in REQUEST_FIELDS:
+                if field in context and not hasattr(record, field):
+                    setattr(record, field, context[field])
+        return True
+
+
+class AsyncLogHandler(logging.handlers.QueueHandler):
+    '''
+    Puts records on a bounded queue drained by a QueueListener thread that
+    formats and writes them. When the queue is full the record is dropped and
+    counted, logging never waits for the disk.
+    '''
+    def __init__(self, target_factory, queue_size):
+        super().__init__(queue.Queue(max(1, queue_size)))
+        self.target_factory = target_factory
+        self.dropped = 0
+        self.addFilter(RequestContextFilter())
+        self._listener = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_listener(self):
+        # threads do not survive fork, each worker starts its own writer
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self.queue = queue.Queue(self.queue.maxsize)
+            self._listener = logging.handlers.QueueListener(self.queue, self.target_factory())
+            self._listener.start()
+            self._pid = os.getpid()
+
+    def prepare(self, record):
+        # the record stays in this process, so the message arguments (e.g. a
+        # CustomException) and the traceback are formatted by the listener,
+        # off the request thread
+        return record
+
+    def enqueue(self, record):
+        self._ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def stop(self):
+        # flushes what is queued, e.g. at interpreter exit
+        if self._listener is not None and self._pid == os.getpid():
+            try:
+                self._listener.stop()
+            except queue.Full:
+                pass
+            self._listener = None
+            self._pid = None
+
+    def stats(self):
+        return {"queued": self.queue.qsize(), "dropped": self.dropped, "capacity": self.queue.maxsize}
+
+
+def _json_log_handler():
+    # one file per process, rotating handlers must not share a file
+    file_path = os.path.join(logs_path, f"{os.path.splitext(LOG_FILE)[0]}.{os.getpid()}.jsonl")
+    handler = LazyRotatingFileHandler(file_path, logging_config.max_bytes, logging_config.backup_count)
+    handler.setFormatter(JsonFormatter())
+    return handler
+
+
+if logging_config.mode == "queue":
+    async_log_handler = AsyncLogHandler(_json_log_handler, logging_config.queue_size)
+    atexit.register(async_log_handler.stop)
+    logging.basicConfig(handlers=[async_log_handler], level=logging.INFO)
+else:
+    async_log_handler = None
+    logging.basicConfig(
+        handlers=[LazyFileHandler(LOG_FILE_PATH)],
+        format="[ %(asctime)s ] %(lineno)d %(name)s - %(levelname)s - %(message)s",
+        level=logging.INFO,
+
+
+    )
+
+
+def logging_stats():
+    return async_log_handler.stats() if async_log_handler is not None else {}
+
+
+def start_request(endpoint, request_id=None):
+    '''
+    Binds a request id and the endpoint to everything logged while serving
+    the request, returns the request context.
+    '''
+    context = {"request_id": request_id or uuid.uuid4().hex, "endpoint": endpoint, "started": time.perf_counter()}
+    request_context.set(context)
+    return context
+
+def annotate_request(**fields):
+    context = request_context.get()
+    if context is not None:
+        context.update(fields)
+
+def finish_request(status):
+    '''
+    Logs one access line with status and latency (JSON mode only) and unbinds
+    the request context.
+    '''
+    context = request_context.get()
+    if context is None:
+        return
+    if async_log_handler is not None:
+        latency_ms = round((time.perf_counter() - context["started"]) * 1000, 3)
+        logging.info("request served", extra={"status": status, "latency_ms": latency_ms})
+    request_context.set(None)
 
 # if __name__=="__main__":
 #     logging.info("This is a log message")
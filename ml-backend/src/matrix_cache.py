@@ -0,0 +1,158 @@
+'''
+Transformed train/test matrices cached between the transformation and the
+training step.
+
+A transformation stores its (X_train, y_train), (X_test, y_test) as .npy
+files under
+
+    .cache/matrices/<pipeline>-<key prefix>/
+
+keyed by a hash of the train/test CSVs, the transformer configuration, the
+source of the transformation code and the sklearn version. When nothing changed, the next run memory maps the
+cached matrices instead of parsing and transforming the CSVs again. Sparse
+matrices are stored as their CSR component arrays.
+
+The fitted preprocessor is saved by the run that wrote the entry, an entry is
+only used while the preprocessor artifacts on disk are still the ones saved
+with it. MATRIX_CACHE=0 turns the cache off.
+'''
+import os
+import sys
+import json
+import shutil
+import hashlib
+from dataclasses import dataclass
+import numpy as np
+from scipy import sparse
+from src.exception import CustomException
+from src.logger import logging
+from src.artifact_store import artifact_source
+
+FORMAT_VERSION = 2
+PARTS = ("X_train", "y_train", "X_test", "y_test")
+
+@dataclass
+class MatrixCacheConfig:
+    enabled: bool = os.environ.get("MATRIX_CACHE", "1") != "0"
+    cache_dir: str = os.environ.get("MATRIX_CACHE_DIR", os.path.join(".cache", "matrices"))
+    # memory map cached matrices read-only instead of reading them into memory
+    mmap: bool = os.environ.get("MATRIX_CACHE_MMAP", "1") != "0"
+
+def file_sha256(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file_obj:
+        for block in iter(lambda: file_obj.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def transformer_signature(transformer):
+    '''
+    Class and parameters of an unfitted transformer, nested ones included.
+    '''
+    params = sorted((name, repr(value)) for name, value in transformer.get_params(deep=True).items())
+    return f"{type(transformer).__module__}.{type(transformer).__qualname__}{params}"
+
+
+class MatrixCache:
+    def __init__(self):
+        self.matrix_cache_config = MatrixCacheConfig()
+
+    def key(self, data_paths, transformer_config, code_paths):
+        '''
+        Hash of the input files' content, the transformer configuration and
+        the source files of the code that builds the matrices.
+        '''
+        import sklearn
+        digest = hashlib.sha256(f"{FORMAT_VERSION}|{sklearn.__version__}|{transformer_config}".encode())
+        for path in data_paths:
+            digest.update(file_sha256(path).encode())
+        # a changed transformation invalidates its entries like changed data
+        for path in code_paths:
+            digest.update(file_sha256(path).encode())
+        return digest.hexdigest()
+
+    def _entry_dir(self, name, key):
+        return os.path.join(self.matrix_cache_config.cache_dir, f"{name}-{key[:16]}")
+
+    def _artifact_hashes(self, artifact_paths):
+        return {path: file_sha256(artifact_source(path)) for path in artifact_paths}
+
+    def load(self, name, key, artifact_paths=()):
+        '''
+        The cached ((X_train, y_train), (X_test, y_test)) of key, or None.
+        '''
+        if not self.matrix_cache_config.enabled:
+            return None
+        directory = self._entry_dir(name, key)
+        meta_path = os.path.join(directory, "meta.json")
+        try:
+            if not os.path.exists(meta_path):
+                return None
+            with open(meta_path) as file_obj:
+                meta = json.load(file_obj)
+            if meta["key"] != key:
+                return None
+            missing = [path for path in artifact_paths if not os.path.exists(artifact_source(path))]
+            if missing or self._artifact_hashes(artifact_paths) != meta["artifacts"]:
+                logging.info(f"Cached {name} matrices skipped, the preprocessor artifacts changed since")
+                return None
+
+            mmap_mode = "r" if self.matrix_cache_config.mmap else None
+            arrays = {}
+            for part in PARTS:
+                layout = meta["parts"][part]
+                if layout["format"] == "csr":
+                    data, indices, indptr = (
+                        np.load(os.path.join(directory, f"{part}.{component}.npy"), mmap_mode=mmap_mode)
+                        for component in ("data", "indices", "indptr")
+                    )
+                    arrays[part] = sparse.csr_matrix((data, indices, indptr), shape=tuple(layout["shape"]), copy=False)
+                else:
+                    arrays[part] = np.load(os.path.join(directory, f"{part}.npy"), mmap_mode=mmap_mode)
+            logging.info(f"Loaded cached {name} matrices from {directory}")
+            return (arrays["X_train"], arrays["y_train"]), (arrays["X_test"], arrays["y_test"])
+        except Exception as e:
+            # a damaged entry is rebuilt
+            logging.warning(f"Could not load cached {name} matrices from {directory}: {e}")
+            return None
+
+    def save(self, name, key, train, test, artifact_paths=()):
+        '''
+        Stores the matrices of key after the preprocessor artifacts were saved,
+        replacing the older entries of name.
+        '''
+        if not self.matrix_cache_config.enabled:
+            return
+        try:
+            directory = self._entry_dir(name, key)
+            tmp_dir = f"{directory}.{os.getpid()}.tmp"
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            os.makedirs(tmp_dir)
+
+            parts = {}
+            for part, array in zip(PARTS, (*train, *test)):
+                if sparse.issparse(array):
+                    array = array.tocsr()
+                    for component in ("data", "indices", "indptr"):
+                        np.save(os.path.join(tmp_dir, f"{part}.{component}.npy"), getattr(array, component))
+                    parts[part] = {"format": "csr", "shape": list(array.shape)}
+                else:
+                    np.save(os.path.join(tmp_dir, f"{part}.npy"), np.ascontiguousarray(array))
+                    parts[part] = {"format": "npy", "shape": list(np.shape(array))}
+            meta = {"key": key, "parts": parts, "artifacts": self._artifact_hashes(artifact_paths)}
+            with open(os.path.join(tmp_dir, "meta.json"), "w") as file_obj:
+                json.dump(meta, file_obj, indent=2)
+
+            # one entry per pipeline, the input data rarely goes back to an older version
+            parent = self.matrix_cache_config.cache_dir
+            for entry in os.listdir(parent):
+                if entry.startswith(f"{name}-") and not entry.endswith(".tmp"):
+                    shutil.rmtree(os.path.join(parent, entry), ignore_errors=True)
+            os.replace(tmp_dir, directory)
+            logging.info(f"Cached {name} matrices in {directory}")
+        except Exception as e:
+            # the next run transforms again
+            logging.warning(f"Could not cache {name} matrices: {CustomException(e, sys)}")
+
+
+matrix_cache = MatrixCache()
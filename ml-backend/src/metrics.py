@@ -0,0 +1,235 @@
+'''
+Process-local metrics, served on /metrics in the Prometheus text format.
+
+Updates never take a lock: every thread counts into its own shard (plain
+dicts and lists only that thread writes to). A scrape copies and sums the
+shards of all threads, the shards of finished threads are folded into one
+retired shard. Values that already live elsewhere (cache counters,
+loaded artifact versions, ...) are read at scrape time by collectors.
+'''
+import bisect
+import threading
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LOAD_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# records
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 10000)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._local = threading.local()
+        # (thread, shard) of the threads that counted since the last reap
+        self._shards = []
+        # counts of threads that finished
+        self._retired = {}
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            # once per thread, thread-per-request servers start one per request
+            shard = self._local.shard = {}
+            with self._lock:
+                self._reap()
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def _reap(self):
+        # under the lock, a finished thread no longer writes to its shard
+        alive = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                alive.append((thread, shard))
+            else:
+                _fold(self._retired, shard)
+        self._shards = alive
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._add(Counter(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(self, name, documentation, labelnames, buckets))
+
+    def _add(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric '{metric.name}' is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def register_collector(self, collect):
+        '''
+        collect() returns [(name, type, documentation, [(labels, value), ...])]
+        and runs on every scrape.
+        '''
+        self._collectors.append(collect)
+
+    def _merged(self):
+        with self._lock:
+            self._reap()
+            shards = [shard for _, shard in self._shards]
+            merged = {}
+            _fold(merged, self._retired)
+        for shard in shards:
+            # dict and list copies are atomic, the owning thread may be writing
+            _fold(merged, shard.copy())
+        return merged
+
+    def render(self):
+        merged = self._merged()
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render(merged))
+        for collect in self._collectors:
+            try:
+                families = collect()
+            except Exception as e:
+                lines.append(f"# collector failed: {_escape(str(e))}")
+                continue
+            for name, metric_type, documentation, samples in families:
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_labels(labels)} {_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class Counter:
+    def __init__(self, registry, name, documentation, labelnames):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def inc(self, *labelvalues, value=1):
+        shard = self.registry.shard()
+        key = (self.name, labelvalues)
+        shard[key] = shard.get(key, 0) + value
+
+    def render(self, merged):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        for (name, labelvalues), value in sorted(merged.items(), key=_sort_key):
+            if name == self.name:
+                yield f"{self.name}{_labels(zip(self.labelnames, labelvalues))} {_value(value)}"
+
+
+class Histogram:
+    def __init__(self, registry, name, documentation, labelnames, buckets):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, amount, *labelvalues):
+        shard = self.registry.shard()
+        key = (self.name, labelvalues)
+        # one slot per bucket plus +Inf, then sum and count
+        counts = shard.get(key)
+        if counts is None:
+            counts = shard[key] = [0] * (len(self.buckets) + 3)
+        counts[bisect.bisect_left(self.buckets, amount)] += 1
+        counts[-2] += amount
+        counts[-1] += 1
+
+    def render(self, merged):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for (name, labelvalues), counts in sorted(merged.items(), key=_sort_key):
+            if name != self.name:
+                continue
+            labels = list(zip(self.labelnames, labelvalues))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield f"{self.name}_bucket{_labels(labels + [('le', _value(bound))])} {cumulative}"
+            yield f"{self.name}_sum{_labels(labels)} {_value(counts[-2])}"
+            yield f"{self.name}_count{_labels(labels)} {counts[-1]}"
+
+
+def _fold(total, shard):
+    '''
+    Adds the counts of shard to total.
+    '''
+    for key, value in shard.items():
+        if isinstance(value, list):
+            value = list(value)
+            current = total.get(key)
+            total[key] = value if current is None else [a + b for a, b in zip(current, value)]
+        else:
+            total[key] = total.get(key, 0) + value
+
+def _sort_key(item):
+    name, labelvalues = item[0]
+    return name, tuple(str(value) for value in labelvalues)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(labels):
+    labels = labels.items() if isinstance(labels, dict) else labels
+    text = ",".join(f'{name}="{_escape(value)}"' for name, value in labels)
+    return "{" + text + "}" if text else ""
+
+def _value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# Process-wide registry and the metrics of the request path
+metrics = MetricsRegistry()
+
+http_requests = metrics.counter(
+    "careconnect_http_requests_total", "HTTP requests by route, method and status.", ("endpoint", "method", "status")
+)
+http_errors = metrics.counter(
+    "careconnect_http_request_errors_total",
+    "Failed HTTP requests by route, validation (400) or server (5xx).", ("endpoint", "kind")
+)
+http_latency = metrics.histogram(
+    "careconnect_http_request_duration_seconds", "Time from request start to response.", ("endpoint",)
+)
+http_started = metrics.counter("careconnect_http_requests_started_total", "HTTP requests started.")
+http_finished = metrics.counter("careconnect_http_requests_finished_total", "HTTP requests answered.")
+batch_size = metrics.histogram(
+    "careconnect_prediction_batch_size",
+    "Records per vectorized prediction, from /batch requests or the micro batcher.",
+    ("model", "source"), BATCH_SIZE_BUCKETS
+)
+model_load_seconds = metrics.histogram(
+    "careconnect_model_load_duration_seconds",
+    "Time to load the artifacts of a model, first load or reload.", ("model", "kind"), LOAD_BUCKETS
+)
+model_load_failures = metrics.counter(
+    "careconnect_model_load_failures_total", "Failed model loads and reloads.", ("model",)
+)
+
+
+def request_started():
+    http_started.inc()
+
+def request_finished(endpoint, method, status, seconds):
+    http_finished.inc()
+    http_requests.inc(endpoint, method, status)
+    http_latency.observe(seconds, endpoint)
+    if status == 400:
+        http_errors.inc(endpoint, "validation")
+    elif status >= 500:
+        http_errors.inc(endpoint, "server")
+
+def _in_flight():
+    merged = metrics._merged()
+    started = merged.get((http_started.name, ()), 0)
+    finished = merged.get((http_finished.name, ()), 0)
+    return [("careconnect_http_requests_in_flight", "gauge", "HTTP requests being served.", [({}, started - finished)])]
+
+metrics.register_collector(_in_flight)
@@ -0,0 +1,173 @@
+import os
+import sys
+import time
+import threading
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass
+from src.exception import CustomException
+from src.logger import logging
+from src.metrics import batch_size
+
+@dataclass
+class MicroBatchingConfig:
+    enabled: bool = os.environ.get("MICRO_BATCHING", "0") == "1"
+    # a batch is dispatched when it is full or its oldest request waited this long
+    max_batch_size: int = int(os.environ.get("MICRO_BATCH_SIZE", 64))
+    max_wait_ms: float = float(os.environ.get("MICRO_BATCH_WAIT_MS", 2))
+
+# the dispatcher closes a window this share of max_wait_ms before the oldest
+# request's deadline, so it is not racing the caller that gives up then
+FLUSH_LEAD = 0.25
+
+
+class _Request:
+    __slots__ = ("item", "deadline", "taken", "future")
+
+    def __init__(self, item, deadline):
+        self.item = item
+        self.deadline = deadline
+        self.taken = False
+        self.future = Future()
+
+
+class MicroBatcher:
+    '''
+    Gathers single requests for one model that arrive within max_wait_ms (or
+    until max_batch_size are queued) and runs them through one vectorized
+    predict_batch(items) call on a dispatcher thread.
+
+    Every request has a deadline of arrival + max_wait_ms. A request the
+    dispatcher has not picked up by then (e.g. because the previous batch is
+    still running) is not left waiting: its caller takes it, together with
+    whatever else is queued, and predicts that batch inline. Batching never
+    adds more than max_wait_ms to a request. The dispatcher flushes a quarter
+    of max_wait_ms before that deadline, the inline path stays a fallback for
+    a dispatcher that is busy.
+    '''
+    def __init__(self, name, predict_batch, max_batch_size=None, max_wait_ms=None):
+        self.micro_batching_config = MicroBatchingConfig()
+        if max_batch_size is not None:
+            self.micro_batching_config.max_batch_size = max_batch_size
+        if max_wait_ms is not None:
+            self.micro_batching_config.max_wait_ms = max_wait_ms
+
+        self.name = name
+        self.predict_batch = predict_batch
+        self._counters = dict.fromkeys(["requests", "batches", "batched_requests", "inline"], 0)
+        self._start_lock = threading.Lock()
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._pid = None
+
+    def _ensure_started(self):
+        # threads do not survive fork, so the dispatcher is started on first use
+        # in the process that serves the requests
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = deque()
+            self._cond = threading.Condition()
+            thread = threading.Thread(target=self._run, args=(self._cond,), name=f"micro-batcher-{self.name}", daemon=True)
+            thread.start()
+            self._pid = os.getpid()
+
+    def submit(self, item):
+        '''
+        Returns predict_batch([item])[0], computed together with whatever other
+        requests arrive within the batching window.
+        '''
+        self._ensure_started()
+
+        max_wait = self.micro_batching_config.max_wait_ms / 1000
+        request = _Request(item, time.monotonic() + max_wait)
+        batch = None
+        with self._cond:
+            self._queue.append(request)
+            self._counters["requests"] += 1
+            self._cond.notify_all()
+
+            # wait for the dispatcher to take the request, at most until its deadline
+            while not request.taken:
+                remaining = request.deadline - time.monotonic()
+                if remaining <= 0:
+                    batch = self._take(request)
+                    break
+                self._cond.wait(remaining)
+
+        if batch is not None:
+            self._dispatch(batch)
+        return request.future.result()
+
+    def _take(self, request=None):
+        '''
+        Pops the next batch off the queue, called with the condition held. A
+        caller whose deadline passed takes the batch itself (its own request
+        included) and runs it on its own thread.
+        '''
+        max_batch_size = max(1, self.micro_batching_config.max_batch_size)
+        queue = self._queue
+        if request is None:
+            batch = [queue.popleft() for _ in range(min(len(queue), max_batch_size))]
+        else:
+            queue.remove(request)
+            batch = [queue.popleft() for _ in range(min(len(queue), max_batch_size - 1))] + [request]
+            self._counters["inline"] += 1
+        for taken in batch:
+            taken.taken = True
+        self._counters["batches"] += 1 if batch else 0
+        self._counters["batched_requests"] += len(batch)
+        self._cond.notify_all()
+        return batch
+
+    def _run(self, cond):
+        while True:
+            try:
+                batch = self._next_batch(cond)
+                self._dispatch(batch)
+            except Exception as e:
+                logging.error("Micro batcher '%s' failed: %s", self.name, CustomException(e, sys))
+
+    def _next_batch(self, cond):
+        max_batch_size = max(1, self.micro_batching_config.max_batch_size)
+        with cond:
+            queue = self._queue
+            while not queue:
+                cond.wait()
+
+            # the oldest request decides when the window closes
+            flush_at = queue[0].deadline - FLUSH_LEAD * self.micro_batching_config.max_wait_ms / 1000
+            while len(queue) < max_batch_size:
+                remaining = flush_at - time.monotonic()
+                if remaining <= 0 or not queue:
+                    break
+                cond.wait(remaining)
+            return self._take()
+
+    def _dispatch(self, batch):
+        if not batch:
+            return
+        batch_size.observe(len(batch), self.name, "micro_batch")
+        try:
+            results = self.predict_batch([request.item for request in batch])
+            for request, result in zip(batch, results):
+                request.future.set_result(result)
+        except Exception as e:
+            # isolate the failing requests, the others still get their result
+            logging.error(f"Micro batch of {len(batch)} for '{self.name}' failed, retrying one by one: {e}")
+            for request in batch:
+                try:
+                    request.future.set_result(self.predict_batch([request.item])[0])
+                except Exception as request_error:
+                    request.future.set_exception(request_error)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._counters)
+            stats["queued"] = len(self._queue)
+        stats["mean_batch_size"] = stats["batched_requests"] / stats["batches"] if stats["batches"] else 0.0
+        stats["max_batch_size"] = self.micro_batching_config.max_batch_size
+        stats["max_wait_ms"] = self.micro_batching_config.max_wait_ms
+        return stats
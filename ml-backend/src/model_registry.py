@@ -0,0 +1,203 @@
+import os
+import sys
+import time
+import hashlib
+import threading
+from dataclasses import dataclass
+from src.exception import CustomException
+from src.logger import logging
+from src.artifact_store import load_artifact, artifact_source
+from src.metrics import model_load_seconds, model_load_failures
+from src.profiling import stage
+
+@dataclass
+class ModelRegistryConfig:
+    # seconds between artifact mtime checks, 0 checks on every request
+    reload_interval: float = float(os.environ.get("MODEL_RELOAD_INTERVAL", 5))
+
+
+class ModelBundle:
+    '''
+    Artifacts of one model that were loaded together (e.g. model + preprocessor).
+    The loaded objects are never replaced in place, a reload builds a new bundle
+    and swaps it in, so requests holding the old one finish undisturbed.
+    '''
+    def __init__(self, name, objects, signature, version, load_seconds):
+        self.name = name
+        self.objects = objects
+        self.signature = signature
+        self.version = version
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+        self._derived = {}
+
+    def __getitem__(self, key):
+        return self.objects[key]
+
+    def derived(self, key, factory):
+        '''
+        Returns an object computed from this bundle's artifacts, built once on
+        first use and dropped together with the bundle on reload.
+        '''
+        if key not in self._derived:
+            self._derived[key] = factory(self)
+        return self._derived[key]
+
+
+class ModelRegistry:
+    def __init__(self, reload_interval=None):
+        self.model_registry_config = ModelRegistryConfig()
+        if reload_interval is not None:
+            self.model_registry_config.reload_interval = reload_interval
+
+        self._specs = {}
+        self._bundles = {}
+        self._checked_at = {}
+        self._locks = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def register(self, name, paths, loaders=None, optional=None):
+        '''
+        - paths maps an artifact key ("model", "preprocessor", ...) to its file
+        - loaders optionally overrides load_artifact for some of the keys
+        - optional keys may be missing on disk, they load as None
+        - registering the same paths again is a no-op
+        '''
+        loaders = loaders or {}
+        optional = set(optional or [])
+        spec = {
+            key: (path, self._optional(loaders.get(key, load_artifact)) if key in optional else loaders.get(key, load_artifact))
+            for key, path in paths.items()
+        }
+        with self._lock:
+            current = self._specs.get(name)
+            if current is not None and {k: p for k, (p, _) in current.items()} == dict(paths):
+                return
+            self._specs[name] = spec
+            self._locks.setdefault(name, threading.Lock())
+            self._bundles.pop(name, None)
+            self._checked_at.pop(name, None)
+
+    def add_listener(self, callback):
+        '''
+        callback(name, bundle) runs after a new bundle of `name` is swapped in.
+        '''
+        self._listeners.append(callback)
+
+    def registered(self):
+        return list(self._specs)
+
+    def get(self, name):
+        bundle = self._bundles.get(name)
+        now = time.monotonic()
+        if bundle is not None and now - self._checked_at.get(name, 0) < self.model_registry_config.reload_interval:
+            return bundle
+
+        self.reload(name)
+        return self._bundles[name]
+
+    def reload(self, name, force=False):
+        '''
+        Loads the artifacts of `name` if they are not loaded yet or changed on
+        disk since the last load. Returns True when a new bundle was swapped in.
+        '''
+        try:
+            if name not in self._specs:
+                raise KeyError(f"Model '{name}' is not registered")
+
+            with self._locks[name]:
+                spec = self._specs[name]
+                current = self._bundles.get(name)
+                self._checked_at[name] = time.monotonic()
+
+                try:
+                    signature = self._signature(spec)
+                    if current is not None and not force and signature == current.signature:
+                        return False
+
+                    version = self._version(spec)
+                    if current is not None and not force and version == current.version:
+                        # touched but identical content, nothing to unpickle
+                        current.signature = signature
+                        return False
+
+                    start = time.perf_counter()
+                    with stage("load"):
+                        objects = {key: loader(path) for key, (path, loader) in spec.items()}
+                    load_seconds = time.perf_counter() - start
+                except Exception as e:
+                    model_load_failures.inc(name)
+                    if current is None:
+                        raise
+                    # e.g. a trainer is halfway through replacing an artifact
+                    logging.error(f"Reload of model '{name}' failed, keeping version {current.version}: {e}")
+                    return False
+
+                bundle = ModelBundle(name, objects, signature, version, load_seconds)
+                model_load_seconds.observe(load_seconds, name, "load" if current is None else "reload")
+                self._bundles[name] = bundle
+                logging.info(f"Loaded model '{name}' version {version} in {load_seconds:.3f}s")
+
+            for callback in self._listeners:
+                try:
+                    callback(name, bundle)
+                except Exception as e:
+                    logging.error(f"Model registry listener failed for '{name}': {e}")
+            return True
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def preload(self, names=None):
+        for name in names or self.registered():
+            self.reload(name)
+
+    def status(self):
+        status = {}
+        for name in self.registered():
+            bundle = self._bundles.get(name)
+            status[name] = {
+                "loaded": bundle is not None,
+                "version": bundle.version if bundle else None,
+                "loaded_at": bundle.loaded_at if bundle else None,
+                "load_seconds": bundle.load_seconds if bundle else None,
+            }
+        return status
+
+    @staticmethod
+    def _optional(loader):
+        def load_if_present(path):
+            return loader(path) if os.path.exists(artifact_source(path)) else None
+        load_if_present.optional = True
+        return load_if_present
+
+    @staticmethod
+    def _signature(spec):
+        signature = []
+        for key, (path, loader) in sorted(spec.items()):
+            # an artifact saved without its pickle only has a manifest
+            if getattr(loader, "optional", False) and not os.path.exists(artifact_source(path)):
+                signature.append((key, None, None))
+                continue
+            # an artifact with a manifest changes when its manifest is replaced
+            stat = os.stat(artifact_source(path))
+            signature.append((key, stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    @staticmethod
+    def _version(spec):
+        digest = hashlib.sha256()
+        for key, (path, _) in sorted(spec.items()):
+            path = artifact_source(path)
+            if not os.path.exists(path):
+                continue
+            # a manifest holds the checksums of its array files
+            with open(path, "rb") as file_obj:
+                digest.update(key.encode())
+                digest.update(file_obj.read())
+        return digest.hexdigest()[:12]
+
+
+# Process-wide registry shared by the prediction pipelines
+model_registry = ModelRegistry()
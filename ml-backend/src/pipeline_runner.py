@@ -0,0 +1,305 @@
+'''
+Runs the training pipelines as a DAG, from ml-backend/:
+
+    python -m src.pipeline_runner                        # all three
+    python -m src.pipeline_runner stroke                 # one chain
+    python -m src.pipeline_runner --force train          # retrain, keep ingestion and transformation
+    python -m src.pipeline_runner --dry-run              # what would run
+
+Each pipeline (stroke, diabetes, diseases_and_symptoms) is a chain
+ingest -> transform -> train. The chains share nothing and run in parallel
+processes; the stages of a chain run in order.
+
+A stage is skipped when its key matches the last successful run and its
+outputs are still the files that run wrote. The key is a hash of
+- the content of its input files (the dataset, the train/test CSVs)
+- the source of its stage module and the shared modules it uses
+- its configuration (the stage's config dataclass, env driven settings)
+- the key of the stage before it
+so changing only src/stroke/model_trainer.py retrains only stroke. The keys
+and output hashes are kept in .cache/pipeline_runner/state.json.
+'''
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import importlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from src.exception import CustomException
+from src.logger import logging
+
+PIPELINES = ["stroke", "diabetes", "diseases_and_symptoms"]
+STAGES = ["ingest", "transform", "train"]
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+# shared modules whose code is part of each stage's key
+SHARED_MODULES = {
+    "ingest": ["streaming_ingestion.py"],
+    "transform": ["matrix_cache.py", "artifact_store.py"],
+    "train": ["utils.py", "artifact_store.py", "matrix_cache.py", "compact_models.py"],
+}
+STAGE_MODULES = {"ingest": "data_ingestion", "transform": "data_transformation", "train": "model_trainer"}
+# settings that change how fast a stage runs, not what it writes
+UNKEYED_FIELDS = {"n_jobs"}
+
+@dataclass
+class PipelineRunnerConfig:
+    state_path: str = os.environ.get("PIPELINE_STATE_PATH", os.path.join(".cache", "pipeline_runner", "state.json"))
+    # one process per pipeline by default
+    workers: int = int(os.environ.get("PIPELINE_WORKERS", len(PIPELINES)))
+
+
+def _file_hash(file_path):
+    from src.matrix_cache import file_sha256
+    return file_sha256(file_path)
+
+def _config_repr(config):
+    # class level defaults of the config dataclasses are not instance attributes
+    fields = {
+        name: getattr(config, name) for name in dir(config)
+        if not name.startswith("_") and name not in UNKEYED_FIELDS
+    }
+    return repr(sorted((name, value) for name, value in fields.items() if not callable(value)))
+
+def _code_hash(pipeline, stage):
+    digest = hashlib.sha256()
+    files = [os.path.join(SRC_DIR, pipeline, f"{STAGE_MODULES[stage]}.py")]
+    files += [os.path.join(SRC_DIR, name) for name in SHARED_MODULES[stage]]
+    for file_path in files:
+        digest.update(_file_hash(file_path).encode())
+    return digest.hexdigest()
+
+
+class Chain:
+    '''
+    The stages of one pipeline with their inputs, outputs and configuration.
+    '''
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self.ingestion = importlib.import_module(f"src.{pipeline}.data_ingestion")
+        self.transformation = importlib.import_module(f"src.{pipeline}.data_transformation")
+        self.trainer = importlib.import_module(f"src.{pipeline}.model_trainer")
+
+        self.ingestion_config = self.ingestion.DataIngestionConfig()
+        self.transformation_config = self.transformation.DataTransformationConfig()
+        self.trainer_config = self.trainer.ModelTrainerConfig()
+        self.splits = [self.ingestion_config.train_data_path, self.ingestion_config.test_data_path]
+        self._matrices = None
+
+    def inputs(self, stage):
+        return {"ingest": [self.ingestion_config.dataset_path], "transform": self.splits, "train": []}[stage]
+
+    def outputs(self, stage):
+        if stage == "ingest":
+            return self.splits
+        if stage == "transform":
+            return [
+                getattr(self.transformation_config, name) for name in dir(self.transformation_config)
+                if name.endswith("_file_path")
+            ]
+        return [self.trainer_config.trained_model_file_path]
+
+    def config(self, stage):
+        from src.streaming_ingestion import streaming_ingestion_config
+        from src.utils import evaluate_models_config
+        return {
+            "ingest": [self.ingestion_config, streaming_ingestion_config],
+            "transform": [self.transformation_config],
+            "train": [self.trainer_config, evaluate_models_config],
+        }[stage]
+
+    def key(self, stage, previous_key):
+        digest = hashlib.sha256(f"{self.pipeline}|{stage}|{previous_key}".encode())
+        digest.update(_code_hash(self.pipeline, stage).encode())
+        for config in self.config(stage):
+            digest.update(_config_repr(config).encode())
+        for file_path in self.inputs(stage):
+            digest.update(_file_hash(file_path).encode())
+        return digest.hexdigest()
+
+    def run(self, stage):
+        if stage == "ingest":
+            self.ingestion.DataIngestion().initiate_data_ingestion()
+        elif stage == "transform":
+            # a stage that reruns refits the preprocessor, the matrix cache would hand back the last matrices
+            self._matrices = self.transformation.DataTransformation().initiate_data_transformation(
+                *self.splits, use_cache=False
+            )
+        else:
+            if self._matrices is None:
+                # transformation skipped, its matrices come from the matrix cache
+                self._matrices = self.transformation.DataTransformation().initiate_data_transformation(*self.splits)
+            return self.trainer.ModelTrainer().initiate_model_trainer(*self._matrices)
+
+
+def _output_hashes(file_paths):
+    from src.artifact_store import artifact_source
+    return {path: _file_hash(artifact_source(path)) for path in file_paths}
+
+def _up_to_date(previous, key, outputs):
+    if not previous or previous.get("key") != key:
+        return False
+    try:
+        return _output_hashes(outputs) == previous["outputs"]
+    except OSError:
+        return False
+
+def _init_worker(n_jobs):
+    '''
+    Splits the cores between the chains, each worker's evaluate_models
+    would otherwise use all of them.
+    '''
+    os.environ["EVAL_N_JOBS"] = str(n_jobs)
+    from src.utils import evaluate_models_config
+    # the config may have been imported by the parent before the fork
+    evaluate_models_config.n_jobs = n_jobs
+
+def run_chain(pipeline, previous_state, force_stages, dry_run):
+    '''
+    Runs the stages of one pipeline that are not up to date, returns one
+    result per stage. Runs in a worker process.
+    '''
+    results = []
+    previous_key = ""
+    try:
+        chain = Chain(pipeline)
+    except Exception as e:
+        error = str(CustomException(e, sys))
+        return [{"pipeline": pipeline, "stage": stage, "status": "failed", "seconds": 0.0, "error": error}
+                for stage in STAGES]
+
+    rerun = False
+    for stage in STAGES:
+        result = {"pipeline": pipeline, "stage": stage, "seconds": 0.0}
+        results.append(result)
+        if results[:-1] and results[-2]["status"] in ("failed", "blocked"):
+            result["status"] = "blocked"
+            continue
+        if dry_run and rerun:
+            # its inputs are only written by the stages before it
+            result["status"] = "would run"
+            continue
+        start = time.perf_counter()
+        try:
+            key = chain.key(stage, previous_key)
+            previous_key = key
+            outputs = chain.outputs(stage)
+            fresh = not rerun and stage not in force_stages and _up_to_date(previous_state.get(stage), key, outputs)
+            if fresh:
+                result["status"] = "skipped"
+            elif dry_run:
+                result["status"] = "would run"
+                rerun = True
+            else:
+                value = chain.run(stage)
+                result["status"] = "ran"
+                if value is not None:
+                    result["value"] = value
+                result["state"] = {"key": key, "outputs": _output_hashes(outputs), "finished": time.time()}
+                rerun = True
+        except Exception as e:
+            result["status"] = "failed"
+            result["error"] = str(CustomException(e, sys))
+            logging.error("Stage %s of %s failed: %s", stage, pipeline, result["error"])
+        result["seconds"] = time.perf_counter() - start
+    return results
+
+
+class PipelineRunner:
+    def __init__(self):
+        self.pipeline_runner_config = PipelineRunnerConfig()
+
+    def _load_state(self):
+        path = self.pipeline_runner_config.state_path
+        if not os.path.exists(path):
+            return {}
+        with open(path) as file_obj:
+            return json.load(file_obj)
+
+    def _save_state(self, state):
+        path = self.pipeline_runner_config.state_path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as file_obj:
+            json.dump(state, file_obj, indent=2)
+        os.replace(tmp_path, path)
+
+    def run(self, pipelines=None, force_stages=(), dry_run=False):
+        '''
+        Runs the chains of `pipelines` in parallel, returns the stage results.
+        '''
+        pipelines = pipelines or PIPELINES
+        state = self._load_state()
+        workers = max(1, min(self.pipeline_runner_config.workers, len(pipelines)))
+        n_jobs = max(1, (os.cpu_count() or 1) // workers)
+        logging.info(f"Running pipelines {pipelines} with {workers} workers, n_jobs={n_jobs} each")
+
+        results = []
+        errors = []
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(n_jobs,)) as executor:
+            futures = {
+                executor.submit(run_chain, pipeline, state.get(pipeline, {}), set(force_stages), dry_run): pipeline
+                for pipeline in pipelines
+            }
+            # as they finish, chains done before a failing one still keep what they ran
+            for future in as_completed(futures):
+                try:
+                    results.extend(future.result())
+                except Exception as e:
+                    logging.error(f"Chain {futures[future]} did not finish: {e!r}")
+                    errors.append(e)
+        results.sort(key=lambda result: (pipelines.index(result["pipeline"]), STAGES.index(result["stage"])))
+
+        for result in results:
+            if "state" in result:
+                state.setdefault(result["pipeline"], {})[result["stage"]] = result.pop("state")
+        if not dry_run:
+            self._save_state(state)
+        if errors:
+            raise CustomException(errors[0], sys)
+        return results
+
+
+def format_summary(results, wall_seconds):
+    lines = [f"{'pipeline':<24} {'stage':<10} {'status':<10} {'seconds':>9}"]
+    for result in results:
+        line = f"{result['pipeline']:<24} {result['stage']:<10} {result['status']:<10} {result['seconds']:>9.2f}"
+        if "value" in result:
+            line += f"  accuracy {result['value']:.4f}"
+        if "error" in result:
+            line += f"  {result['error']}"
+        lines.append(line)
+    total = sum(result["seconds"] for result in results)
+    lines.append(f"{'total':<46} {total:>9.2f}  ({wall_seconds:.2f}s wall)")
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pipelines", nargs="*", metavar="pipeline",
+                        help=f"any of {', '.join(PIPELINES)}, default all")
+    parser.add_argument("--force", nargs="*", choices=STAGES, metavar="stage",
+                        help="run these stages even when up to date, every stage without names")
+    parser.add_argument("--dry-run", action="store_true", help="show what would run")
+    parser.add_argument("--workers", type=int, help="parallel pipelines")
+    args = parser.parse_args()
+    # choices of an optional positional are checked against its default too
+    unknown = sorted(set(args.pipelines) - set(PIPELINES))
+    if unknown:
+        parser.error(f"unknown pipelines {unknown}, choose from {PIPELINES}")
+
+    runner = PipelineRunner()
+    if args.workers:
+        runner.pipeline_runner_config.workers = args.workers
+    # --force without stage names forces every stage
+    force = [] if args.force is None else args.force or STAGES
+    start = time.perf_counter()
+    results = runner.run(args.pipelines, force, args.dry_run)
+    print(format_summary(results, time.perf_counter() - start))
+    sys.exit(1 if any(result["status"] == "failed" for result in results) else 0)
+
+
+if __name__ == "__main__":
+    main()
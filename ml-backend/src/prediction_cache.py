@@ -0,0 +1,123 @@
+import os
+import sys
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass
+from src.exception import CustomException
+from src.logger import logging
+
+@dataclass
+class PredictionCacheConfig:
+    enabled: bool = os.environ.get("PREDICTION_CACHE", "1") != "0"
+    max_entries: int = int(os.environ.get("PREDICTION_CACHE_SIZE", 10000))
+    # seconds a cached prediction stays valid
+    ttl: float = float(os.environ.get("PREDICTION_CACHE_TTL", 600))
+
+
+class PredictionCache:
+    '''
+    Bounded LRU + TTL cache of prediction results.
+    - keys start with the model name, callers put the artifact version and a
+      canonical form of the input after it
+    - concurrent misses on the same key are coalesced: one caller computes,
+      the others wait for its result (or its exception)
+    - invalidate(model_name) drops a model's entries, results of computations
+      that were still running at that moment are not stored
+    '''
+    def __init__(self, max_entries=None, ttl=None):
+        self.prediction_cache_config = PredictionCacheConfig()
+        if max_entries is not None:
+            self.prediction_cache_config.max_entries = max_entries
+        if ttl is not None:
+            self.prediction_cache_config.ttl = ttl
+
+        self._entries = OrderedDict()
+        self._pending = {}
+        self._generations = {}
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(
+            ["hits", "misses", "coalesced", "evictions", "expirations", "invalidations"], 0
+        )
+
+    def get_or_compute(self, key, compute):
+        if not self.prediction_cache_config.enabled:
+            return compute()
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._counters["hits"] += 1
+                    return value
+                del self._entries[key]
+                self._counters["expirations"] += 1
+
+            pending = self._pending.get(key)
+            if pending is not None:
+                self._counters["coalesced"] += 1
+                leader = False
+            else:
+                pending = Future()
+                self._pending[key] = pending
+                self._counters["misses"] += 1
+                leader = True
+            generation = self._generations.get(key[0], 0)
+
+        if not leader:
+            return pending.result()
+
+        try:
+            value = compute()
+        except BaseException as e:
+            with self._lock:
+                self._pending.pop(key, None)
+            pending.set_exception(e)
+            raise
+
+        with self._lock:
+            self._pending.pop(key, None)
+            if self._generations.get(key[0], 0) == generation:
+                self._entries[key] = (time.monotonic() + self.prediction_cache_config.ttl, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.prediction_cache_config.max_entries:
+                    self._entries.popitem(last=False)
+                    self._counters["evictions"] += 1
+        pending.set_result(value)
+        return value
+
+    def invalidate(self, model_name=None):
+        try:
+            with self._lock:
+                if model_name is None:
+                    names = {key[0] for key in self._entries} | set(self._generations)
+                    self._entries.clear()
+                else:
+                    names = {model_name}
+                    for key in [key for key in self._entries if key[0] == model_name]:
+                        del self._entries[key]
+                for name in names:
+                    self._generations[name] = self._generations.get(name, 0) + 1
+                self._counters["invalidations"] += 1
+            logging.info(f"Prediction cache invalidated for {model_name or 'all models'}")
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["entries"] = len(self._entries)
+            stats["in_flight"] = len(self._pending)
+        lookups = stats["hits"] + stats["misses"] + stats["coalesced"]
+        stats["hit_ratio"] = (stats["hits"] + stats["coalesced"]) / lookups if lookups else 0.0
+        stats["max_entries"] = self.prediction_cache_config.max_entries
+        stats["ttl"] = self.prediction_cache_config.ttl
+        return stats
+
+
+# Process-wide cache in front of the prediction pipelines
+prediction_cache = PredictionCache()
@@ -0,0 +1,458 @@
+import os
+import math
+import time
+import importlib
+import threading
+from dataclasses import dataclass
+from src.exception import ValidationError
+from src.logger import logging, annotate_request, logging_stats
+from src.model_registry import model_registry
+from src.prediction_cache import prediction_cache
+from src.micro_batching import MicroBatcher, MicroBatchingConfig
+from src.metrics import metrics, batch_size
+from src.profiling import stage
+
+STROKE_FIELDS = [
+    "gender", "age", "hypertension", "heart_disease",
+    "ever_married", "work_type", "Residence_type",
+    "avg_glucose_level", "bmi", "smoking_status"
+]
+STROKE_NUMERIC_FIELDS = ["age", "hypertension", "heart_disease", "avg_glucose_level", "bmi"]
+# these are filled in by the imputers of the stroke preprocessor
+STROKE_NULLABLE_FIELDS = ["age", "avg_glucose_level", "bmi"]
+
+DIABETES_FIELDS = [
+    "Pregnancies", "Glucose", "BloodPressure", "SkinThickness",
+    "Insulin", "BMI", "DiabetesPedigreeFunction", "Age"
+]
+
+MIN_SYMPTOMS = 3
+MAX_SYMPTOMS = 5
+MAX_TOP_K = 50
+
+@dataclass
+class PredictionServiceConfig:
+    # records per vectorized transform/predict call of the batch endpoints
+    batch_chunk_size: int = int(os.environ.get("BATCH_CHUNK_SIZE", 1024))
+    batch_max_records: int = int(os.environ.get("BATCH_MAX_RECORDS", 100000))
+    # diseases listed in the differential diagnosis unless a request sets top_k
+    disease_top_k: int = int(os.environ.get("DISEASE_TOP_K", 10))
+
+prediction_service_config = PredictionServiceConfig()
+
+
+class LazyPipeline:
+    '''
+    Imports a pipeline module and builds its PredictPipeline on first use, so
+    importing this module (and app.py) does not import pandas or sklearn and
+    a model that is never asked for is never loaded. warmup() builds all of them.
+    '''
+    def __init__(self, model_name, module_name):
+        self.model_name = model_name
+        self.module_name = module_name
+        self._pipeline = None
+        self._lock = threading.Lock()
+
+    @property
+    def module(self):
+        return importlib.import_module(self.module_name)
+
+    def get(self):
+        if self._pipeline is None:
+            with self._lock:
+                if self._pipeline is None:
+                    self._pipeline = self.module.PredictPipeline()
+        return self._pipeline
+
+    def bundle(self):
+        # building the pipeline registers its artifacts with the registry
+        self.get()
+        return model_registry.get(self.model_name)
+
+    def custom_data(self, **fields):
+        return self.module.CustomData(**fields)
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+# Pipelines share the process-wide model registry, artifacts are unpickled once
+# per worker and hot reloaded when the files under artifacts/ change
+stroke_pipeline = LazyPipeline("stroke", "src.stroke.predict_pipeline")
+diabetes_pipeline = LazyPipeline("diabetes", "src.diabetes.predict_pipeline")
+disease_pipeline = LazyPipeline("diseases_and_symptoms", "src.diseases_and_symptoms.predict_pipeline")
+
+# cached predictions of a model are dropped as soon as its artifacts change
+model_registry.add_listener(lambda name, bundle: prediction_cache.invalidate(name))
+
+
+# Concurrent single requests of a model can share one vectorized predict call,
+# opt in with MICRO_BATCHING=1. Each batcher gets a list of validated inputs.
+micro_batching_config = MicroBatchingConfig()
+if micro_batching_config.enabled:
+    stroke_batcher = MicroBatcher(
+        "stroke", lambda records: stroke_pipeline.predict(_frame(records, STROKE_FIELDS))
+    )
+    diabetes_batcher = MicroBatcher(
+        "diabetes", lambda records: diabetes_pipeline.predict(_frame(records, DIABETES_FIELDS))
+    )
+    disease_batcher = MicroBatcher("diseases_and_symptoms", lambda requests: _predict_disease_chunk(requests))
+else:
+    stroke_batcher = diabetes_batcher = disease_batcher = None
+
+def micro_batching_stats():
+    batchers = [stroke_batcher, diabetes_batcher, disease_batcher]
+    return {batcher.name: batcher.stats() for batcher in batchers if batcher is not None}
+
+
+def _frame(records, columns):
+    # pandas is imported with the first batch, not with this module
+    import pandas as pd
+    with stage("frame"):
+        return pd.DataFrame.from_records(records, columns=columns)
+
+
+def _as_number(data, field, nullable=False):
+    value = data[field]
+    if value is None:
+        if nullable:
+            return math.nan
+        raise ValidationError(f"Invalid value for field: {field}")
+    if isinstance(value, (dict, list)):
+        raise ValidationError(f"Invalid value for field: {field}")
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValidationError(f"Invalid value for field: {field}")
+
+def _check_fields(data, fields):
+    if not isinstance(data, dict):
+        raise ValidationError("Expected a JSON object")
+    for field in fields:
+        if field not in data:
+            raise ValidationError(f"Missing field: {field}")
+
+def validate_stroke_record(data):
+    _check_fields(data, STROKE_FIELDS)
+    record = {field: data[field] for field in STROKE_FIELDS}
+    for field in STROKE_NUMERIC_FIELDS:
+        record[field] = _as_number(data, field, nullable=field in STROKE_NULLABLE_FIELDS)
+    for field in STROKE_FIELDS:
+        if field in STROKE_NUMERIC_FIELDS:
+            continue
+        if record[field] is None:
+            record[field] = math.nan
+        elif isinstance(record[field], (dict, list)):
+            raise ValidationError(f"Invalid value for field: {field}")
+    return record
+
+def validate_diabetes_record(data):
+    _check_fields(data, DIABETES_FIELDS)
+    return {field: _as_number(data, field) for field in DIABETES_FIELDS}
+
+def validate_symptoms(data):
+    if not isinstance(data, dict) or 'symptoms' not in data:
+        raise ValidationError("Missing field: symptoms")
+
+    symptoms_list = data['symptoms']
+    if not isinstance(symptoms_list, list) or len(symptoms_list) < MIN_SYMPTOMS or len(symptoms_list) > MAX_SYMPTOMS:
+        raise ValidationError(f"Provide between {MIN_SYMPTOMS} and {MAX_SYMPTOMS} symptoms.")
+    if not all(isinstance(symptom, str) for symptom in symptoms_list):
+        raise ValidationError("Symptoms must be strings.")
+    return symptoms_list
+
+def validate_top_k(data):
+    top_k = data.get('top_k', prediction_service_config.disease_top_k)
+    if isinstance(top_k, bool) or not isinstance(top_k, int) or top_k < 0 or top_k > MAX_TOP_K:
+        raise ValidationError(f"top_k must be an integer between 0 and {MAX_TOP_K}.")
+    return top_k
+
+def validate_disease_request(data):
+    '''
+    Returns (symptoms, top_k), top_k 0 means no differential diagnosis.
+    '''
+    symptoms_list = validate_symptoms(data)
+    return symptoms_list, validate_top_k(data)
+
+
+def _canonical_record(record, fields):
+    # NaN never equals itself, so missing values are keyed as None
+    return tuple(None if value != value else value for value in (record[field] for field in fields))
+
+def _cached(pipeline, canonical_input, compute):
+    '''
+    Serves a prediction from the cache, keyed by model, artifact version and
+    the canonical input, or computes it once for all concurrent callers.
+    '''
+    model_name = pipeline.model_name
+    version = pipeline.bundle().version
+    annotate_request(model_version=version)
+    return prediction_cache.get_or_compute((model_name, version, canonical_input), compute)
+
+def _stroke_label(pred):
+    return "Stroke" if pred == 1 else "No Stroke"
+
+def predict_stroke(data):
+    with stage("validate"):
+        validated = validate_stroke_record(data)
+    return predict_stroke_record(validated)
+
+def predict_stroke_record(record):
+    def compute():
+        if stroke_batcher is not None:
+            with stage("micro_batch"):
+                return {"prediction": _stroke_label(stroke_batcher.submit(record))}
+        preds = stroke_pipeline.predict_data(stroke_pipeline.custom_data(**record))
+        return {"prediction": _stroke_label(preds[0])}
+
+    return _cached(stroke_pipeline, _canonical_record(record, STROKE_FIELDS), compute)
+
+def predict_diabetes(data):
+    with stage("validate"):
+        validated = validate_diabetes_record(data)
+    return predict_diabetes_record(validated)
+
+def predict_diabetes_record(record):
+    def compute():
+        if diabetes_batcher is not None:
+            with stage("micro_batch"):
+                return {"prediction": [float(diabetes_batcher.submit(record))]}
+        preds = diabetes_pipeline.predict_data(diabetes_pipeline.custom_data(**record))
+        return {"prediction": preds.tolist()}
+
+    return _cached(diabetes_pipeline, _canonical_record(record, DIABETES_FIELDS), compute)
+
+def _disease_result(candidates):
+    return {
+        "prediction": candidates[0][0],
+        "top_k": [{"disease": disease, "probability": probability} for disease, probability in candidates],
+    }
+
+def predict_disease(data):
+    with stage("validate"):
+        validated = validate_disease_request(data)
+    return predict_disease_request(validated)
+
+def predict_disease_request(disease_request):
+    symptoms_list, top_k = disease_request
+
+    def compute():
+        if disease_batcher is not None:
+            with stage("micro_batch"):
+                return _disease_batch_result(disease_batcher.submit((symptoms_list, top_k)))
+        if not top_k:
+            return {"prediction": disease_pipeline.predict(symptoms_list)}
+        return _disease_result(disease_pipeline.predict_top_k(symptoms_list, top_k))
+
+    # the prediction does not depend on symptom order or repeated symptoms
+    canonical_input = (tuple(sorted(set(symptoms_list))), top_k)
+    return _cached(disease_pipeline, canonical_input, compute)
+
+
+def _batch_records(payload):
+    '''
+    Batch endpoints accept either a JSON array of records or {"records": [...]}.
+    '''
+    records = payload.get("records") if isinstance(payload, dict) else payload
+    if not isinstance(records, list) or not records:
+        raise ValidationError("Provide a non-empty list of records.")
+    if len(records) > prediction_service_config.batch_max_records:
+        raise ValidationError(f"A batch can hold at most {prediction_service_config.batch_max_records} records.")
+    return records
+
+def _validate_batch(payload, validate):
+    '''
+    Validates every record up front. Returns (results, valid): invalid records
+    already have their error entry in results, valid holds (index, record).
+    '''
+    records = _batch_records(payload)
+    results = [None] * len(records)
+
+    valid = []
+    for index, data in enumerate(records):
+        try:
+            valid.append((index, validate(data)))
+        except ValidationError as e:
+            results[index] = {"index": index, "error": str(e)}
+    return results, valid
+
+def _predict_batch(validated, pipeline, predict_chunk, format_result):
+    '''
+    - predicts the valid records chunk by chunk with one vectorized call per chunk
+    - a chunk that fails as a whole is retried record by record so only the
+      offending records are reported as failed
+    - results come back in request order
+    '''
+    results, valid = validated
+    results = list(results)
+    annotate_request(model_version=pipeline.bundle().version)
+    batch_size.observe(len(valid), pipeline.model_name, "request")
+
+    chunk_size = max(1, prediction_service_config.batch_chunk_size)
+    for start in range(0, len(valid), chunk_size):
+        chunk = valid[start:start + chunk_size]
+        try:
+            preds = predict_chunk([record for _, record in chunk])
+            for (index, _), pred in zip(chunk, preds):
+                results[index] = {"index": index, **format_result(pred)}
+        except Exception as e:
+            logging.error(f"Batch chunk of {len(chunk)} records failed, retrying one by one: {e}")
+            for index, record in chunk:
+                try:
+                    pred = predict_chunk([record])[0]
+                    results[index] = {"index": index, **format_result(pred)}
+                except Exception as record_error:
+                    logging.error(f"Batch record {index} failed: {record_error}")
+                    results[index] = {"index": index, "error": "Prediction failed"}
+
+    errors = sum(1 for result in results if "error" in result)
+    return {"results": results, "count": len(results), "errors": errors}
+
+def validate_stroke_batch(payload):
+    return _validate_batch(payload, validate_stroke_record)
+
+def predict_stroke_validated_batch(validated):
+    return _predict_batch(
+        validated,
+        stroke_pipeline,
+        lambda records: stroke_pipeline.predict(_frame(records, STROKE_FIELDS)),
+        lambda pred: {"prediction": _stroke_label(pred)}
+    )
+
+def predict_stroke_batch(payload):
+    with stage("validate"):
+        validated = validate_stroke_batch(payload)
+    return predict_stroke_validated_batch(validated)
+
+def validate_diabetes_batch(payload):
+    return _validate_batch(payload, validate_diabetes_record)
+
+def predict_diabetes_validated_batch(validated):
+    return _predict_batch(
+        validated,
+        diabetes_pipeline,
+        lambda records: diabetes_pipeline.predict(_frame(records, DIABETES_FIELDS)),
+        lambda pred: {"prediction": float(pred)}
+    )
+
+def predict_diabetes_batch(payload):
+    with stage("validate"):
+        validated = validate_diabetes_batch(payload)
+    return predict_diabetes_validated_batch(validated)
+
+def _predict_disease_chunk(requests):
+    '''
+    One vectorized call for the whole chunk, ranked with the largest top_k of
+    the chunk and cut down per record.
+    '''
+    top_k = max(k for _, k in requests)
+    symptoms_lists = [symptoms_list for symptoms_list, _ in requests]
+    if not top_k:
+        return [(disease, None) for disease in disease_pipeline.predict_batch(symptoms_lists)]
+    candidates = disease_pipeline.predict_top_k_batch(symptoms_lists, top_k)
+    return [(row[0][0], row[:k] if k else None) for row, (_, k) in zip(candidates, requests)]
+
+def _disease_batch_result(pred):
+    disease, candidates = pred
+    if candidates is None:
+        return {"prediction": str(disease)}
+    return _disease_result(candidates)
+
+def validate_disease_batch(payload):
+    return _validate_batch(payload, validate_disease_request)
+
+def predict_disease_validated_batch(validated):
+    return _predict_batch(validated, disease_pipeline, _predict_disease_chunk, _disease_batch_result)
+
+def predict_disease_batch(payload):
+    with stage("validate"):
+        validated = validate_disease_batch(payload)
+    return predict_disease_validated_batch(validated)
+
+
+# Synthetic inputs used to warm up each pipeline before a worker takes traffic
+WARMUP_STROKE_RECORD = {
+    "gender": "Male", "age": 67.0, "hypertension": 0.0, "heart_disease": 1.0,
+    "ever_married": "Yes", "work_type": "Private", "Residence_type": "Urban",
+    "avg_glucose_level": 228.69, "bmi": math.nan, "smoking_status": "formerly smoked"
+}
+WARMUP_DIABETES_RECORD = {
+    "Pregnancies": 6.0, "Glucose": 148.0, "BloodPressure": 72.0, "SkinThickness": 35.0,
+    "Insulin": 0.0, "BMI": 33.6, "DiabetesPedigreeFunction": 0.627, "Age": 50.0
+}
+
+
+def warmup():
+    '''
+    Loads every model and runs the single-record and batch paths of each
+    pipeline once, so the fast-path helpers are built before the first
+    request. Bypasses the prediction cache. Returns seconds per model.
+    '''
+    timings = {}
+
+    start = time.perf_counter()
+    stroke_pipeline.predict_data(stroke_pipeline.custom_data(**WARMUP_STROKE_RECORD))
+    stroke_pipeline.predict(_frame([WARMUP_STROKE_RECORD] * 2, STROKE_FIELDS))
+    timings["stroke"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    diabetes_pipeline.predict_data(diabetes_pipeline.custom_data(**WARMUP_DIABETES_RECORD))
+    diabetes_pipeline.predict(_frame([WARMUP_DIABETES_RECORD] * 2, DIABETES_FIELDS))
+    timings["diabetes"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    vocabulary = disease_pipeline.bundle()["symptoms"]
+    symptoms_list = list(vocabulary.symptoms[:MIN_SYMPTOMS])
+    disease_pipeline.predict(symptoms_list)
+    disease_pipeline.predict_top_k(symptoms_list, prediction_service_config.disease_top_k or 1)
+    disease_pipeline.predict_top_k_batch([symptoms_list] * 2, prediction_service_config.disease_top_k or 1)
+    timings["diseases_and_symptoms"] = time.perf_counter() - start
+
+    logging.info(f"Warmup done: {', '.join(f'{name} {seconds:.3f}s' for name, seconds in timings.items())}")
+    return timings
+
+def readiness():
+    '''
+    Returns (ready, status): ready once every registered model is loaded.
+    '''
+    status = model_registry.status()
+    for pipeline in (stroke_pipeline, diabetes_pipeline, disease_pipeline):
+        # not registered yet: the pipeline was never used
+        status.setdefault(pipeline.model_name, {"loaded": False, "version": None, "loaded_at": None, "load_seconds": None})
+    return all(model["loaded"] for model in status.values()), status
+
+
+def _service_metrics():
+    '''
+    Scrape-time metrics read from the registry, the prediction cache, the
+    micro batchers and the log queue.
+    '''
+    _, models = readiness()
+    families = [
+        ("careconnect_model_info", "gauge", "Artifact version of each loaded model.",
+         [({"model": name, "version": model["version"]}, 1) for name, model in models.items() if model["loaded"]]),
+        ("careconnect_model_loaded", "gauge", "1 once the model is loaded.",
+         [({"model": name}, int(model["loaded"])) for name, model in models.items()]),
+        ("careconnect_model_last_load_seconds", "gauge", "Duration of the load of the current version.",
+         [({"model": name}, model["load_seconds"]) for name, model in models.items() if model["loaded"]]),
+    ]
+
+    cache = prediction_cache.stats()
+    for key in ("hits", "misses", "coalesced", "evictions", "expirations"):
+        families.append((f"careconnect_prediction_cache_{key}_total", "counter", f"Prediction cache {key}.", [({}, cache[key])]))
+    families.append(("careconnect_prediction_cache_entries", "gauge", "Entries in the prediction cache.", [({}, cache["entries"])]))
+
+    batchers = micro_batching_stats()
+    if batchers:
+        families.append(("careconnect_micro_batch_queued", "gauge", "Requests waiting in a micro batcher.",
+                         [({"model": name}, stats["queued"]) for name, stats in batchers.items()]))
+        families.append(("careconnect_micro_batch_inline_total", "counter", "Micro batches run by a waiting caller.",
+                         [({"model": name}, stats["inline"]) for name, stats in batchers.items()]))
+
+    log_stats = logging_stats()
+    if log_stats:
+        families.append(("careconnect_log_records_dropped_total", "counter", "Log records dropped on a full log queue.",
+                         [({}, log_stats["dropped"])]))
+    return families
+
+metrics.register_collector(_service_metrics)
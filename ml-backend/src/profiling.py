@@ -0,0 +1,179 @@
+'''
+Where the time of a request goes.
+
+- Stage timers: `with stage("transform"):` adds the time of the block to the
+  timings of the request being served (a context variable, so it follows the
+  request into the ASGI thread pool). Outside a request it costs one lookup.
+  The routes return the timings in a Server-Timing header, in milliseconds.
+- Sampled profiling: once switched on (admin endpoint or PROFILE_REQUESTS=1),
+  a fraction of the requests runs under cProfile. Profiles are aggregated per endpoint and
+  dumped as pstats files (`python -m pstats <file>`, snakeviz, ...).
+'''
+import os
+import hmac
+import time
+import random
+import pstats
+import cProfile
+import threading
+import contextvars
+from dataclasses import dataclass
+from datetime import datetime
+from src.logger import logging, logs_path
+
+@dataclass
+class ProfilingConfig:
+    # Server-Timing header on every response
+    server_timing: bool = os.environ.get("SERVER_TIMING", "1") != "0"
+    # the admin endpoints answer 404 unless a token is set
+    admin_token: str = os.environ.get("ADMIN_TOKEN", "")
+    # the admin switch reaches the one worker serving it, this one turns
+    # sampling on in every worker from the start
+    profile_requests: bool = os.environ.get("PROFILE_REQUESTS", "0") == "1"
+    # defaults for sampling switched on without explicit values
+    sample_rate: float = float(os.environ.get("PROFILE_SAMPLE_RATE", 0.01))
+    dump_every: int = int(os.environ.get("PROFILE_DUMP_EVERY", 100))
+    # next to the log file of this run by default
+    profiles_dir: str = os.environ.get("PROFILES_DIR", os.path.join(logs_path, "profiles"))
+
+profiling_config = ProfilingConfig()
+
+# {stage: seconds} of the request being served
+stage_timings = contextvars.ContextVar("stage_timings", default=None)
+
+
+class stage:
+    '''
+    Times a block into the current request's timings, nested and repeated
+    stages add up.
+    '''
+    __slots__ = ("name", "timings", "started")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.timings = stage_timings.get()
+        if self.timings is not None:
+            self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.timings is not None:
+            self.timings[self.name] = self.timings.get(self.name, 0.0) + time.perf_counter() - self.started
+        return False
+
+
+def start_timing():
+    timings = {} if profiling_config.server_timing else None
+    stage_timings.set(timings)
+    return timings
+
+def server_timing_header(timings, total_seconds):
+    '''
+    e.g. `parse;dur=0.041, validate;dur=0.012, predict;dur=0.331, total;dur=0.52`
+    '''
+    entries = [f"{name};dur={seconds * 1000:.3f}" for name, seconds in timings.items()]
+    entries.append(f"total;dur={total_seconds * 1000:.3f}")
+    return ", ".join(entries)
+
+def finish_timing():
+    timings = stage_timings.get()
+    stage_timings.set(None)
+    return timings
+
+
+class SampledProfiler:
+    '''
+    Profiles a sampled fraction of requests with cProfile and aggregates the
+    profiles per endpoint, dumped every dump_every profiles and on demand.
+    One request is profiled at a time, a sampled request that finds the
+    profiler busy runs unprofiled.
+    '''
+    def __init__(self):
+        self.enabled = profiling_config.profile_requests
+        self.sample_rate = profiling_config.sample_rate
+        self.dump_every = profiling_config.dump_every
+        self._busy = threading.Lock()
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._pending = 0
+        self._counters = dict.fromkeys(["profiled", "skipped_busy", "dumps"], 0)
+
+    def configure(self, enabled, sample_rate=None, dump_every=None):
+        with self._lock:
+            self.enabled = bool(enabled)
+            if sample_rate is not None:
+                self.sample_rate = min(max(float(sample_rate), 0.0), 1.0)
+            if dump_every is not None:
+                self.dump_every = max(1, int(dump_every))
+        logging.info(f"Request profiling {'on' if self.enabled else 'off'}, sample rate {self.sample_rate}")
+
+    def start(self):
+        '''
+        Returns a running profiler when this request is sampled, otherwise None.
+        '''
+        if not self.enabled or random.random() >= self.sample_rate:
+            return None
+        if not self._busy.acquire(blocking=False):
+            self._counters["skipped_busy"] += 1
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # another profiler is active in this process
+            self._busy.release()
+            return None
+        return profile
+
+    def stop(self, profile, endpoint):
+        profile.disable()
+        self._busy.release()
+        with self._lock:
+            stats = self._stats.get(endpoint)
+            if stats is None:
+                self._stats[endpoint] = pstats.Stats(profile)
+            else:
+                stats.add(profile)
+            self._counters["profiled"] += 1
+            self._pending += 1
+            due = self._pending >= self.dump_every
+        if due:
+            self.dump()
+
+    def dump(self):
+        '''
+        Writes one pstats file per endpoint with everything profiled so far,
+        returns the paths written.
+        '''
+        directory = os.path.join(profiling_config.profiles_dir, str(os.getpid()))
+        os.makedirs(directory, exist_ok=True)
+        stamp = datetime.now().strftime('%m_%d_%Y_%H_%M_%S')
+        paths = []
+        with self._lock:
+            for endpoint, endpoint_stats in self._stats.items():
+                name = endpoint.strip("/").replace("/", "_") or "root"
+                path = os.path.join(directory, f"{name}.{stamp}.prof")
+                endpoint_stats.dump_stats(path)
+                paths.append(path)
+            self._pending = 0
+            self._counters["dumps"] += 1
+        logging.info(f"Dumped {len(paths)} request profiles to {directory}")
+        return paths
+
+    def status(self):
+        with self._lock:
+            status = dict(self._counters)
+            status["endpoints"] = sorted(self._stats)
+        status.update(enabled=self.enabled, sample_rate=self.sample_rate, dump_every=self.dump_every)
+        return status
+
+
+def admin_authorized(token):
+    expected = profiling_config.admin_token
+    return bool(expected) and token is not None and hmac.compare_digest(token.encode(), expected.encode())
+
+
+# Process-wide sampler, see ProfilingConfig.profile_requests
+sampled_profiler = SampledProfiler()
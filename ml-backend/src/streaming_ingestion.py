@@ -0,0 +1,108 @@
+'''
+Train/test split of a dataset CSV that never holds the whole dataset.
+
+The CSV is read in chunks of chunk_rows with explicit (downcast) dtypes, every
+row is assigned to train or test on the spot and the chunk is appended to the
+train and test CSVs, so memory is bounded by the chunk size.
+
+The split is stratified and deterministic: the rows of each class are taken
+in blocks of q rows (test_size = p/q, e.g. 3/10), and p rows of every block go
+to the test set, picked by a permutation seeded with a hash of (seed, class,
+block). The class proportions are kept within p rows per class, and the same
+file and seed give the same split whatever the chunk size.
+
+INGESTION_MODE=stream switches the ingestion steps of the pipelines to this,
+the default "memory" mode keeps train_test_split on the whole frame.
+'''
+import os
+import sys
+import hashlib
+from fractions import Fraction
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+from src.exception import CustomException
+from src.logger import logging
+
+@dataclass
+class StreamingIngestionConfig:
+    # "memory" (train_test_split on the whole frame) or "stream"
+    mode: str = os.environ.get("INGESTION_MODE", "memory")
+    chunk_rows: int = int(os.environ.get("INGESTION_CHUNK_ROWS", 100000))
+    datasets_dir: str = os.environ.get("DATASETS_DIR", os.path.join("notebooks", "datasets"))
+
+streaming_ingestion_config = StreamingIngestionConfig()
+
+
+class StratifiedHashSplitter:
+    '''
+    Assigns rows to the test set class by class, one chunk of labels at a
+    time, keeping only a row counter per class between chunks.
+    '''
+    def __init__(self, test_size, seed=42, max_block=100):
+        fraction = Fraction(test_size).limit_denominator(max_block)
+        if not 0 < fraction < 1:
+            raise ValueError(f"test_size must be between 0 and 1, got {test_size}")
+        self.p, self.q = fraction.numerator, fraction.denominator
+        self.seed = seed
+        self.counts = {}
+
+    def _test_positions(self, label, block):
+        digest = hashlib.sha256(f"{self.seed}|{label}|{block}".encode()).digest()
+        rng = np.random.default_rng(int.from_bytes(digest[:8], "little"))
+        positions = np.zeros(self.q, dtype=bool)
+        positions[rng.permutation(self.q)[:self.p]] = True
+        return positions
+
+    def assign(self, labels):
+        '''
+        Boolean mask of the labels' rows that go to the test set.
+        '''
+        labels = np.asarray(labels)
+        is_test = np.zeros(len(labels), dtype=bool)
+        codes, uniques = pd.factorize(labels)
+        for code, label in enumerate(uniques):
+            rows = np.flatnonzero(codes == code)
+            key = str(label)
+            seen = self.counts.get(key, 0)
+            ranks = seen + np.arange(len(rows))
+            blocks, offsets = np.divmod(ranks, self.q)
+            for block in np.unique(blocks):
+                in_block = blocks == block
+                is_test[rows[in_block]] = self._test_positions(key, block)[offsets[in_block]]
+            self.counts[key] = seen + len(rows)
+        return is_test
+
+
+def stream_split_csv(source_path, train_path, test_path, target, test_size, dtypes=None, chunk_rows=None, seed=42):
+    '''
+    Splits source_path into train_path and test_path chunk by chunk, returns
+    the (train, test) row counts. The outputs are written next to their
+    targets and swapped in when complete.
+    '''
+    chunk_rows = chunk_rows or streaming_ingestion_config.chunk_rows
+    splitter = StratifiedHashSplitter(test_size, seed)
+    tmp_paths = [f"{train_path}.tmp", f"{test_path}.tmp"]
+    n_rows = [0, 0]
+    try:
+        for path in (train_path, test_path):
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        for i, chunk in enumerate(pd.read_csv(source_path, dtype=dtypes, chunksize=chunk_rows)):
+            is_test = splitter.assign(chunk[target].to_numpy())
+            for part, (tmp_path, rows) in enumerate(zip(tmp_paths, (~is_test, is_test))):
+                # the header goes with the first chunk even when it has no rows of this part
+                chunk[rows].to_csv(tmp_path, mode="w" if i == 0 else "a", header=i == 0, index=False)
+                n_rows[part] += int(rows.sum())
+        for tmp_path, path in zip(tmp_paths, (train_path, test_path)):
+            os.replace(tmp_path, path)
+
+        logging.info(
+            f"Streamed {source_path} in chunks of {chunk_rows} rows: {n_rows[0]} train, {n_rows[1]} test rows, "
+            f"{len(splitter.counts)} classes"
+        )
+        return tuple(n_rows)
+    except Exception as e:
+        for tmp_path in tmp_paths:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        raise CustomException(e, sys)
@@ -2,9 +2,11 @@ import os
 import sys
 from src.exception import CustomException
 from src.logger import logging
+import numpy as np
 import pandas as pd
 from sklearn.model_selection import train_test_split
 from dataclasses import dataclass
+from src.streaming_ingestion import streaming_ingestion_config, stream_split_csv
 
 from src.stroke.data_transformation import DataTransformationConfig
 from src.stroke.data_transformation import DataTransformation
@@ -18,6 +20,15 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../.
 class DataIngestionConfig:
     train_data_path: str = os.path.join('artifacts_dataset',"stroke_train.csv")
     test_data_path: str = os.path.join('artifacts_dataset',"stroke_test.csv")
+    dataset_path: str = os.path.join(streaming_ingestion_config.datasets_dir, "Stroke.csv")
+
+# downcast column types for streaming, a "N/A" bmi reads as NaN
+STROKE_DTYPES = {
+    "id": np.int32, "gender": "category", "age": np.float32, "hypertension": np.uint8,
+    "heart_disease": np.uint8, "ever_married": "category", "work_type": "category",
+    "Residence_type": "category", "avg_glucose_level": np.float32, "bmi": np.float32,
+    "smoking_status": "category", "stroke": np.uint8,
+}
 
 
 class DataIngestion:
@@ -27,20 +38,31 @@ class DataIngestion:
     def initiate_data_ingestion(self):
         logging.info("Entered the diabetes data ingestion method or component")
         try:
-            # df=pd.read_csv('notebooks\datasets\Stroke.csv')
-            df=pd.read_csv('notebooks\\datasets\\Stroke.csv')
+            if streaming_ingestion_config.mode == "stream":
+                # chunk by chunk, the whole dataset is never in memory
+                stream_split_csv(
+                    self.ingestion_config.dataset_path,
+                    self.ingestion_config.train_data_path,
+                    self.ingestion_config.test_data_path,
+                    target="stroke",
+                    test_size=0.2,
+                    dtypes=STROKE_DTYPES,
+                    seed=42
+                )
+            else:
+                df=pd.read_csv(self.ingestion_config.dataset_path)
 
-            logging.info("Read the dataset as dataframe")
+                logging.info("Read the dataset as dataframe")
 
-            os.makedirs(os.path.dirname(self.ingestion_config.train_data_path),exist_ok=True)
+                os.makedirs(os.path.dirname(self.ingestion_config.train_data_path),exist_ok=True)
 
-            logging.info("Train test split initiated")
+                logging.info("Train test split initiated")
 
-            train_set,test_set=train_test_split(df,test_size=0.2,stratify=df['stroke'],random_state=42)
+                train_set,test_set=train_test_split(df,test_size=0.2,stratify=df['stroke'],random_state=42)
 
-            train_set.to_csv(self.ingestion_config.train_data_path,index=False,header=True)
+                train_set.to_csv(self.ingestion_config.train_data_path,index=False,header=True)
 
-            test_set.to_csv(self.ingestion_config.test_data_path,index=False,header=True)
+                test_set.to_csv(self.ingestion_config.test_data_path,index=False,header=True)
 
             logging.info("Inagestion of the data is completed")
 
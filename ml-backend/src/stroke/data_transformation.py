@@ -3,7 +3,8 @@ import sys
 from dataclasses import dataclass
 from src.exception import CustomException
 from src.logger import logging
-from src.utils import save_object
+from src.artifact_store import save_artifact, load_artifact
+from src.matrix_cache import matrix_cache, transformer_signature
 
 import pandas as pd
 import numpy as np
@@ -14,10 +15,33 @@ from sklearn.impute import SimpleImputer
 from sklearn.base import BaseEstimator, TransformerMixin
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..')))
+# hashed into the matrix cache key, GenderBasedImputer and fill_bmi_by_gender included
+TRANSFORMATION_CODE = [os.path.abspath(__file__)]
 
 @dataclass
 class DataTransformationConfig:
     preprocessor_obj_file_path = os.path.join("artifacts", "stroke_preprocessor.pkl")
+    compiled_preprocessor_file_path = os.path.join("artifacts", "stroke_preprocessor_compiled.npz")
+
+def fill_bmi_by_gender(bmi, gender, avg_bmi_male, avg_bmi_female, avg_bmi_overall):
+    '''
+    Fills the NaNs of the float64 array `bmi` in place with the average bmi of
+    the row's gender, or the overall average for other / unknown genders.
+    '''
+    missing = np.isnan(bmi)
+    if not missing.any():
+        return bmi
+    if gender is None:
+        bmi[missing] = avg_bmi_overall
+        return bmi
+    gender = gender[missing]
+    bmi[missing] = np.where(gender == 'Male', avg_bmi_male,
+                            np.where(gender == 'Female', avg_bmi_female, avg_bmi_overall))
+    return bmi
+
+def _float_or_nan(value):
+    # a numeric None is read as NaN by the DataFrame route
+    return np.nan if value is None else float(value)
 
 class GenderBasedImputer(BaseEstimator, TransformerMixin):
     def fit(self, X, y=None):
@@ -27,19 +51,192 @@ class GenderBasedImputer(BaseEstimator, TransformerMixin):
         return self
 
     def transform(self, X):
-        X['bmi'] = X.apply(lambda row: self._fill_bmi(row), axis=1)
-        return X[['bmi']].values  # Return only the bmi column as numpy array
-
-    def _fill_bmi(self, row):
-        gender = row.get('gender', None)
-        if pd.isnull(row['bmi']):
-            if gender == 'Male':
-                return self.avg_bmi_male
-            elif gender == 'Female':
-                return self.avg_bmi_female
-            else:
-                return self.avg_bmi_overall
-        return row['bmi']
+        # column-wise masked fill on a copy, the caller's frame is left untouched
+        bmi = X['bmi'].to_numpy(dtype=np.float64, na_value=np.nan, copy=True)
+        gender = X['gender'].to_numpy() if 'gender' in X else None
+        fill_bmi_by_gender(bmi, gender, self.avg_bmi_male, self.avg_bmi_female, self.avg_bmi_overall)
+        return bmi.reshape(-1, 1)  # Return only the bmi column as numpy array
+
+class CompiledPreprocessor:
+    '''
+    The fitted stroke ColumnTransformer reduced to plain arrays: imputation
+    values, scaler means and scales and category-to-column lookup tables.
+    transform() applies it to a DataFrame with a few vectorized operations and
+    encode() to a single record, both with the same float64 operations as the
+    ColumnTransformer so the output is identical.
+    '''
+    def __init__(self, arrays):
+        self.arrays = arrays
+        self.n_features = int(arrays['n_features'])
+
+        self.num_cols = arrays['num_cols'].tolist()
+        self.num_start = int(arrays['num_start'])
+        self.num_fill = arrays['num_fill']
+        self.num_mean = arrays['num_mean']
+        self.num_scale = arrays['num_scale']
+
+        self.bmi_index = int(arrays['bmi_index'])
+        self.bmi_fill = {'Male': float(arrays['bmi_fill_male']), 'Female': float(arrays['bmi_fill_female'])}
+        self.bmi_fill_overall = float(arrays['bmi_fill_overall'])
+        self.bmi_mean = float(arrays['bmi_mean'])
+        self.bmi_scale = float(arrays['bmi_scale'])
+
+        self.binary_cols = arrays['binary_cols'].tolist()
+        self.binary_start = int(arrays['binary_start'])
+
+        # categories of column j are categories[cat_offsets[j]:cat_offsets[j + 1]]
+        # and sit in the output columns starting at cat_start + cat_offsets[j]
+        self.cat_cols = arrays['cat_cols'].tolist()
+        self.cat_fill = arrays['cat_fill'].tolist()
+        self.cat_start = int(arrays['cat_start'])
+        offsets = arrays['cat_offsets'].tolist()
+        categories = arrays['categories'].tolist()
+        self.cat_categories = [pd.Index(categories[a:b]) for a, b in zip(offsets[:-1], offsets[1:])]
+        self.cat_group_start = [self.cat_start + a for a in offsets[:-1]]
+        self.cat_columns = [
+            {category: self.cat_start + a + i for i, category in enumerate(categories[a:b])}
+            for a, b in zip(offsets[:-1], offsets[1:])
+        ]
+
+        # plain python copies for the per record path
+        self._num_fill = self.num_fill.tolist()
+        self._num_mean = self.num_mean.tolist()
+        self._num_scale = self.num_scale.tolist()
+
+    @classmethod
+    def from_preprocessor(cls, preprocessor):
+        transformers = {name: (trans, list(cols)) for name, trans, cols in preprocessor.transformers_}
+        slices = preprocessor.output_indices_
+
+        num, num_cols = transformers['num']
+        num_scaler = cls._check_scaler(num.named_steps['scaler'])
+
+        bmi, _ = transformers['bmi']
+        bmi_imputer = bmi.named_steps['bmi_imputer']
+        bmi_scaler = cls._check_scaler(bmi.named_steps['scaler'])
+
+        binary, binary_cols = transformers['binary']
+        # fitted ColumnTransformers keep 'passthrough' as an identity FunctionTransformer
+        if binary != 'passthrough' and getattr(binary, 'func', True) is not None:
+            raise ValueError("Unexpected binary transformer")
+
+        cat, cat_cols = transformers['cat']
+        onehot = cat.named_steps['onehot']
+        if onehot.drop is not None or onehot.handle_unknown != 'ignore':
+            raise ValueError("Only one hot encoders without drop that ignore unknown categories are supported")
+        offsets = np.cumsum([0] + [len(categories) for categories in onehot.categories_])
+        if slices['cat'].start + offsets[-1] != slices['cat'].stop:
+            raise ValueError("Unexpected one hot encoder layout")
+
+        arrays = {
+            'n_features': np.array(max(s.stop for s in slices.values())),
+            'num_cols': np.array(num_cols, dtype=str),
+            'num_start': np.array(slices['num'].start),
+            'num_fill': np.asarray(num.named_steps['imputer'].statistics_, dtype=np.float64),
+            'num_mean': num_scaler.mean_,
+            'num_scale': num_scaler.scale_,
+            'bmi_index': np.array(slices['bmi'].start),
+            'bmi_fill_male': np.array(bmi_imputer.avg_bmi_male, dtype=np.float64),
+            'bmi_fill_female': np.array(bmi_imputer.avg_bmi_female, dtype=np.float64),
+            'bmi_fill_overall': np.array(bmi_imputer.avg_bmi_overall, dtype=np.float64),
+            'bmi_mean': np.array(bmi_scaler.mean_[0]),
+            'bmi_scale': np.array(bmi_scaler.scale_[0]),
+            'binary_cols': np.array(binary_cols, dtype=str),
+            'binary_start': np.array(slices['binary'].start),
+            'cat_cols': np.array(cat_cols, dtype=str),
+            'cat_fill': np.array(cat.named_steps['imputer'].statistics_, dtype=str),
+            'cat_start': np.array(slices['cat'].start),
+            'cat_offsets': offsets,
+            'categories': np.array([c for categories in onehot.categories_ for c in categories], dtype=str),
+        }
+        return cls(arrays)
+
+    @staticmethod
+    def _check_scaler(scaler):
+        if not (scaler.with_mean and scaler.with_std):
+            raise ValueError("Only standard scalers with mean and std are supported")
+        return scaler
+
+    def save(self, file_path):
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        tmp_path = f"{file_path}.tmp.npz"
+        np.savez(tmp_path, **self.arrays)
+        os.replace(tmp_path, file_path)
+
+    @classmethod
+    def load(cls, file_path):
+        with np.load(file_path, allow_pickle=False) as data:
+            return cls({key: data[key] for key in data.files})
+
+    def transform(self, X):
+        n = len(X)
+        out = np.zeros((n, self.n_features), dtype=np.float64)
+
+        num = X[self.num_cols].to_numpy(dtype=np.float64, copy=True)
+        missing = np.isnan(num)
+        if missing.any():
+            num[missing] = np.broadcast_to(self.num_fill, num.shape)[missing]
+        num -= self.num_mean
+        num /= self.num_scale
+        out[:, self.num_start:self.num_start + len(self.num_cols)] = num
+
+        bmi = X['bmi'].to_numpy(dtype=np.float64, na_value=np.nan, copy=True)
+        fill_bmi_by_gender(bmi, X['gender'].to_numpy(), self.bmi_fill['Male'], self.bmi_fill['Female'], self.bmi_fill_overall)
+        out[:, self.bmi_index] = (bmi - self.bmi_mean) / self.bmi_scale
+
+        out[:, self.binary_start:self.binary_start + len(self.binary_cols)] = X[self.binary_cols].to_numpy(dtype=np.float64)
+
+        rows = np.arange(n)
+        for j, col in enumerate(self.cat_cols):
+            values = X[col].to_numpy(dtype=object, copy=True)
+            # only NaN is missing for the imputer, None is an unknown category (all zeros)
+            values[values != values] = self.cat_fill[j]
+            codes = self.cat_categories[j].get_indexer(values)
+            known = codes >= 0
+            out[rows[known], self.cat_group_start[j] + codes[known]] = 1.0
+
+        return out
+
+    def encode(self, record):
+        '''
+        Single record (any object with the input columns as attributes) to a
+        float64 row, without pandas.
+        '''
+        row = np.zeros(self.n_features, dtype=np.float64)
+
+        for j, col in enumerate(self.num_cols):
+            value = _float_or_nan(getattr(record, col))
+            if value != value:
+                value = self._num_fill[j]
+            row[self.num_start + j] = (value - self._num_mean[j]) / self._num_scale[j]
+
+        bmi = _float_or_nan(record.bmi)
+        if bmi != bmi:
+            bmi = self.bmi_fill.get(record.gender, self.bmi_fill_overall)
+        row[self.bmi_index] = (bmi - self.bmi_mean) / self.bmi_scale
+
+        for j, col in enumerate(self.binary_cols):
+            row[self.binary_start + j] = float(getattr(record, col))
+
+        for j, col in enumerate(self.cat_cols):
+            value = getattr(record, col)
+            # like transform(): NaN is imputed, None is an unknown category
+            if value != value:
+                value = self.cat_fill[j]
+            column = self.cat_columns[j].get(value)
+            if column is not None:
+                row[column] = 1.0
+
+        return row
+
+    def verify(self, preprocessor, X):
+        '''
+        Raises if transform() differs from preprocessor.transform on X.
+        '''
+        expected = preprocessor.transform(X)
+        actual = self.transform(X)
+        if expected.shape != actual.shape or expected.tobytes() != actual.tobytes():
+            raise ValueError("Compiled stroke preprocessor differs from preprocessor.transform")
 
 class DataTransformation:
     def __init__(self):
@@ -87,13 +284,27 @@ class DataTransformation:
         except Exception as e:
             raise CustomException(e, sys)
         
-    def initiate_data_transformation(self, train_path, test_path):
+    def initiate_data_transformation(self, train_path, test_path, use_cache=True):
+        '''
+        Returns (X_train, y_train), (X_test, y_test), memory mapped from the
+        matrix cache when the CSVs and the preprocessor did not change.
+        '''
         try:
+            preprocessing_obj = self.get_data_transformer_object()
+
+            artifact_paths = [
+                self.data_transformation_config.preprocessor_obj_file_path,
+                self.data_transformation_config.compiled_preprocessor_file_path,
+            ]
+            cache_key = matrix_cache.key([train_path, test_path], transformer_signature(preprocessing_obj), TRANSFORMATION_CODE)
+            # use_cache=False transforms and refits anyway, the entry is replaced
+            cached = matrix_cache.load("stroke", cache_key, artifact_paths) if use_cache else None
+            if cached is not None:
+                return cached
+
             train_df = pd.read_csv(train_path)
             test_df = pd.read_csv(test_path)
 
-            preprocessing_obj = self.get_data_transformer_object()
-
             target_column_name = "stroke"
 
             input_feature_train_df = train_df.drop(target_column_name, axis=1)
@@ -105,24 +316,38 @@ class DataTransformation:
             input_feature_train_arr = preprocessing_obj.fit_transform(input_feature_train_df)
             input_feature_test_arr = preprocessing_obj.transform(input_feature_test_df)
 
-            train_arr = np.c_[
-                input_feature_train_arr, np.array(target_feature_train_df)
-            ]
-            test_arr = np.c_[
-                input_feature_test_arr, np.array(target_feature_test_df)
-            ]
+            # float64 labels like the combined arrays had, the models' classes stay the same
+            train = (input_feature_train_arr, target_feature_train_df.to_numpy(dtype=np.float64))
+            test = (input_feature_test_arr, target_feature_test_df.to_numpy(dtype=np.float64))
 
             # Ensure the directory for saving the object exists
             dir_path = os.path.dirname(self.data_transformation_config.preprocessor_obj_file_path)
             if not os.path.exists(dir_path):
                 os.makedirs(dir_path)
 
-            save_object(
+            save_artifact(
                 file_path=self.data_transformation_config.preprocessor_obj_file_path,
                 obj=preprocessing_obj
             )
 
-            return train_arr, test_arr
+            # Flat array version of the preprocessor for inference, checked
+            # against the fitted ColumnTransformer on the held-out split
+            compiled_preprocessor = CompiledPreprocessor.from_preprocessor(preprocessing_obj)
+            compiled_preprocessor.verify(preprocessing_obj, input_feature_test_df)
+            compiled_preprocessor.save(self.data_transformation_config.compiled_preprocessor_file_path)
+            logging.info("Compiled preprocessor saved successfully")
+
+            matrix_cache.save("stroke", cache_key, train, test, artifact_paths)
+
+            return train, test
         
         except Exception as e:
             raise CustomException(e, sys)
+
+if __name__ == "__main__":
+    # compile an already trained preprocessor, e.g. artifacts shipped before
+    # the compile step existed
+    config = DataTransformationConfig()
+    preprocessor = load_artifact(config.preprocessor_obj_file_path)
+    CompiledPreprocessor.from_preprocessor(preprocessor).save(config.compiled_preprocessor_file_path)
+    print(f"Saved {config.compiled_preprocessor_file_path}")
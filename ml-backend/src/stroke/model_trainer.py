@@ -3,7 +3,9 @@ import sys
 from dataclasses import dataclass
 from src.exception import CustomException
 from src.logger import logging
-from src.utils import save_object, evaluate_models
+from src.utils import evaluate_models, split_features_target
+from src.artifact_store import save_artifact
+from src.compact_models import compact_model_config, export_compact_model
 
 from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score, roc_auc_score
 from sklearn.ensemble import GradientBoostingClassifier
@@ -22,12 +24,8 @@ class ModelTrainer:
     def initiate_model_trainer(self, train_array, test_array):
         try:
             # Splitting features and target
-            X_train, y_train, X_test, y_test = (
-                train_array[:, :-1],
-                train_array[:, -1],
-                test_array[:, :-1],
-                test_array[:, -1]
-            )
+            X_train, y_train = split_features_target(train_array)
+            X_test, y_test = split_features_target(test_array)
           
             # Handling class imbalance with SMOTE
             smote = SMOTE(random_state=42)
@@ -59,12 +57,16 @@ class ModelTrainer:
             logging.info(f"Model Report: {model_report}")
 
             # Save the best model
-            save_object(
+            save_artifact(
                 file_path=self.model_trainer_config.trained_model_file_path,
                 obj=best_model
             )
             logging.info("Best model saved successfully.")
 
+            # float32 version for inference, only saved when it predicts the test split alike
+            if compact_model_config.enabled:
+                export_compact_model(best_model, self.model_trainer_config.trained_model_file_path, X_test, y_test)
+
             # Model evaluation on the test set
             predictions = best_model.predict(X_test)
             accuracy = accuracy_score(y_test, predictions)
@@ -4,34 +4,127 @@ import numpy as np
 import pandas as pd
 from src.exception import CustomException
 from src.logger import logging
-from src.utils import load_object
+from src.model_registry import model_registry
+from src.profiling import stage
+from dataclasses import dataclass
+from src.stroke.data_transformation import CompiledPreprocessor
+from src.compact_models import compact_path, serving_model
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..')))
 
+@dataclass
+class PredictPipelineConfig:
+    model_name: str = "stroke"
+    model_path: str = os.path.join("artifacts", "stroke_model.pkl")
+    preprocessor_path: str = os.path.join("artifacts", "stroke_preprocessor.pkl")
+    compiled_preprocessor_path: str = os.path.join("artifacts", "stroke_preprocessor_compiled.npz")
+    # use the compiled preprocessor instead of walking the ColumnTransformer
+    fast_inference: bool = os.environ.get("FAST_INFERENCE", "1") != "0"
+
 class PredictPipeline:
     def __init__(self):
-        pass
+        self.predict_pipeline_config = PredictPipelineConfig()
+        model_registry.register(
+            self.predict_pipeline_config.model_name,
+            {
+                "model": self.predict_pipeline_config.model_path,
+                "preprocessor": self.predict_pipeline_config.preprocessor_path,
+                "compiled_preprocessor": self.predict_pipeline_config.compiled_preprocessor_path,
+                "compact_model": compact_path(self.predict_pipeline_config.model_path),
+            },
+            loaders={"compiled_preprocessor": CompiledPreprocessor.load},
+            optional=["compiled_preprocessor", "compact_model"]
+        )
+
+    def _compiled(self, artifacts):
+        if not self.predict_pipeline_config.fast_inference:
+            return None
+        return artifacts.derived("compiled_preprocessor", build_compiled_preprocessor)
 
     def predict(self, features):
         try:
-            # Paths to model and preprocessor artifacts
-            model_path = os.path.join("artifacts", "stroke_model.pkl")
-            preprocessor_path = os.path.join("artifacts", "stroke_preprocessor.pkl")
-
-            # Load model and preprocessor
-            model = load_object(model_path)
-            preprocessor = load_object(preprocessor_path)
+            # Model and preprocessor are loaded once per worker and shared
+            artifacts = model_registry.get(self.predict_pipeline_config.model_name)
+            model = serving_model(artifacts, self.predict_pipeline_config.model_path)
+            preprocessor = self._compiled(artifacts) or artifacts["preprocessor"]
 
             # Preprocess the input data
-            data_scaled = preprocessor.transform(features)
+            with stage("transform"):
+                data_scaled = preprocessor.transform(features)
 
             # Predict using the model
-            preds = model.predict(data_scaled)
+            with stage("predict"):
+                preds = model.predict(data_scaled)
             return preds
 
         except Exception as e:
             raise CustomException(e, sys)
 
+    def predict_data(self, custom_data):
+        '''
+        Predicts a single CustomData record. With the compiled preprocessor the
+        record goes straight into a float64 row without pandas, otherwise it
+        takes the DataFrame route.
+        '''
+        try:
+            artifacts = model_registry.get(self.predict_pipeline_config.model_name)
+            compiled = self._compiled(artifacts)
+            if compiled is None:
+                with stage("frame"):
+                    features = custom_data.get_data_as_data_frame()
+                return self.predict(features)
+
+            with stage("transform"):
+                row = compiled.encode(custom_data)
+            with stage("predict"):
+                model = serving_model(artifacts, self.predict_pipeline_config.model_path)
+                return model.predict(row.reshape(1, -1))
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+def _probe_records(compiled):
+    '''
+    Records covering every category, missing values and an unknown category.
+    '''
+    base = {
+        "gender": "Male", "age": 67.0, "hypertension": 0.0, "heart_disease": 1.0,
+        "ever_married": "Yes", "work_type": "Private", "Residence_type": "Urban",
+        "avg_glucose_level": 228.69, "bmi": 36.6, "smoking_status": "formerly smoked",
+    }
+    records = [base]
+    for col, columns in zip(compiled.cat_cols, compiled.cat_columns):
+        for category in columns:
+            records.append({**base, col: category, "bmi": np.nan})
+        records.append({**base, col: np.nan})
+        records.append({**base, col: None})
+        records.append({**base, col: "unknown"})
+    records.append({**base, "age": np.nan, "avg_glucose_level": np.nan, "bmi": np.nan, "hypertension": 1.0})
+    return records
+
+def build_compiled_preprocessor(artifacts):
+    '''
+    Uses the compiled preprocessor saved by training, or compiles the pickled
+    one when it is missing. Either way it has to reproduce preprocessor.transform
+    bit for bit on probe records, one by one and as a batch, otherwise None
+    sends this artifact version down the DataFrame route.
+    '''
+    preprocessor = artifacts["preprocessor"]
+    try:
+        compiled = artifacts["compiled_preprocessor"] or CompiledPreprocessor.from_preprocessor(preprocessor)
+        records = _probe_records(compiled)
+        for record in records:
+            custom_data = CustomData(**record)
+            expected = preprocessor.transform(custom_data.get_data_as_data_frame())
+            actual = compiled.encode(custom_data).reshape(1, -1)
+            if expected.dtype != actual.dtype or expected.tobytes() != actual.tobytes():
+                raise ValueError(f"Compiled preprocessor output differs from preprocessor.transform for {record}")
+        compiled.verify(preprocessor, pd.DataFrame.from_records(records))
+        return compiled
+    except Exception as e:
+        logging.warning(f"Fast stroke inference disabled for version {artifacts.version}: {e}")
+        return None
+
 class CustomData:
     def __init__(
         self,
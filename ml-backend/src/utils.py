@@ -1,11 +1,23 @@
 import os
 import sys
-import numpy as np
-import pandas as pd
+import json
+import time
+import hashlib
 import dill
+from dataclasses import dataclass
 from src.exception import CustomException
-from sklearn.model_selection import GridSearchCV
-from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score, roc_auc_score
+from src.logger import logging
+
+@dataclass
+class EvaluateModelsConfig:
+    cv: int = int(os.environ.get("EVAL_CV_FOLDS", 3))
+    # -1 uses every core
+    n_jobs: int = int(os.environ.get("EVAL_N_JOBS", -1))
+    # fold scores and refitted models of earlier runs, EVAL_CACHE=0 fits everything again
+    cache_dir: str = os.environ.get("EVAL_CACHE_DIR", os.path.join(".cache", "evaluate_models"))
+    use_cache: bool = os.environ.get("EVAL_CACHE", "1") != "0"
+
+evaluate_models_config = EvaluateModelsConfig()
 
 def save_object(file_path,obj):
     try:
@@ -13,8 +25,12 @@ def save_object(file_path,obj):
 
         os.makedirs(dir_path,exist_ok=True)
 
-        with open(file_path,"wb") as file_obj:
+        # write next to the target and swap it in, so a running server that
+        # hot reloads artifacts never reads a half written file
+        tmp_path = f"{file_path}.tmp"
+        with open(tmp_path,"wb") as file_obj:
             dill.dump(obj,file_obj)
+        os.replace(tmp_path,file_path)
 
     except Exception as e:
         raise CustomException(e,sys)
@@ -26,31 +42,265 @@ def load_object(file_path):
     except Exception as e:
         raise CustomException(e,sys)
     
-def evaluate_models(X_train, y_train, X_test, y_test, models, hyperparameters):
+def split_features_target(data):
+    '''
+    (X, y) of a transformation output: (X, y) tuples are passed through,
+    arrays with the target as last column are split.
+    '''
+    if isinstance(data, tuple):
+        return data
+    return data[:, :-1], data[:, -1]
+
+def data_hash(*arrays):
+    '''
+    SHA-256 of the shapes, dtypes and bytes of the arrays, scipy sparse
+    matrices are hashed by their format and component arrays.
+    '''
+    import numpy as np
+    from scipy import sparse
+    digest = hashlib.sha256()
+    for array in arrays:
+        if sparse.issparse(array):
+            array = array.tocsr()
+            digest.update(f"csr{array.shape}".encode())
+            digest.update(data_hash(array.data, array.indices, array.indptr).encode())
+            continue
+        array = np.ascontiguousarray(array)
+        digest.update(f"{array.shape}{array.dtype.str}".encode())
+        digest.update(memoryview(array).cast("B"))
+    return digest.hexdigest()
+
+def _candidate_key(data_key, estimator, fold):
+    # the same training data, estimator class and parameters, fold and sklearn version
+    import sklearn
+    estimator_class = f"{type(estimator).__module__}.{type(estimator).__qualname__}"
+    params = sorted(estimator.get_params(deep=False).items())
+    identity = f"{sklearn.__version__}|{data_key}|{estimator_class}|{params!r}|{fold}"
+    return hashlib.sha256(identity.encode()).hexdigest()
+
+class _ResultCache:
+    '''
+    Fold results as JSON and refitted estimators as joblib files under
+    cache_dir, one file per key, written next to the target and swapped in.
+    '''
+    def __init__(self, cache_dir, enabled):
+        self.cache_dir = cache_dir
+        self.enabled = enabled
+
+    def _path(self, key, extension):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.{extension}")
+
+    def _write(self, path, write):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        write(tmp_path)
+        os.replace(tmp_path, path)
+
+    def get_result(self, key):
+        path = self._path(key, "json")
+        if not self.enabled or not os.path.exists(path):
+            return None
+        with open(path) as file_obj:
+            return json.load(file_obj)
+
+    def put_result(self, key, result):
+        if self.enabled:
+            def write(tmp_path):
+                with open(tmp_path, "w") as file_obj:
+                    json.dump(result, file_obj)
+            self._write(self._path(key, "json"), write)
+
+    def get_estimator(self, key):
+        import joblib
+        path = self._path(key, "joblib")
+        if not self.enabled or not os.path.exists(path):
+            return None
+        return joblib.load(path)
+
+    def put_estimator(self, key, estimator):
+        import joblib
+        if self.enabled:
+            self._write(self._path(key, "joblib"), lambda tmp_path: joblib.dump(estimator, tmp_path))
+
+def _fit_fold(estimator, X, y, train_index, test_index):
+    '''
+    Fits one candidate on one CV fold and scores it like GridSearchCV does
+    (estimator.score). A failing fit scores nan, as with error_score=nan.
+    '''
+    start = time.perf_counter()
     try:
-        report = {}
-        best_model = None
-        best_score = -1
+        estimator.fit(X[train_index], y[train_index])
+        fit_seconds = time.perf_counter() - start
+        score = float(estimator.score(X[test_index], y[test_index]))
+        return {"score": score, "fit_seconds": fit_seconds, "error": None}
+    except Exception as e:
+        return {"score": float("nan"), "fit_seconds": time.perf_counter() - start, "error": repr(e)}
+
+def _refit(estimator, X, y):
+    start = time.perf_counter()
+    estimator.fit(X, y)
+    return estimator, time.perf_counter() - start
+
+def classification_metrics(model, X_test, y_test):
+    '''
+    Accuracy, F1, precision, recall and ROC-AUC of a fitted classifier, the
+    multiclass ones weighted by class support. ROC-AUC is None when the model
+    has no scores or the test set misses classes.
+    '''
+    import numpy as np
+    from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score, roc_auc_score
+    y_pred = model.predict(X_test)
+    binary = len(getattr(model, "classes_", [])) == 2
+    average = "binary" if binary else "weighted"
+    metrics = {
+        "accuracy": float(accuracy_score(y_test, y_pred)),
+        "f1": float(f1_score(y_test, y_pred, average=average, zero_division=0)),
+        "precision": float(precision_score(y_test, y_pred, average=average, zero_division=0)),
+        "recall": float(recall_score(y_test, y_pred, average=average, zero_division=0)),
+        "roc_auc": None,
+    }
+    try:
+        if hasattr(model, "predict_proba"):
+            scores = model.predict_proba(X_test)
+            scores = scores[:, 1] if binary else scores
+        else:
+            scores = model.decision_function(X_test)
+        if binary:
+            metrics["roc_auc"] = float(roc_auc_score(y_test, scores))
+        else:
+            metrics["roc_auc"] = float(roc_auc_score(
+                y_test, scores, multi_class="ovr", average="weighted", labels=model.classes_
+            ))
+    except (AttributeError, ValueError) as e:
+        logging.info(f"ROC-AUC not available for {type(model).__name__}: {e}")
+    if metrics["roc_auc"] is not None and np.isnan(metrics["roc_auc"]):
+        metrics["roc_auc"] = None
+    return metrics
+
+def evaluate_models(X_train, y_train, X_test, y_test, models, hyperparameters, cv=None, n_jobs=None, cache_dir=None):
+    '''
+    Grid search over every model and parameter combination with cross
+    validation, like one GridSearchCV per model, but every (model, candidate,
+    fold) fit runs in one joblib pool across all cores and fold results are
+    cached on disk, keyed by the training data, the estimator with its
+    parameters and the fold. Re-runs and widened grids only fit what is new.
+
+    The best candidate of each model (mean CV accuracy) is refitted on the
+    whole training set and evaluated on the test set. Returns
+    (report, best_model): report maps each model name to its test metrics
+    (accuracy, f1, precision, recall, roc_auc), best parameters, CV score,
+    refit time and per candidate CV score and fit time; best_model is the
+    refitted model with the best test accuracy.
+    '''
+    # imported here so the serving path (save/load_object) does not pull in sklearn
+    import numpy as np
+    from joblib import Parallel, delayed
+    from scipy import sparse
+    from sklearn.base import clone, is_classifier
+    from sklearn.model_selection import ParameterGrid, check_cv
+    try:
+        config = evaluate_models_config
+        cv = cv or config.cv
+        n_jobs = n_jobs or config.n_jobs
+        cache = _ResultCache(cache_dir or config.cache_dir, config.use_cache)
+
+        if not sparse.issparse(X_train):
+            X_train = np.asarray(X_train)
+        y_train = np.asarray(y_train)
+        data_key = data_hash(X_train, y_train)
 
-        for i in range(len(list(models))):
-            model = list(models.values())[i]
-            params = list(hyperparameters.values())[i]
+        # every (model, candidate, fold) fit, fitted only when not cached
+        candidates = {}
+        fits = []
+        for model_name, model in models.items():
+            splitter = check_cv(cv, y_train, classifier=is_classifier(model))
+            folds = list(splitter.split(X_train, y_train))
+            candidates[model_name] = []
+            for params in ParameterGrid(hyperparameters.get(model_name, {})):
+                estimator = clone(model).set_params(**params)
+                candidate = {"params": params, "estimator": estimator, "folds": [], "cached": True}
+                for fold, (train_index, test_index) in enumerate(folds):
+                    key = _candidate_key(data_key, estimator, f"{type(splitter).__name__}:{len(folds)}:{fold}")
+                    result = cache.get_result(key)
+                    candidate["folds"].append(result)
+                    if result is None:
+                        candidate["cached"] = False
+                        fits.append((candidate, fold, key, train_index, test_index))
+                candidates[model_name].append(candidate)
 
-            gs = GridSearchCV(estimator=model, param_grid=params, cv=3)
-            gs.fit(X_train, y_train)
+        n_folds = sum(len(candidate["folds"]) for model_candidates in candidates.values() for candidate in model_candidates)
+        logging.info(f"Evaluating {len(models)} models: {len(fits)} of {n_folds} fold fits to run, n_jobs={n_jobs}")
+        start = time.perf_counter()
+        results = Parallel(n_jobs=n_jobs)(
+            delayed(_fit_fold)(candidate["estimator"], X_train, y_train, train_index, test_index)
+            for candidate, _, _, train_index, test_index in fits
+        )
+        for (candidate, fold, key, _, _), result in zip(fits, results):
+            candidate["folds"][fold] = result
+            if result["error"] is None:
+                cache.put_result(key, result)
+            else:
+                logging.warning(f"{candidate['estimator']} failed on fold {fold}: {result['error']}")
+        logging.info(f"Fold fits done in {time.perf_counter() - start:.2f}s")
 
-            y_test_pred = gs.predict(X_test)
-            accuracy_test = accuracy_score(y_test, y_test_pred)
+        # best candidate per model, the first of equal scores like GridSearchCV
+        best = {}
+        for model_name, model_candidates in candidates.items():
+            for candidate in model_candidates:
+                scores = [result["score"] for result in candidate["folds"]]
+                candidate["cv_score"] = float("nan") if np.isnan(scores).any() else float(np.mean(scores))
+                candidate["fit_seconds"] = float(np.mean([result["fit_seconds"] for result in candidate["folds"]]))
+                logging.info(
+                    f"{model_name} {candidate['params']}: cv accuracy {candidate['cv_score']:.4f}, "
+                    f"fit {candidate['fit_seconds']:.3f}s per fold{' (cached)' if candidate['cached'] else ''}"
+                )
+            scored = [candidate for candidate in model_candidates if not np.isnan(candidate["cv_score"])]
+            if not scored:
+                raise ValueError(f"Every candidate of {model_name} failed to fit")
+            best[model_name] = max(scored, key=lambda candidate: candidate["cv_score"])
 
-            model_name = list(models.keys())[i]
-            report[model_name] = accuracy_test
+        # refit the best candidates on the whole training set
+        refit_keys = {
+            model_name: _candidate_key(data_key, candidate["estimator"], "refit")
+            for model_name, candidate in best.items()
+        }
+        refitted = {}
+        to_refit = []
+        for model_name, key in refit_keys.items():
+            estimator = cache.get_estimator(key)
+            if estimator is None:
+                to_refit.append(model_name)
+            else:
+                refitted[model_name] = (estimator, None)
+        results = Parallel(n_jobs=n_jobs)(
+            delayed(_refit)(clone(best[model_name]["estimator"]), X_train, y_train) for model_name in to_refit
+        )
+        for model_name, (estimator, fit_seconds) in zip(to_refit, results):
+            cache.put_estimator(refit_keys[model_name], estimator)
+            refitted[model_name] = (estimator, fit_seconds)
+
+        report = {}
+        best_model = None
+        best_score = -1
+        for model_name in models:
+            estimator, fit_seconds = refitted[model_name]
+            report[model_name] = {
+                **classification_metrics(estimator, X_test, y_test),
+                "best_params": best[model_name]["params"],
+                "cv_score": best[model_name]["cv_score"],
+                # None when the refitted model came from the cache
+                "refit_seconds": fit_seconds,
+                "candidates": [
+                    {key: candidate[key] for key in ("params", "cv_score", "fit_seconds", "cached")}
+                    for candidate in candidates[model_name]
+                ],
+            }
 
             # Track the best model
-            if accuracy_test > best_score:
-                best_score = accuracy_test
-                best_model = gs.best_estimator_
+            if report[model_name]["accuracy"] > best_score:
+                best_score = report[model_name]["accuracy"]
+                best_model = estimator
 
         return report, best_model
     except Exception as e:
         raise CustomException(e, sys)
-
@@ -0,0 +1,45 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+ML_BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ML_BACKEND)
+
+@pytest.fixture(autouse=True)
+def ml_backend_cwd(monkeypatch):
+    # artifact paths are relative to ml-backend/
+    monkeypatch.chdir(ML_BACKEND)
+
+@pytest.fixture
+def stroke_records():
+    '''
+    Seeded random stroke records drawn from the fitted preprocessor's
+    categories, with missing bmi / numeric values and unseen categories.
+    '''
+    from src.artifact_store import load_artifact
+    from src.stroke.data_transformation import CompiledPreprocessor
+    compiled = CompiledPreprocessor.from_preprocessor(load_artifact(os.path.join("artifacts", "stroke_preprocessor.pkl")))
+
+    def make(n, seed=0, missing_rate=0.15, unseen_rate=0.05):
+        rng = np.random.default_rng(seed)
+        records = []
+        for _ in range(n):
+            record = {
+                "age": round(float(rng.uniform(0.08, 82.0)), 2),
+                "avg_glucose_level": round(float(rng.uniform(55.0, 272.0)), 2),
+                "bmi": round(float(rng.uniform(10.0, 98.0)), 1),
+                "hypertension": float(rng.integers(0, 2)),
+                "heart_disease": float(rng.integers(0, 2)),
+            }
+            for col, categories in zip(compiled.cat_cols, compiled.cat_categories):
+                record[col] = categories[rng.integers(len(categories))]
+                if rng.random() < unseen_rate:
+                    record[col] = "unseen category"
+            for col in ("bmi", "age", "avg_glucose_level"):
+                if rng.random() < missing_rate:
+                    record[col] = np.nan
+            records.append(record)
+        return records
+
+    return make
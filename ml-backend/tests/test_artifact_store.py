@@ -0,0 +1,35 @@
+'''
+Readers of an artifact that is saved again while they load it.
+'''
+import os
+import numpy as np
+from sklearn.preprocessing import StandardScaler
+from src import artifact_store
+from src.artifact_store import save_artifact, load_artifact, read_manifest, artifact_dir
+
+
+def _scaler(n):
+    return StandardScaler().fit(np.arange(float(n)).reshape(-1, 1))
+
+def test_save_keeps_the_replaced_blob(tmp_path):
+    path = str(tmp_path / "model.pkl")
+    save_artifact(path, _scaler(10))
+    first = read_manifest(path)["arrays"]
+    save_artifact(path, _scaler(20))
+    # a reader that parsed the first manifest can still open its blob
+    assert os.path.exists(os.path.join(artifact_dir(path), first))
+    save_artifact(path, _scaler(30))
+    assert not os.path.exists(os.path.join(artifact_dir(path), first))
+
+def test_load_rereads_a_manifest_whose_blob_is_gone(tmp_path, monkeypatch):
+    path = str(tmp_path / "model.pkl")
+    save_artifact(path, _scaler(10))
+    stale = read_manifest(path)
+    save_artifact(path, _scaler(20))
+    save_artifact(path, _scaler(30))
+
+    manifests = [stale]
+    monkeypatch.setattr(
+        artifact_store, "read_manifest", lambda file_path: manifests.pop() if manifests else read_manifest(file_path)
+    )
+    assert load_artifact(path).mean_[0] == 14.5
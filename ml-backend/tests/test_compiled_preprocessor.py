@@ -0,0 +1,65 @@
+'''
+CompiledPreprocessor against the fitted stroke ColumnTransformer on held-out
+data: artifacts_dataset/stroke_test.csv when the ingestion step wrote it,
+seeded synthetic records otherwise.
+'''
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from src.artifact_store import load_artifact
+from src.stroke.data_transformation import CompiledPreprocessor, DataTransformation
+from src.stroke.predict_pipeline import CustomData
+
+TEST_SPLIT = os.path.join("artifacts_dataset", "stroke_test.csv")
+CAT_COLS = ["gender", "ever_married", "work_type", "Residence_type", "smoking_status"]
+
+
+def _frame(records, seed):
+    frame = pd.DataFrame.from_records(records)
+    frame.insert(0, "id", np.arange(len(frame)))
+    frame["stroke"] = np.random.default_rng(seed).integers(0, 2, len(frame))
+    return frame
+
+@pytest.fixture
+def held_out(stroke_records):
+    if os.path.exists(TEST_SPLIT):
+        frame = pd.read_csv(TEST_SPLIT)
+    else:
+        frame = _frame(stroke_records(2000, seed=1), seed=1)
+    return frame.drop(columns=["stroke"])
+
+@pytest.fixture(params=["loaded", "fitted"])
+def preprocessor(request, stroke_records):
+    if request.param == "loaded":
+        return load_artifact(os.path.join("artifacts", "stroke_preprocessor.pkl"))
+    train = _frame(stroke_records(3000, seed=2), seed=2).drop(columns=["stroke"])
+    return DataTransformation().get_data_transformer_object().fit(train)
+
+
+def test_transform_matches_preprocessor_on_held_out_data(preprocessor, held_out):
+    compiled = CompiledPreprocessor.from_preprocessor(preprocessor)
+    expected = preprocessor.transform(held_out)
+    actual = compiled.transform(held_out)
+    assert actual.dtype == expected.dtype
+    assert np.array_equal(actual, expected)
+
+def test_encode_matches_preprocessor_per_record(preprocessor, held_out):
+    compiled = CompiledPreprocessor.from_preprocessor(preprocessor)
+    for record in held_out.drop(columns=["id"]).head(300).to_dict("records"):
+        custom_data = CustomData(**record)
+        expected = preprocessor.transform(custom_data.get_data_as_data_frame())
+        assert np.array_equal(compiled.encode(custom_data).reshape(1, -1), expected), record
+
+@pytest.mark.parametrize("missing", [None, np.nan], ids=["None", "NaN"])
+@pytest.mark.parametrize("column", CAT_COLS + ["bmi", "age", "avg_glucose_level"])
+def test_missing_values_match_preprocessor(preprocessor, stroke_records, column, missing):
+    # the imputers only treat NaN as missing, a None category is unknown (all zeros)
+    compiled = CompiledPreprocessor.from_preprocessor(preprocessor)
+    records = [{**record, column: missing} for record in stroke_records(20, seed=3, missing_rate=0.0)]
+    for record in records:
+        custom_data = CustomData(**record)
+        expected = preprocessor.transform(custom_data.get_data_as_data_frame())
+        assert np.array_equal(compiled.encode(custom_data).reshape(1, -1), expected), record
+    frame = pd.DataFrame.from_records(records)
+    assert np.array_equal(compiled.transform(frame), preprocessor.transform(frame))
@@ -0,0 +1,63 @@
+'''
+The pandas-free single record route of the stroke and diabetes pipelines
+against the DataFrame route, bit for bit.
+'''
+import numpy as np
+import pytest
+from src.model_registry import model_registry
+
+
+@pytest.fixture
+def stroke_pipeline():
+    from src.stroke.predict_pipeline import PredictPipeline, build_compiled_preprocessor
+    pipeline = PredictPipeline()
+    artifacts = model_registry.get(pipeline.predict_pipeline_config.model_name)
+    # a failed load time check would silently test the DataFrame route against itself
+    assert artifacts.derived("compiled_preprocessor", build_compiled_preprocessor) is not None
+    return pipeline, artifacts
+
+@pytest.fixture
+def diabetes_pipeline():
+    from src.diabetes.predict_pipeline import PredictPipeline, build_row_scaler
+    pipeline = PredictPipeline()
+    artifacts = model_registry.get(pipeline.predict_pipeline_config.model_name)
+    assert artifacts.derived("row_scaler", build_row_scaler) is not None
+    return pipeline, artifacts
+
+
+def test_stroke_fast_path_matches_dataframe_route(stroke_pipeline, stroke_records):
+    from src.stroke.predict_pipeline import CustomData
+    pipeline, artifacts = stroke_pipeline
+    model, preprocessor = artifacts["model"], artifacts["preprocessor"]
+    compiled = artifacts.derived("compiled_preprocessor", None)
+
+    for record in stroke_records(300):
+        custom_data = CustomData(**record)
+        expected_row = preprocessor.transform(custom_data.get_data_as_data_frame())
+        row = compiled.encode(custom_data).reshape(1, -1)
+
+        assert row.dtype == expected_row.dtype
+        assert np.array_equal(row, expected_row), record
+        assert np.array_equal(model.predict_proba(row), model.predict_proba(expected_row)), record
+        assert np.array_equal(pipeline.predict_data(custom_data), model.predict(expected_row)), record
+
+
+def test_diabetes_fast_path_matches_dataframe_route(diabetes_pipeline):
+    from src.diabetes.predict_pipeline import CustomData, FEATURE_COLUMNS
+    pipeline, artifacts = diabetes_pipeline
+    model, preprocessor = artifacts["model"], artifacts["preprocessor"]
+    scaler = artifacts.derived("row_scaler", None)
+    rng = np.random.default_rng(0)
+
+    for _ in range(300):
+        record = {column: float(rng.uniform(0, 200)) for column in FEATURE_COLUMNS}
+        record["DiabetesPedigreeFunction"] = round(float(rng.uniform(0.05, 2.5)), 3)
+        record["Pregnancies"] = int(rng.integers(0, 18))
+        custom_data = CustomData(**record)
+        expected_row = preprocessor.transform(custom_data.get_data_as_data_frame())
+        row = scaler.transform(custom_data.get_data_as_array())
+
+        assert row.dtype == expected_row.dtype
+        assert np.array_equal(row, expected_row), record
+        assert np.array_equal(model.predict_proba(row), model.predict_proba(expected_row)), record
+        assert np.array_equal(pipeline.predict_data(custom_data), model.predict(expected_row)), record
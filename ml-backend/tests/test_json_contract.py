@@ -0,0 +1,43 @@
+'''
+The Flask and the ASGI app answer bodies that are not JSON the same way.
+'''
+import json
+import asyncio
+import pytest
+import asgi
+from app import app
+
+ROUTES = [
+    "/predict-stroke",
+    "/predict-diabetes",
+    "/predict-disease-using-symptoms",
+    "/predict-stroke/batch",
+    "/predict-diabetes/batch",
+    "/predict-disease-using-symptoms/batch",
+]
+BODIES = [(b"{not json", "application/json"), (b"", "application/json"), (b'{"a": 1}', "text/plain")]
+
+
+def _asgi_post(path, body, content_type):
+    response = {"body": b""}
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        else:
+            response["body"] += message.get("body", b"")
+
+    scope = {"type": "http", "method": "POST", "path": path, "headers": [(b"content-type", content_type.encode())]}
+    asyncio.run(asgi.app(scope, receive, send))
+    return response["status"], json.loads(response["body"])
+
+@pytest.mark.parametrize("body,content_type", BODIES)
+@pytest.mark.parametrize("path", ROUTES)
+def test_flask_matches_asgi(path, body, content_type):
+    flask_response = app.test_client().post(path, data=body, content_type=content_type)
+    status, payload = _asgi_post(path, body, content_type)
+    assert flask_response.status_code == status == 400
+    assert flask_response.get_json() == payload
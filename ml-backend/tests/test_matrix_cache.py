@@ -0,0 +1,31 @@
+'''
+Entries of the matrix cache are found again only while nothing that built
+them changed.
+'''
+import numpy as np
+from src.matrix_cache import MatrixCache
+
+
+def _cache(tmp_path, monkeypatch):
+    cache = MatrixCache()
+    monkeypatch.setattr(cache.matrix_cache_config, "cache_dir", str(tmp_path / "matrices"))
+    monkeypatch.setattr(cache.matrix_cache_config, "enabled", True)
+    return cache
+
+def test_changed_transformation_code_misses(tmp_path, monkeypatch):
+    cache = _cache(tmp_path, monkeypatch)
+    data = tmp_path / "train.csv"
+    data.write_text("a,b\n1,2\n")
+    code = tmp_path / "data_transformation.py"
+    code.write_text("def transform(x):\n    return x\n")
+
+    key = cache.key([str(data)], "scaler", [str(code)])
+    X, y = np.arange(6.0).reshape(3, 2), np.zeros(3)
+    cache.save("pipeline", key, (X, y), (X, y))
+    (X_train, _), _ = cache.load("pipeline", key)
+    assert np.array_equal(X_train, X)
+
+    code.write_text("def transform(x):\n    return x * 100\n")
+    changed = cache.key([str(data)], "scaler", [str(code)])
+    assert changed != key
+    assert cache.load("pipeline", changed) is None
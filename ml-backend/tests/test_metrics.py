@@ -0,0 +1,32 @@
+'''
+Counts of finished threads stay in the scrape without their shards.
+'''
+import threading
+from src.metrics import MetricsRegistry
+
+
+def test_finished_threads_are_folded():
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests.", ["endpoint"])
+    latency = registry.histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0))
+
+    def handle():
+        requests.inc("/predict")
+        latency.observe(0.5)
+
+    # a thread per request, like the werkzeug dev server
+    for _ in range(200):
+        thread = threading.Thread(target=handle)
+        thread.start()
+        thread.join()
+
+    text = registry.render()
+    assert len(registry._shards) <= 1
+    assert 'requests_total{endpoint="/predict"} 200' in text
+    assert 'latency_seconds_bucket{le="1.0"} 200' in text
+    assert "latency_seconds_count 200" in text
+
+    # the retired counts are added to, not replaced
+    handle()
+    text = registry.render()
+    assert 'requests_total{endpoint="/predict"} 201' in text
@@ -0,0 +1,24 @@
+'''
+An idle dispatcher flushes the batches, callers predict inline only as a
+fallback.
+'''
+import threading
+from src.micro_batching import MicroBatcher
+
+
+def test_idle_dispatcher_flushes_before_the_callers_deadline():
+    batcher = MicroBatcher("double", lambda items: [item * 2 for item in items], max_batch_size=64, max_wait_ms=10)
+
+    def user(offset):
+        for item in range(offset, offset + 50):
+            assert batcher.submit(item) == item * 2
+
+    users = [threading.Thread(target=user, args=(offset,)) for offset in range(0, 200, 50)]
+    for thread in users:
+        thread.start()
+    for thread in users:
+        thread.join()
+
+    stats = batcher.stats()
+    assert stats["batched_requests"] == 200
+    assert stats["inline"] <= stats["batches"] // 10